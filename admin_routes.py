@@ -4,8 +4,11 @@ from extensions import db
 from models import Package, User, Order, Visit, Product, Settings, Specialization, Video, ExhibitorBanner, ExhibitorAnalytics, Partner
 from werkzeug.utils import secure_filename
 from auth import admin_required
+from database import read_only
+from analytics_rollup import visit_totals, visitor_counts, visits_by_day, visits_by_hour_of_day
 import json
-from sqlalchemy import func, or_
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import contains_eager, joinedload
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash
 import os
@@ -279,39 +282,74 @@ def dashboard():
                          total_products=total_products)
 
 # Admin Exhibitor Management Routes
+EXHIBITORS_PER_PAGE = 20
+EXHIBITOR_SORT_KEYS = ('created_at', 'company_name', 'product_count', 'total_visits', 'unique_visitors')
+
+def exhibitor_stats_columns():
+    """
+    Per-exhibitor aggregates as correlated scalar subqueries.
+    Each one is a covering index lookup evaluated only for the exhibitor rows
+    actually returned, so the cost follows the page size, not the table size.
+    """
+    product_count = select(func.count(Product.id))\
+        .where(Product.exhibitor_id == User.id)\
+        .scalar_subquery().label('product_count')
+
+    total_visits = select(func.count(ExhibitorAnalytics.id))\
+        .where(ExhibitorAnalytics.exhibitor_id == User.id)\
+        .where(ExhibitorAnalytics.action_type == 'visit')\
+        .scalar_subquery().label('total_visits')
+
+    unique_visitors = select(func.count(func.distinct(ExhibitorAnalytics.user_id)))\
+        .where(ExhibitorAnalytics.exhibitor_id == User.id)\
+        .where(ExhibitorAnalytics.action_type == 'visit')\
+        .scalar_subquery().label('unique_visitors')
+
+    return product_count, total_visits, unique_visitors
+
 @admin.route('/exhibitors')
 @login_required
 @admin_required
 def exhibitors():
     """Admin exhibitor management page"""
-    # Get exhibitors - all from User table with role='exhibitor'
-    exhibitors_list = db.session.query(User)\
+    page = request.args.get('page', 1, type=int)
+    per_page = min(max(request.args.get('per_page', EXHIBITORS_PER_PAGE, type=int), 1), 100)
+    sort = request.args.get('sort', 'created_at')
+    if sort not in EXHIBITOR_SORT_KEYS:
+        sort = 'created_at'
+    direction = 'asc' if request.args.get('direction') == 'asc' else 'desc'
+
+    product_count, total_visits, unique_visitors = exhibitor_stats_columns()
+    sort_column = {
+        'created_at': User.created_at,
+        'company_name': User.company_name,
+        'product_count': product_count,
+        'total_visits': total_visits,
+        'unique_visitors': unique_visitors,
+    }[sort]
+    sort_column = sort_column.asc() if direction == 'asc' else sort_column.desc()
+
+    # Get exhibitors with their package, specialization and analytics in one query per page
+    pagination = db.session.query(User, product_count, total_visits, unique_visitors)\
         .outerjoin(Package)\
+        .options(contains_eager(User.package), joinedload(User.specialization))\
         .filter(User.role == 'exhibitor')\
-        .order_by(User.created_at.desc())\
-        .all()
-    
-    # Get analytics data for each exhibitor
-    for exhibitor in exhibitors_list:
-        # Count products
-        exhibitor.product_count = Product.query.filter_by(exhibitor_id=exhibitor.id).count()
-        
-        # Get package name
+        .order_by(sort_column, User.id.desc())\
+        .paginate(page=page, per_page=per_page, error_out=False)
+
+    exhibitors_list = []
+    for exhibitor, products, visits, visitors in pagination.items:
+        exhibitor.product_count = products
+        exhibitor.total_visits = visits
+        exhibitor.unique_visitors = visitors
         exhibitor.package_name = exhibitor.package.name if exhibitor.package else "لا يوجد باقة"
-        
-        # Get total visits (analytics)
-        exhibitor.total_visits = ExhibitorAnalytics.query\
-            .filter_by(exhibitor_id=exhibitor.id)\
-            .filter_by(action_type='visit')\
-            .count()
-
-        # Get unique visitors count
-        exhibitor.unique_visitors = db.session.query(ExhibitorAnalytics.user_id)\
-            .filter_by(exhibitor_id=exhibitor.id)\
-            .filter_by(action_type='visit')\
-            .distinct().count()
+        exhibitors_list.append(exhibitor)
 
-    return render_template('admin/exhibitors.html', exhibitors=exhibitors_list)
+    return render_template('admin/exhibitors.html',
+                         exhibitors=exhibitors_list,
+                         pagination=pagination,
+                         sort=sort,
+                         direction=direction)
 
 @admin.route('/exhibitors/add', methods=['GET', 'POST'])
 @login_required
@@ -576,15 +614,42 @@ def delete_user(user_id):
         db.session.rollback()
         flash('Error deleting user. Please try again.', 'danger')
     
-    return redirect(url_for('admin.users'))# Sales Report Routes
+    return redirect(url_for('admin.users'))
+
+# Report helpers - one GROUP BY query per chart, empty buckets are filled in Python
+def report_days(default=30, maximum=365):
+    """Read the timeRange filter (in days) shared by the report pages"""
+    time_range = request.args.get('timeRange', default, type=int)
+    return min(max(time_range, 1), maximum)
+
+def count_by_day(timestamp_column, id_column, since):
+    """Return {'YYYY-MM-DD': count} for rows newer than since"""
+    day = func.date(timestamp_column)
+    rows = db.session.query(day, func.count(id_column))\
+        .filter(timestamp_column >= since)\
+        .group_by(day)\
+        .all()
+    return {str(bucket): count for bucket, count in rows}
+
+def fill_days(counts, first_day, days):
+    """Return (dates, values) for every day from first_day, with 0 for missing days"""
+    dates = [(first_day + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+    return dates, [counts.get(date, 0) for date in dates]
+
+# Sales Report Routes
 @admin.route('/sales-report')
 @login_required
 @admin_required
+@read_only
 def sales_report():
     """Admin sales report page"""
+    time_range = report_days()
+
     # Get basic stats
-    total_sales = Order.query.count()
-    revenue = db.session.query(func.sum(Order.amount)).scalar() or 0
+    total_sales, revenue = db.session.query(
+        func.count(Order.id),
+        func.coalesce(func.sum(Order.amount), 0)
+    ).one()
     avg_sale = revenue / total_sales if total_sales > 0 else 0
     
     # Calculate conversion rate
@@ -594,25 +659,19 @@ def sales_report():
     # Get recent sales
     sales = Order.query.order_by(Order.created_at.desc()).limit(10).all()
     
-    # Prepare chart data
-    dates = []
-    sales_data = []
-    package_distribution = []
-    
-    # Last 30 days data
-    for i in range(30, -1, -1):
-        date = datetime.now() - timedelta(days=i)
-        dates.append(date.strftime('%Y-%m-%d'))
-        daily_sales = Order.query.filter(
-            func.date(Order.created_at) == date.date()
-        ).count()
-        sales_data.append(daily_sales)
+    # Daily sales for the selected range (today included)
+    first_day = datetime.now().date() - timedelta(days=time_range)
+    daily_sales = count_by_day(Order.created_at, Order.id, datetime.combine(first_day, datetime.min.time()))
+    dates, sales_data = fill_days(daily_sales, first_day, time_range + 1)
     
     # Package distribution
+    orders_per_package = dict(
+        db.session.query(Order.package_id, func.count(Order.id))
+        .group_by(Order.package_id)
+        .all()
+    )
     packages = Package.query.all()
-    for package in packages:
-        count = Order.query.filter_by(package_id=package.id).count()
-        package_distribution.append(count)
+    package_distribution = [orders_per_package.get(package.id, 0) for package in packages]
     
     return render_template('admin/sales_report.html',
                          total_sales=total_sales,
@@ -637,23 +696,25 @@ def get_sales_data():
     start_date = end_date - timedelta(days=time_range)
     
     # Build query
-    query = Order.query.filter(Order.created_at.between(start_date, end_date))
+    day = func.date(Order.created_at)
+    query = db.session.query(day, func.count(Order.id))\
+        .filter(Order.created_at.between(start_date, end_date))
     
     if package_type != 'all':
         query = query.join(Package).filter(Package.name == package_type)
     
     # Get sales trend
-    sales_trend = {}
-    for order in query.all():
-        date = order.created_at.strftime('%Y-%m-%d')
-        sales_trend[date] = sales_trend.get(date, 0) + 1
+    sales_trend = {str(date): count for date, count in query.group_by(day).all()}
     
     # Get package distribution
     package_dist = {}
     if package_type == 'all':
-        for package in Package.query.all():
-            count = Order.query.filter_by(package_id=package.id).count()
-            package_dist[package.name] = count
+        package_dist = dict(
+            db.session.query(Package.name, func.count(Order.id))
+            .join(Order, Order.package_id == Package.id)
+            .group_by(Package.id, Package.name)
+            .all()
+        )
     
     return jsonify({
         'salesTrend': sales_trend,
@@ -664,54 +725,36 @@ def get_sales_data():
 @admin.route('/visit-statistics')
 @login_required
 @admin_required
+@read_only
 def visit_statistics():
     """Admin visit statistics page"""
-    # Calculate basic stats
-    total_visits = Visit.query.count()
-    unique_visitors = db.session.query(func.count(func.distinct(Visit.visitor_id))).scalar()
-    
-    # Calculate average duration
-    avg_duration = db.session.query(func.avg(Visit.duration)).scalar() or 0
-    
-    # Calculate bounce rate
-    bounced_visits = Visit.query.filter(Visit.duration < 30).count()  # Less than 30 seconds
+    time_range = report_days()
+
+    # Calculate basic stats from the rollups - totals, unique visitors, average duration and bounces (< 30 seconds)
+    total_visits, duration_sum, bounced_visits = visit_totals()
+    unique_visitors, repeat_visitors = visitor_counts()
+    avg_duration = duration_sum / total_visits if total_visits > 0 else 0
     bounce_rate = (bounced_visits / total_visits * 100) if total_visits > 0 else 0
     
-    # Prepare visitor trend data
-    dates = []
-    visitor_data = []
-    visitor_type_distribution = []
-    
-    # Last 30 days data
-    for i in range(30, -1, -1):
-        date = datetime.now() - timedelta(days=i)
-        dates.append(date.strftime('%Y-%m-%d'))
-        daily_visits = Visit.query.filter(
-            func.date(Visit.timestamp) == date.date()
-        ).count()
-        visitor_data.append(daily_visits)
+    # Visitor trend for the selected range (today included)
+    first_day = datetime.now().date() - timedelta(days=time_range)
+    daily_visits = visits_by_day(datetime.combine(first_day, datetime.min.time()))
+    dates, visitor_data = fill_days(daily_visits, first_day, time_range + 1)
     
     # New vs Returning visitors - based on unique visitor_ids
-    unique_visitors = db.session.query(Visit.visitor_id).distinct().all()
-    repeat_visitors = db.session.query(Visit.visitor_id)\
-        .group_by(Visit.visitor_id)\
-        .having(func.count(Visit.visitor_id) > 1)\
-        .count()
-    new_visitors = len(unique_visitors) - repeat_visitors
+    new_visitors = unique_visitors - repeat_visitors
     visitor_type_distribution = [new_visitors, repeat_visitors]
     
     # Get popular times
+    visits_by_hour = visits_by_hour_of_day()
     popular_times = []
     for hour in range(24):
-        visits = Visit.query.filter(func.extract('hour', Visit.timestamp) == hour).count()
-        avg_duration = db.session.query(
-            func.avg(Visit.duration)
-        ).filter(func.extract('hour', Visit.timestamp) == hour).scalar() or 0
-        
+        visits, hour_duration = visits_by_hour.get(hour, (0, 0))
+        hour_avg_duration = hour_duration / visits if visits else 0
         popular_times.append({
             'hour': f"{hour:02d}:00",
             'visitors': visits,
-            'avg_duration': f"{int(avg_duration)} seconds",
+            'avg_duration': f"{int(hour_avg_duration)} seconds",
             'popular_sections': "Main Hall, Exhibition Area"  # This should be dynamic based on actual data
         })
     
@@ -739,19 +782,16 @@ def visit_statistics():
 def get_visitor_data():
     """API endpoint for visitor data"""
     try:
-        total_visits = Visit.query.count()
-        unique_visitors = db.session.query(Visit.visitor_id).distinct().count()
+        total_visits, _, _ = visit_totals()
+        unique_visitors, _ = visitor_counts()
         
         # Get visit trend data
-        visits_by_date = db.session.query(
-            db.func.date(Visit.timestamp).label('date'),
-            db.func.count(Visit.id).label('count')
-        ).group_by(db.func.date(Visit.timestamp)).all()
+        visits_by_date = visits_by_day()
         
         return jsonify({
             'total_visits': total_visits,
             'unique_visitors': unique_visitors,
-            'visits_by_date': [{'date': str(v.date), 'count': v.count} for v in visits_by_date]
+            'visits_by_date': [{'date': date, 'count': count} for date, count in sorted(visits_by_date.items())]
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1079,25 +1119,14 @@ def get_visitor_data_filter():
     visitor_type = request.args.get('visitorType', 'all')
     
     # Calculate date range
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=time_range)
-    
-    # Build query
-    query = Visit.query.filter(Visit.timestamp.between(start_date, end_date))
-    
-    if visitor_type != 'all':
-        is_new = visitor_type == 'new'
-        query = query.filter(Visit.is_new_visitor == is_new)
+    start_date = datetime.now() - timedelta(days=time_range)
     
-    # Get visitor trend
-    visitor_trend = {}
-    for visit in query.all():
-        date = visit.timestamp.strftime('%Y-%m-%d')
-        visitor_trend[date] = visitor_trend.get(date, 0) + 1
+    # Get visitor trend - a visitor's first visit counts as new, every later visit as returning
+    visitor_trend = visits_by_day(start_date, visitor_type)
     
     # Get visitor type distribution
-    new_visitors = query.filter(Visit.is_new_visitor == True).count()
-    returning_visitors = query.filter(Visit.is_new_visitor == False).count()
+    new_visitors = sum(visits_by_day(start_date, 'new').values())
+    returning_visitors = sum(visits_by_day(start_date, 'returning').values())
     
     return jsonify({
         'visitorTrend': visitor_trend,
@@ -4,19 +4,40 @@ AI-powered Chatbot Service for Food Exhibit Platform
 Auto Language Detection - الكشف التلقائي عن اللغة
 """
 
+import asyncio
 import os
 import json
-import re
-from typing import Optional, List, Dict
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Iterator, Optional, List, Dict
 from datetime import datetime
 import logging
 
+from chatbot_cache import FlightTimeout, ResponseCache, SemanticCache, SingleFlight
+from guidelines_index import GuidelinesIndex
+from intent_matcher import MessageMatch, match_message
+from provider_gateway import PROVIDER_TIMEOUT, ProviderGateway, provider_loop
+from provider_registry import provider_registry
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Load guidelines from file
 GUIDELINES_PATH = os.path.join(os.path.dirname(__file__), 'chatbot_guidelines.txt')
+# Seconds between checks for an edited guidelines file
+GUIDELINES_CHECK_SECONDS = float(os.environ.get('CHATBOT_GUIDELINES_CHECK_SECONDS', 5))
+
+# Conversation history limits - see ConversationHistory
+HISTORY_MAX_CONVERSATIONS = int(os.environ.get('CHATBOT_HISTORY_MAX_CONVERSATIONS', 10000))
+HISTORY_TTL = int(os.environ.get('CHATBOT_HISTORY_TTL', 1800))
+HISTORY_TURNS = int(os.environ.get('CHATBOT_HISTORY_TURNS', 5))
+# Longer messages are cut before they are kept for the prompt context
+HISTORY_MESSAGE_CHARS = 2000
+
+# Second provider ('gemini' or 'chatgpt') for hedged requests - see provider_gateway
+HEDGE_PROVIDER = os.environ.get('CHATBOT_HEDGE_PROVIDER', '').lower()
 
 
 def detect_language(text: str) -> str:
@@ -25,25 +46,120 @@ def detect_language(text: str) -> str:
     Returns 'ar' for Arabic, 'en' for English
     Default: 'ar'
     """
-    if not text:
-        return 'ar'
-    
-    # Count Arabic and English characters
-    arabic_pattern = r'[\u0600-\u06FF]'  # Arabic Unicode range
-    english_pattern = r'[a-zA-Z]'
-    
-    arabic_count = len(re.findall(arabic_pattern, text))
-    english_count = len(re.findall(english_pattern, text))
-    
-    # If more Arabic characters, return Arabic
-    if arabic_count > english_count:
-        return 'ar'
-    # If more English characters, return English
-    elif english_count > arabic_count:
-        return 'en'
-    # Default to Arabic if equal or no specific characters
-    else:
-        return 'ar'
+    # Counts Arabic and English letters in the same scan as the intents - see intent_matcher
+    return match_message(text).language
+
+
+class ConversationHistory:
+    """
+    Recent turns of every chatbot conversation - سجل المحادثات الأخيرة
+
+    Keyed by (user_id, conversation_id). At most max_conversations
+    conversations are kept, each holding only its last `turns` user/assistant
+    pairs, so memory stays flat however many people are chatting. The least
+    recently used conversation is evicted first and one untouched for ttl
+    seconds expires. On a miss for a logged-in user the turns are reloaded
+    through loader(user_id, conversation_id, limit), which returns the newest
+    `limit` messages oldest first (ChatMessage rows, see chatbot_routes.py).
+    """
+
+    def __init__(self, max_conversations: int = HISTORY_MAX_CONVERSATIONS, ttl: int = HISTORY_TTL,
+                 turns: int = HISTORY_TURNS, loader: Callable = None):
+        self.max_conversations = max_conversations
+        self.ttl = ttl
+        self.turns = turns
+        self.loader = loader
+        self._lock = threading.Lock()
+        # key -> (last access, deque of {'role', 'content'}), least recently used first
+        self._conversations = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    @staticmethod
+    def key(user_id, conversation_id=None):
+        return (user_id, conversation_id or 'default')
+
+    def _expire(self, now):
+        """Drop conversations idle for longer than ttl - they sit at the front"""
+        while self._conversations:
+            key, (last_access, _) = next(iter(self._conversations.items()))
+            if now - last_access < self.ttl:
+                break
+            del self._conversations[key]
+            self.stats['expired'] += 1
+
+    def _turns(self, key, now):
+        """The cached deque for key, or None - caller holds the lock"""
+        entry = self._conversations.get(key)
+        if entry is None:
+            return None
+        if now - entry[0] >= self.ttl:
+            del self._conversations[key]
+            self.stats['expired'] += 1
+            return None
+        self._conversations[key] = (now, entry[1])
+        self._conversations.move_to_end(key)
+        return entry[1]
+
+    def _store(self, key, messages, now):
+        turns = deque(messages, maxlen=self.turns * 2)
+        self._conversations[key] = (now, turns)
+        self._conversations.move_to_end(key)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+            self.stats['evictions'] += 1
+        return turns
+
+    def _load(self, user_id, conversation_id):
+        if self.loader is None or user_id is None:
+            return []
+        try:
+            return self.loader(user_id, conversation_id, self.turns * 2)
+        except Exception as e:
+            logger.error(f"Error loading conversation history: {str(e)}")
+            return []
+
+    def recent(self, user_id, conversation_id=None) -> List[Dict]:
+        """Last turns of the conversation, oldest first"""
+        key = self.key(user_id, conversation_id)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            turns = self._turns(key, now)
+            if turns is not None:
+                self.stats['hits'] += 1
+                return list(turns)
+            self.stats['misses'] += 1
+
+        # Read the database outside the lock - a concurrent miss just loads twice
+        messages = self._load(user_id, conversation_id)
+        with self._lock:
+            turns = self._turns(key, now)
+            if turns is None:
+                turns = self._store(key, messages, now)
+            return list(turns)
+
+    def append(self, user_id, conversation_id, role: str, content: str):
+        key = self.key(user_id, conversation_id)
+        message = {'role': role, 'content': (content or '')[:HISTORY_MESSAGE_CHARS]}
+        now = time.monotonic()
+        with self._lock:
+            turns = self._turns(key, now)
+            if turns is None:
+                # recent() was not called first (or the entry was evicted meanwhile)
+                turns = self._store(key, [], now)
+            turns.append(message)
+
+    def clear(self, user_id, conversation_id=None):
+        """Forget one conversation, or every conversation of the user"""
+        with self._lock:
+            if conversation_id is not None:
+                self._conversations.pop(self.key(user_id, conversation_id), None)
+                return
+            for key in [key for key in self._conversations if key[0] == user_id]:
+                del self._conversations[key]
+
+    def __len__(self):
+        return len(self._conversations)
 
 
 class AIProvider:
@@ -51,7 +167,21 @@ class AIProvider:
     
     def __init__(self, api_key: str):
         self.api_key = api_key
+        self.reload_guidelines()
+    
+    def reload_guidelines(self):
+        """Read the guidelines file and index its sections for retrieval"""
         self.guidelines = self._load_guidelines()
+        self.guidelines_index = GuidelinesIndex(self.guidelines)
+    
+    def guidelines_for(self, user_message: str, conversation_history: List[Dict] = None) -> str:
+        """Guidelines sections relevant to the message (and the user's previous turn)"""
+        query = user_message
+        for msg in reversed(conversation_history or []):
+            if msg.get('role') == 'user':
+                query = f"{msg.get('content', '')}\n{user_message}"
+                break
+        return self.guidelines_index.context(query)
     
     def _load_guidelines(self) -> str:
         """Load guidelines from file"""
@@ -65,6 +195,25 @@ class AIProvider:
     def get_response(self, user_message: str, conversation_history: List[Dict] = None) -> Optional[str]:
         """Get response from AI provider - to be implemented by subclasses"""
         raise NotImplementedError
+    
+    async def aget_response(self, user_message: str, conversation_history: List[Dict] = None) -> Optional[str]:
+        """Coroutine version of get_response used by ProviderGateway - raises on provider errors
+        
+        Providers without an async API run get_response in a worker thread.
+        """
+        return await asyncio.to_thread(self.get_response, user_message, conversation_history)
+    
+    def warm_up(self):
+        """Open the upstream connections before the first question - see provider_registry"""
+    
+    def stream_response(self, user_message: str, conversation_history: List[Dict] = None) -> Iterator[str]:
+        """Yield the response in chunks as they arrive - raises on provider errors
+        
+        Providers without a streaming API answer in one chunk.
+        """
+        response = self.get_response(user_message, conversation_history)
+        if response:
+            yield response
 
 
 class GeminiProvider(AIProvider):
@@ -72,11 +221,8 @@ class GeminiProvider(AIProvider):
     
     def __init__(self, api_key: str):
         try:
-            import google.generativeai as genai
-            self.genai = genai
-            self.genai.configure(api_key=api_key)
-            # Use the latest fast model available
-            self.model = self.genai.GenerativeModel('gemini-2.0-flash')
+            # Use the latest fast model available (one shared model per process)
+            self.model = provider_registry.gemini_model(api_key)
         except ImportError:
             logger.error("google-generativeai not installed. Run: pip install google-generativeai")
             raise
@@ -87,18 +233,24 @@ class GeminiProvider(AIProvider):
         super().__init__(api_key)
         self.registration_state = {}  # Track user registration state
     
-    def get_response(self, user_message: str, conversation_history: List[Dict] = None, language: str = 'ar') -> Optional[str]:
-        """Get response from Gemini with auto language detection"""
-        try:
-            # Auto-detect language from user message
-            language = detect_language(user_message)
-            
-            # Build system prompt based on detected language
-            if language == 'en':
-                system_prompt = f"""You are a professional and helpful AI assistant for the Esco Fairs Platform.
+    def warm_up(self):
+        """Token counting is free - it opens the sync and the async channel to Gemini"""
+        self.model.count_tokens('warm up')
+        asyncio.run_coroutine_threadsafe(
+            self.model.count_tokens_async('warm up'), provider_loop()).result(PROVIDER_TIMEOUT)
+    
+    def _start_chat(self, user_message: str, conversation_history: List[Dict] = None):
+        """Chat session holding the earlier turns, and the prompt to send to it"""
+        # Auto-detect language from user message
+        language = detect_language(user_message)
+        guidelines = self.guidelines_for(user_message, conversation_history)
+        
+        # Build system prompt based on detected language
+        if language == 'en':
+            system_prompt = f"""You are a professional and helpful AI assistant for the Esco Fairs Platform.
 These are the system guidelines:
 
-{self.guidelines}
+{guidelines}
 
 Response Instructions:
 1. Reply naturally and friendly to any general question (like "Hello" or "How are you?")
@@ -107,11 +259,11 @@ Response Instructions:
 4. If you don't know the answer to a specific question about the platform, say: "Sorry, I don't have complete information about this topic. Please contact our support team"
 5. ALWAYS respond in English - NEVER respond in Arabic
 6. Keep responses short and helpful"""
-            else:  # Arabic (ar)
-                system_prompt = f"""أنت مساعد ذكي محترف لمنصة معرض Esco Fairs.
+        else:  # Arabic (ar)
+            system_prompt = f"""أنت مساعد ذكي محترف لمنصة معرض Esco Fairs.
 هذه معلومات النظام الأساسية:
 
-{self.guidelines}
+{guidelines}
 
 تعليمات الرد:
 1. رد بشكل طبيعي وودود على أي سؤال عام (مثل "مرحباً" أو "كيفك؟")
@@ -120,39 +272,50 @@ Response Instructions:
 4. إذا لم تعرف الإجابة على سؤال معين عن المنصة، قل: "عذراً، لا أملك معلومات كاملة عن هذا الموضوع. يرجى التواصل مع فريق الدعم"
 5. يجب الرد دائماً باللغة العربية - لا تترجم إلى لغات أخرى
 6. اجعل الردود قصيرة ومفيدة"""
-            
-            # Build message history for context (last 10 messages)
-            messages = []
-            
-            if conversation_history:
-                for msg in conversation_history[-10:]:
-                    messages.append({
-                        "role": msg.get('role', 'user'),
-                        "content": msg.get('content', '')
-                    })
-            
-            # Add current message
-            messages.append({
-                "role": "user",
-                "content": user_message
-            })
-            
-            # Create chat session for faster responses
-            chat = self.model.start_chat(history=[])
+        
+        # Earlier turns of this conversation (already cut to the last K by ConversationHistory)
+        history = [
+            {'role': 'model' if msg.get('role') == 'assistant' else 'user', 'parts': [msg.get('content', '')]}
+            for msg in conversation_history or []
+        ]
+        
+        # Create chat session for faster responses
+        chat = self.model.start_chat(history=history)
+        return chat, f"{system_prompt}\n\nالرسالة: {user_message}"
+    
+    def get_response(self, user_message: str, conversation_history: List[Dict] = None, language: str = 'ar') -> Optional[str]:
+        """Get response from Gemini with auto language detection"""
+        try:
+            chat, full_prompt = self._start_chat(user_message, conversation_history)
             
             # Send message with system prompt
-            full_prompt = f"{system_prompt}\n\nالرسالة: {user_message}"
             response = chat.send_message(full_prompt)
             
             if response and response.text:
                 return response.text.strip()
             else:
                 logger.warning("Empty response from Gemini")
-                return "عذراً، حدث خطأ في معالجة طلبك. يرجى المحاولة مرة أخرى."
+                return None
                 
         except Exception as e:
             logger.error(f"Error getting response from Gemini: {str(e)}")
-            return f"عذراً، حدث خطأ: {str(e)}"
+            return None
+    
+    async def aget_response(self, user_message: str, conversation_history: List[Dict] = None) -> Optional[str]:
+        """Get response from Gemini on the provider event loop"""
+        chat, full_prompt = self._start_chat(user_message, conversation_history)
+        response = await chat.send_message_async(full_prompt)
+        if response and response.text:
+            return response.text.strip()
+        logger.warning("Empty response from Gemini")
+        return None
+    
+    def stream_response(self, user_message: str, conversation_history: List[Dict] = None) -> Iterator[str]:
+        """Yield Gemini's response chunks as they are generated"""
+        chat, full_prompt = self._start_chat(user_message, conversation_history)
+        for chunk in chat.send_message(full_prompt, stream=True):
+            if chunk.text:
+                yield chunk.text
 
 
 class ChatGPTProvider(AIProvider):
@@ -160,8 +323,8 @@ class ChatGPTProvider(AIProvider):
     
     def __init__(self, api_key: str):
         try:
-            from openai import OpenAI
-            self.client = OpenAI(api_key=api_key)
+            # Shared clients - the async one is used only from the provider event loop (see provider_gateway)
+            self.client, self.async_client = provider_registry.openai_clients(api_key)
         except ImportError:
             logger.error("openai not installed. Run: pip install openai")
             raise
@@ -171,17 +334,23 @@ class ChatGPTProvider(AIProvider):
         
         super().__init__(api_key)
     
-    def get_response(self, user_message: str, conversation_history: List[Dict] = None, language: str = 'ar') -> Optional[str]:
-        """Get response from ChatGPT with auto language detection"""
-        try:
-            # Auto-detect language from user message
-            language = detect_language(user_message)
-            
-            # Build system prompt with guidelines based on detected language
-            if language == 'en':
-                system_prompt = f"""You are a helpful and professional customer support assistant for the Esco Fairs Platform.
+    def warm_up(self):
+        """Listing the models opens a pooled connection of both clients"""
+        self.client.models.list()
+        asyncio.run_coroutine_threadsafe(
+            self.async_client.models.list(), provider_loop()).result(PROVIDER_TIMEOUT)
+    
+    def _messages(self, user_message: str, conversation_history: List[Dict] = None) -> List[Dict]:
+        """Chat completion messages: system prompt, earlier turns, then the user's message"""
+        # Auto-detect language from user message
+        language = detect_language(user_message)
+        guidelines = self.guidelines_for(user_message, conversation_history)
+        
+        # Build system prompt with guidelines based on detected language
+        if language == 'en':
+            system_prompt = f"""You are a helpful and professional customer support assistant for the Esco Fairs Platform.
 
-{self.guidelines}
+{guidelines}
 
 IMPORTANT: 
 - ALWAYS respond in English
@@ -190,10 +359,10 @@ IMPORTANT:
 - Provide clear and concise answers
 - If you don't know something, suggest contacting support
 - Keep responses brief and helpful"""
-            else:  # Arabic (ar)
-                system_prompt = f"""أنت مساعد خدمة عملاء مفيد واحترافي لمنصة معرض Esco Fairs.
+        else:  # Arabic (ar)
+            system_prompt = f"""أنت مساعد خدمة عملاء مفيد واحترافي لمنصة معرض Esco Fairs.
 
-{self.guidelines}
+{guidelines}
 
 تعليمات مهمة:
 - الرد دائماً باللغة العربية - لا تترجم
@@ -201,33 +370,37 @@ IMPORTANT:
 - قدم إجابات واضحة ومختصرة
 - إذا لم تعرف شيء، اقترح التواصل مع الدعم
 - اجعل الردود قصيرة ومفيدة"""
-            
-            # Build message history
-            messages = [
-                {
-                    "role": "system",
-                    "content": system_prompt
-                }
-            ]
-            
-            if conversation_history:
-                # Add last 5 messages for context
-                for msg in conversation_history[-5:]:
-                    messages.append({
-                        "role": msg.get('role', 'user'),
-                        "content": msg.get('content', '')
-                    })
-            
-            # Add current message
-            messages.append({
-                "role": "user",
-                "content": user_message
-            })
-            
+        
+        # Build message history
+        messages = [
+            {
+                "role": "system",
+                "content": system_prompt
+            }
+        ]
+        
+        if conversation_history:
+            # Earlier turns of this conversation (already cut to the last K by ConversationHistory)
+            for msg in conversation_history:
+                messages.append({
+                    "role": msg.get('role', 'user'),
+                    "content": msg.get('content', '')
+                })
+        
+        # Add current message
+        messages.append({
+            "role": "user",
+            "content": user_message
+        })
+        return messages
+    
+    def get_response(self, user_message: str, conversation_history: List[Dict] = None, language: str = 'ar') -> Optional[str]:
+        """Get response from ChatGPT with auto language detection"""
+        try:
             # Get response from ChatGPT
             response = self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
-                messages=messages,
+                messages=self._messages(user_message, conversation_history),
                 temperature=0.7,
                 max_tokens=500
             )
@@ -241,34 +414,72 @@ IMPORTANT:
         except Exception as e:
             logger.error(f"Error getting response from ChatGPT: {str(e)}")
             return None
+    
+    async def aget_response(self, user_message: str, conversation_history: List[Dict] = None) -> Optional[str]:
+        """Get response from ChatGPT on the provider event loop"""
+        response = await self.async_client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=self._messages(user_message, conversation_history),
+            temperature=0.7,
+            max_tokens=500
+        )
+        if response and response.choices and response.choices[0].message.content:
+            return response.choices[0].message.content.strip()
+        logger.warning("Empty response from ChatGPT")
+        return None
+    
+    def stream_response(self, user_message: str, conversation_history: List[Dict] = None) -> Iterator[str]:
+        """Yield ChatGPT's response deltas as they are generated"""
+        stream = self.client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=self._messages(user_message, conversation_history),
+            temperature=0.7,
+            max_tokens=500,
+            stream=True
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
 
 class ChatbotManager:
     """Main chatbot manager that handles AI provider selection and responses"""
     
-    def __init__(self, provider: str = 'gemini', api_key: str = None):
+    def __init__(self, provider: str = 'gemini', api_key: str = None, history: ConversationHistory = None):
         """
         Initialize chatbot manager
         
         Args:
             provider: 'gemini' or 'chatgpt'
             api_key: API key for the selected provider
+            history: Per-conversation history store (an in-memory one if not given)
         """
         self.provider_name = provider.lower()
         self.api_key = api_key or self._get_api_key_from_env()
         self.provider = None
-        self.conversation_history: List[Dict] = []
+        # Hedges and stands in for the provider - see provider_gateway
+        self.secondary = None
+        self.history = history or ConversationHistory()
+        self.cache = ResponseCache()
+        # Paraphrase tier behind the exact cache - needs numpy
+        self.semantic_cache = SemanticCache() if SemanticCache.available else None
+        # Cache misses of a question already being answered wait for that answer
+        self.inflight = SingleFlight()
+        self._guidelines_mtime = self._read_guidelines_mtime()
+        self._guidelines_checked_at = time.monotonic()
         
         if not self.api_key:
             raise ValueError(f"API key for {provider} not provided")
         
         self._initialize_provider()
+        self.gateway = ProviderGateway(self.provider, self.secondary)
     
-    def _get_api_key_from_env(self) -> Optional[str]:
+    def _get_api_key_from_env(self, provider_name: str = None) -> Optional[str]:
         """Get API key from environment variables"""
-        if self.provider_name == 'gemini':
+        provider_name = provider_name or self.provider_name
+        if provider_name == 'gemini':
             return os.environ.get('GOOGLE_API_KEY')
-        elif self.provider_name == 'chatgpt':
+        elif provider_name == 'chatgpt':
             return os.environ.get('OPENAI_API_KEY')
         return None
     
@@ -286,8 +497,68 @@ class ChatbotManager:
         except Exception as e:
             logger.error(f"Failed to initialize {self.provider_name}: {str(e)}")
             raise
+        
+        if HEDGE_PROVIDER and HEDGE_PROVIDER != self.provider_name:
+            self._initialize_secondary(HEDGE_PROVIDER)
+    
+    def _initialize_secondary(self, provider_name: str):
+        """Initialize the hedge provider - the chatbot runs without one if that fails"""
+        api_key = self._get_api_key_from_env(provider_name)
+        try:
+            if not api_key:
+                raise ValueError(f"API key for {provider_name} not provided")
+            if provider_name == 'gemini':
+                self.secondary = GeminiProvider(api_key)
+            elif provider_name == 'chatgpt':
+                self.secondary = ChatGPTProvider(api_key)
+            else:
+                raise ValueError(f"Unknown provider: {provider_name}")
+            logger.info(f"Initialized {provider_name} as the hedge provider")
+        except Exception as e:
+            logger.warning(f"Hedged requests disabled - failed to initialize {provider_name}: {str(e)}")
+    
+    @staticmethod
+    def _read_guidelines_mtime() -> Optional[float]:
+        try:
+            return os.stat(GUIDELINES_PATH).st_mtime
+        except OSError:
+            return None
     
-    def get_response(self, user_message: str, user_id: int = None, language: str = None) -> Dict:
+    def _check_guidelines(self):
+        """Reload the guidelines and drop cached answers once chatbot_guidelines.txt changes"""
+        now = time.monotonic()
+        if now - self._guidelines_checked_at < GUIDELINES_CHECK_SECONDS:
+            return
+        self._guidelines_checked_at = now
+        mtime = self._read_guidelines_mtime()
+        if mtime == self._guidelines_mtime:
+            return
+        self._guidelines_mtime = mtime
+        self.provider.reload_guidelines()
+        if self.secondary is not None:
+            self.secondary.reload_guidelines()
+        self.cache.clear()
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear()
+        logger.info("Chatbot guidelines changed - reloaded and cleared the response cache")
+    
+    def _cached_answer(self, language: str, user_message: str) -> Optional[str]:
+        """Answer of the same question, else of a paraphrase of a cached one"""
+        answer = self.cache.get(language, user_message)
+        if answer is None and self.semantic_cache is not None:
+            answer = self.semantic_cache.get(language, user_message)
+            if answer is not None:
+                # The next identical question skips the vector lookup
+                self.cache.put(language, user_message, answer)
+        return answer
+    
+    def _cache_answer(self, language: str, user_message: str, answer: str):
+        self.cache.put(language, user_message, answer)
+        if self.semantic_cache is not None:
+            self.semantic_cache.put(language, user_message, answer)
+    
+    def get_response(self, user_message: str, user_id: int = None, language: str = None,
+                     conversation_id: str = None, remember: bool = True) -> Dict:
         """
         Get AI response to user message with auto language detection
         
@@ -295,6 +566,8 @@ class ChatbotManager:
             user_message: The user's message
             user_id: Optional user ID for tracking
             language: Optional language override (if None, auto-detect)
+            conversation_id: Conversation of the user (anonymous visitors pass their session key)
+            remember: False for one-off questions that neither use nor extend the history
             
         Returns:
             Dictionary with response and metadata
@@ -304,58 +577,146 @@ class ChatbotManager:
             if not language:
                 language = detect_language(user_message)
             
-            # Add user message to history
-            self.conversation_history.append({
-                'role': 'user',
-                'content': user_message,
-                'timestamp': datetime.now().isoformat()
-            })
+            history, cacheable, ai_response = self._prepare(user_message, user_id, language, conversation_id, remember)
+            cached = ai_response is not None
             
-            # Get response from provider (language will be detected again in provider)
-            ai_response = self.provider.get_response(
-                user_message,
-                self.conversation_history
-            )
-            
-            if not ai_response:
-                # Default error message based on detected language
-                if language == 'en':
-                    ai_response = "Sorry, there was an error getting the response. Please try again or contact support."
-                else:
-                    ai_response = "عذراً، حدث خطأ في الحصول على الرد. يرجى محاولة مرة أخرى أو التواصل مع الدعم الفني."
+            if not cached and cacheable:
+                # Identical questions arriving meanwhile share this provider call
+                ai_response = self.inflight.do(self.cache.key(language, user_message),
+                                               lambda: self._ask(user_message, language))
+            elif not cached:
+                # Get response from provider (language will be detected again in provider)
+                # None after the deadline or while the circuit breakers are open
+                ai_response = self.gateway.call(
+                    user_message,
+                    history
+                )
             
-            # Add AI response to history
-            self.conversation_history.append({
-                'role': 'assistant',
-                'content': ai_response,
-                'timestamp': datetime.now().isoformat()
-            })
-            
-            return {
-                'success': True,
-                'response': ai_response,
-                'provider': self.provider_name,
-                'user_id': user_id,
-                'timestamp': datetime.now().isoformat()
-            }
+            return self._finish(user_message, user_id, language, conversation_id, remember, ai_response, cached)
             
         except Exception as e:
             logger.error(f"Error getting response: {str(e)}")
-            return {
-                'success': False,
-                'response': f"عذراً، حدث خطأ: {str(e)}",
-                'error': str(e),
-                'timestamp': datetime.now().isoformat()
-            }
+            return self._error(e)
     
-    def clear_history(self, user_id: int = None):
-        """Clear conversation history"""
-        self.conversation_history = []
+    def stream_response(self, user_message: str, user_id: int = None, language: str = None,
+                        conversation_id: str = None, remember: bool = True) -> Iterator[Dict]:
+        """
+        Stream the AI response to a user message
+        
+        Takes the same arguments as get_response. Yields {'chunk': text}
+        events as the provider generates the answer, then one final
+        {'done': True, ...} event carrying the get_response fields.
+        """
+        try:
+            if not language:
+                language = detect_language(user_message)
+            
+            history, cacheable, ai_response = self._prepare(user_message, user_id, language, conversation_id, remember)
+            cached = ai_response is not None
+            
+            flight, leader = (None, True)
+            if not cached and cacheable:
+                key = self.cache.key(language, user_message)
+                flight, leader = self.inflight.join(key)
+            
+            if not leader:
+                # The same question is being answered - send its answer in one chunk
+                try:
+                    ai_response = self.inflight.wait(flight) or self._fallback_message(language)
+                except FlightTimeout:
+                    # The leader is stuck - stream an answer of our own outside its flight
+                    flight, leader = None, True
+            
+            if cached or not leader:
+                yield {'chunk': ai_response}
+            else:
+                parts = []
+                complete = False
+                try:
+                    for chunk in self.gateway.stream(user_message, history):
+                        parts.append(chunk)
+                        yield {'chunk': chunk}
+                    complete = True
+                except Exception as e:
+                    logger.error(f"Error streaming response: {str(e)}")
+                finally:
+                    # Also runs when the client goes away - waiters must not hang
+                    ai_response = ''.join(parts).strip()
+                    if flight is not None:
+                        # A cut-off answer must not be served to the next visitor
+                        self.inflight.finish(key, flight, ai_response if complete else None)
+                if ai_response and complete and cacheable:
+                    self._cache_answer(language, user_message, ai_response)
+                if not ai_response:
+                    ai_response = self._fallback_message(language)
+                    yield {'chunk': ai_response}
+            
+            yield {'done': True, **self._finish(user_message, user_id, language, conversation_id, remember,
+                                                ai_response, cached)}
+            
+        except Exception as e:
+            logger.error(f"Error streaming response: {str(e)}")
+            yield {'done': True, **self._error(e)}
+    
+    def _ask(self, user_message: str, language: str) -> Optional[str]:
+        """Provider answer to an opening question, cached for the next visitors"""
+        ai_response = self.gateway.call(user_message)
+        if ai_response:
+            self._cache_answer(language, user_message, ai_response)
+        return ai_response
+    
+    def _prepare(self, user_message: str, user_id: int, language: str, conversation_id: str, remember: bool):
+        """Earlier turns, whether the answer may be cached, and the cached answer if there is one"""
+        history = self.history.recent(user_id, conversation_id) if remember else []
+        
+        self._check_guidelines()
+        # Answers depend on earlier turns - only opening questions are cached
+        cacheable = not history
+        return history, cacheable, self._cached_answer(language, user_message) if cacheable else None
+    
+    @staticmethod
+    def _fallback_message(language: str) -> str:
+        # Default error message based on detected language
+        if language == 'en':
+            return "Sorry, there was an error getting the response. Please try again or contact support."
+        return "عذراً، حدث خطأ في الحصول على الرد. يرجى محاولة مرة أخرى أو التواصل مع الدعم الفني."
+    
+    def _finish(self, user_message: str, user_id: int, language: str, conversation_id: str, remember: bool,
+                ai_response: Optional[str], cached: bool) -> Dict:
+        """Record the exchange and build the response dictionary"""
+        if not ai_response:
+            ai_response = self._fallback_message(language)
+        
+        if remember:
+            self.history.append(user_id, conversation_id, 'user', user_message)
+            self.history.append(user_id, conversation_id, 'assistant', ai_response)
+        
+        return {
+            'success': True,
+            'response': ai_response,
+            'provider': self.provider_name,
+            'cached': cached,
+            'user_id': user_id,
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    @staticmethod
+    def _error(e: Exception) -> Dict:
+        return {
+            'success': False,
+            'response': f"عذراً، حدث خطأ: {str(e)}",
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def clear_history(self, user_id: int = None, conversation_id: str = None):
+        """Clear conversation history of one conversation, or of every conversation of the user"""
+        self.history.clear(user_id, conversation_id)
         logger.info(f"Cleared history for user {user_id or 'unknown'}")
     
-    def get_history(self) -> List[Dict]:
-        """Get conversation history"""
-        return self.conversation_history
+    def get_history(self, user_id: int = None, conversation_id: str = None) -> List[Dict]:
+        """Get the recent turns of a conversation"""
+        return self.history.recent(user_id, conversation_id)
 
 
 # Factory function to create chatbot
@@ -371,11 +732,23 @@ def create_chatbot(provider: str = None, api_key: str = None) -> ChatbotManager:
         ChatbotManager instance
     """
     provider = provider or os.environ.get('AI_PROVIDER', 'gemini')
-    return ChatbotManager(provider=provider, api_key=api_key)
+    return ChatbotManager(provider=provider, api_key=api_key,
+                          history=ConversationHistory(loader=_history_loader))
 
 
 # Singleton instance for the application
 _chatbot_instance: Optional[ChatbotManager] = None
+# Reloads evicted conversations of logged-in users - set by chatbot_routes.register_chatbot_routes
+_history_loader: Optional[Callable] = None
+_chatbot_lock = threading.Lock()
+
+
+def set_history_loader(loader: Callable):
+    """Use loader(user_id, conversation_id, limit) to reload conversations missing from memory"""
+    global _history_loader
+    _history_loader = loader
+    if _chatbot_instance is not None:
+        _chatbot_instance.history.loader = loader
 
 
 def get_chatbot() -> ChatbotManager:
@@ -383,38 +756,47 @@ def get_chatbot() -> ChatbotManager:
     global _chatbot_instance
     
     if _chatbot_instance is None:
-        try:
-            _chatbot_instance = create_chatbot()
-        except Exception as e:
-            logger.error(f"Failed to initialize chatbot: {str(e)}")
-            raise
+        # The warmup thread and the first requests must not build it twice
+        with _chatbot_lock:
+            if _chatbot_instance is None:
+                try:
+                    _chatbot_instance = create_chatbot()
+                except Exception as e:
+                    logger.error(f"Failed to initialize chatbot: {str(e)}")
+                    raise
     
     return _chatbot_instance
 
 
-def handle_user_registration(user_message: str, user_id: int = None) -> Dict:
+def warm_up_chatbot():
+    """Build the chatbot and connect its providers before the first visitor asks"""
+    chatbot = get_chatbot()
+    for provider in (chatbot.provider, chatbot.secondary):
+        if provider is not None:
+            provider.warm_up()
+
+
+def start_chatbot_warmup():
+    """Run warm_up_chatbot in a background thread (once per process)"""
+    return provider_registry.start_warmup(warm_up_chatbot)
+
+
+def handle_user_registration(user_message: str, user_id: int = None, match: MessageMatch = None) -> Dict:
     """
     Handle user registration through chatbot
     Detects registration requests and guides user through registration process
     
+    Args:
+        match: match_message(user_message), if the caller already has it
+    
     Returns:
         Dictionary with registration data or request for next info
     """
-    language = detect_language(user_message)
-    
-    # Registration keywords
-    ar_keywords = ['تسجيل', 'حساب جديد', 'انشاء حساب', 'عضو جديد', 'مستخدم جديد', 'اريد حساب', 'ابدأ']
-    en_keywords = ['register', 'sign up', 'create account', 'new account', 'new user', 'join', 'account']
-    
-    user_message_lower = user_message.lower()
-    
-    # Check if user wants to register
-    if language == 'ar':
-        wants_to_register = any(keyword in user_message_lower for keyword in ar_keywords)
-    else:
-        wants_to_register = any(keyword in user_message_lower for keyword in en_keywords)
+    match = match or match_message(user_message)
+    language = match.language
     
-    if wants_to_register:
+    # Check if user wants to register (keywords of the message's language only)
+    if match.wants(f'register_{language}'):
         if language == 'en':
             return {
                 'action': 'start_registration',
@@ -435,36 +817,20 @@ def handle_user_registration(user_message: str, user_id: int = None) -> Dict:
     return {'action': 'none'}
 
 
-def detect_account_status_request(user_message: str) -> bool:
+def detect_account_status_request(user_message: str, match: MessageMatch = None) -> bool:
     """
     الكشف عن طلب التحقق من حالة الحساب
     Detect if user is asking about account approval status
     """
-    ar_keywords = ['حالة', 'موافقة', 'تفعيل', 'حسابي', 'الموافقة', 'متى', 'تم تفعيل', 'هل تم الموافقة', 'حسابي']
-    en_keywords = ['status', 'approval', 'active', 'activate', 'approved', 'account', 'when', 'check']
-    
-    user_message_lower = user_message.lower()
-    
-    ar_check = any(keyword in user_message_lower for keyword in ar_keywords)
-    en_check = any(keyword in user_message_lower for keyword in en_keywords)
-    
-    return ar_check or en_check
+    return (match or match_message(user_message)).wants('account_status')
 
 
-def detect_email_request(user_message: str) -> bool:
+def detect_email_request(user_message: str, match: MessageMatch = None) -> bool:
     """
     الكشف عن طلب إنشاء رسالة بريدية
     Detect if user is asking to create a company email
     """
-    ar_keywords = ['رسالة', 'بريد', 'رسالة بريدية', 'أرسل رسالة', 'اكتب رسالة', 'أكتب بريد', 'تواصل']
-    en_keywords = ['email', 'message', 'compose', 'send email', 'write message', 'draft', 'write email']
-    
-    user_message_lower = user_message.lower()
-    
-    ar_check = any(keyword in user_message_lower for keyword in ar_keywords)
-    en_check = any(keyword in user_message_lower for keyword in en_keywords)
-    
-    return ar_check or en_check
+    return (match or match_message(user_message)).wants('email')
 
 
 def generate_company_email(subject: str, company_name: str, language: str = 'ar') -> str:
@@ -481,9 +847,6 @@ def generate_company_email(subject: str, company_name: str, language: str = 'ar'
         محتوى الرسالة المولد
     """
     try:
-        # استخدام نفس الـ API للـ Gemini
-        import google.generativeai as genai
-        
         # إنشاء طلب احترافي للـ AI لكتابة الرسالة
         if language == 'ar':
             prompt = f"""أنت متخصص في كتابة الرسائل البريدية الاحترافية.
@@ -514,9 +877,8 @@ Requirements:
 
 Email Body:"""
         
-        # استخدام Gemini لتوليد الرسالة
-        genai.configure(api_key=os.environ.get('GOOGLE_API_KEY'))
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        # استخدام Gemini لتوليد الرسالة (نفس النموذج المشترك للـ API)
+        model = provider_registry.gemini_model(os.environ.get('GOOGLE_API_KEY'))
         
         response = model.generate_content(prompt)
         
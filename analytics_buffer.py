@@ -0,0 +1,173 @@
+"""
+Buffered analytics writer - تسجيل الإحصائيات في الخلفية
+
+track_user_action() used to INSERT and commit an ExhibitorAnalytics row
+inside every page view. Events now go into a bounded in-memory queue and a
+background thread writes them in executemany batches, either when
+ANALYTICS_BATCH_SIZE events are waiting or ANALYTICS_FLUSH_INTERVAL seconds
+after the first one arrived. The queue is flushed on shutdown.
+
+When the queue is full ANALYTICS_BACKPRESSURE decides what happens:
+    drop_oldest  discard the oldest queued event (default)
+    drop_newest  discard the new event
+    block        wait up to ANALYTICS_BLOCK_TIMEOUT seconds, then discard it
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from database import serialized_write
+from extensions import db
+from models import ExhibitorAnalytics
+
+logger = logging.getLogger(__name__)
+
+BACKPRESSURE_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+
+class AnalyticsBuffer:
+    """Bounded queue of ExhibitorAnalytics rows flushed by a background thread"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._write_lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self.counters = {'recorded': 0, 'dropped': 0, 'written': 0, 'failed': 0, 'batches': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ANALYTICS_BUFFER_SIZE', 10000)
+        app.config.setdefault('ANALYTICS_BATCH_SIZE', 500)
+        app.config.setdefault('ANALYTICS_FLUSH_INTERVAL', 2.0)
+        app.config.setdefault('ANALYTICS_BACKPRESSURE', 'drop_oldest')
+        app.config.setdefault('ANALYTICS_BLOCK_TIMEOUT', 0.05)
+        if app.config['ANALYTICS_BACKPRESSURE'] not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"ANALYTICS_BACKPRESSURE must be one of {', '.join(BACKPRESSURE_POLICIES)}")
+
+        self.app = app
+        self.batch_size = app.config['ANALYTICS_BATCH_SIZE']
+        self.flush_interval = app.config['ANALYTICS_FLUSH_INTERVAL']
+        self.policy = app.config['ANALYTICS_BACKPRESSURE']
+        self.block_timeout = app.config['ANALYTICS_BLOCK_TIMEOUT']
+        self._queue = queue.Queue(maxsize=app.config['ANALYTICS_BUFFER_SIZE'])
+        app.extensions['analytics_buffer'] = self
+
+        self._thread = threading.Thread(target=self._run, name='analytics-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _count(self, name, amount=1):
+        with self._counters_lock:
+            self.counters[name] += amount
+
+    def record(self, exhibitor_id, user_id=None, action_type=None, page_visited=None, product_id=None):
+        """Queue one ExhibitorAnalytics row, return False if it was dropped"""
+        row = {
+            'exhibitor_id': exhibitor_id,
+            'user_id': user_id,
+            'action_type': action_type,
+            'page_visited': page_visited,
+            'product_id': product_id,
+            'session_duration': 0,
+            # Stamp the event now, not when the batch is written
+            'created_at': datetime.now(),
+        }
+        try:
+            if self.policy == 'block':
+                self._queue.put(row, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            if self.policy != 'drop_oldest':
+                self._count('dropped')
+                return False
+            try:
+                self._queue.get_nowait()
+                self._count('dropped')
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                self._count('dropped')
+                return False
+        self._count('recorded')
+        return True
+
+    def _take_batch(self):
+        """Wait for the first event, then collect until the batch is full or the interval ends"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stopping.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _write(self, batch):
+        """INSERT the batch with a single executemany"""
+        if not batch:
+            return
+        with self._write_lock, self.app.app_context():
+            try:
+                with serialized_write(), db.engine.begin() as connection:
+                    connection.execute(ExhibitorAnalytics.__table__.insert(), batch)
+                self._count('written', len(batch))
+                self._count('batches')
+            except Exception as e:
+                self._count('failed', len(batch))
+                logger.error(f"Error writing {len(batch)} analytics events: {str(e)}")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._write(self._take_batch())
+
+    def flush(self):
+        """Write everything queued so far from the calling thread"""
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            for i in range(0, len(batch), self.batch_size):
+                self._write(batch[i:i + self.batch_size])
+
+    def stop(self, timeout=5.0):
+        """Stop the writer thread and flush the remaining events"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self.counters)
+        counters['queued'] = self._queue.qsize() if self._queue else 0
+        return counters
+
+
+analytics_buffer = AnalyticsBuffer()
@@ -0,0 +1,390 @@
+"""
+Analytics rollups - تجميع الإحصائيات
+
+A background job folds raw Visit and ExhibitorAnalytics rows into
+HourlyVisitStats, VisitorStats and DailyExhibitorStats. Only closed buckets
+are compacted (hours before the current hour, days before today) so the
+unique-visitor counts stored in a bucket never change afterwards.
+
+The dashboards read the rollups plus the raw rows newer than the
+checkpoint, so their cost depends on the number of buckets and on the
+size of that tail, not on the size of the raw event tables. Rows inserted
+with a timestamp older than the checkpoint are not picked up.
+
+The unique_visitors column of HourlyVisitStats and DailyExhibitorStats is
+a distinct count within its own bucket. A visitor seen on several days is
+counted once per day, so summing it over a range overcounts - uniques over
+a range come from VisitorStats (visits) or COUNT(DISTINCT) over the raw
+rows (exhibitor actions).
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, case, func
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import (
+    Visit, ExhibitorAnalytics, HourlyVisitStats, VisitorStats, DailyExhibitorStats, RollupCheckpoint
+)
+
+VISITS = 'visits'
+EXHIBITOR_ANALYTICS = 'exhibitor_analytics'
+
+# Each compaction step covers at most one day of raw rows and commits on its own
+COMPACTION_STEP = timedelta(days=1)
+
+# Visits shorter than this count as bounces
+BOUNCE_SECONDS = 30
+
+# Leave recent buckets open for a while - analytics_buffer writes events a few seconds late
+SETTLE_TIME = timedelta(minutes=5)
+
+# Keep IN (...) lists below SQLite's bound parameter limit
+IN_CHUNK = 500
+
+
+def floor_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(value):
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _chunks(items, size=IN_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _as_datetime(value):
+    """SQLite returns date functions as strings, PostgreSQL as datetime"""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _as_date(value):
+    return _as_datetime(str(value)).date()
+
+
+def _hour_bucket(column):
+    """SQL expression truncating a timestamp to the start of its hour"""
+    if db.engine.dialect.name == 'sqlite':
+        return func.strftime('%Y-%m-%d %H:00:00', column)
+    return func.date_trunc('hour', column)
+
+
+def compacted_until(name):
+    """Return the checkpoint of a raw table, or None if it was never compacted"""
+    checkpoint = db.session.get(RollupCheckpoint, name)
+    return checkpoint.compacted_until if checkpoint else None
+
+
+def _start_checkpoint(name, timestamp_column, floor):
+    """Create the checkpoint at the oldest raw row, return None while the table is empty"""
+    checkpoint = db.session.get(RollupCheckpoint, name)
+    if checkpoint:
+        return checkpoint.compacted_until
+    oldest = db.session.query(func.min(timestamp_column)).scalar()
+    if oldest is None:
+        return None
+    try:
+        db.session.add(RollupCheckpoint(name=name, compacted_until=floor(oldest)))
+        db.session.commit()
+    except IntegrityError:
+        # Another process created it first
+        db.session.rollback()
+    return compacted_until(name)
+
+
+def _advance_checkpoint(name, previous, until):
+    """Move the checkpoint forward unless another process already did"""
+    updated = RollupCheckpoint.query.filter_by(name=name, compacted_until=previous)\
+        .update({'compacted_until': until, 'updated_at': datetime.now()}, synchronize_session=False)
+    return updated == 1
+
+
+def _compact_visits(start, end):
+    """Fold the visits in [start, end) into HourlyVisitStats and VisitorStats"""
+    window = (Visit.timestamp >= start, Visit.timestamp < end)
+    hour = _hour_bucket(Visit.timestamp)
+
+    buckets = {}
+    rows = db.session.query(
+        hour,
+        func.count(Visit.id),
+        func.count(func.distinct(Visit.visitor_id)),
+        func.coalesce(func.sum(Visit.duration), 0),
+        func.coalesce(func.sum(case((Visit.duration < BOUNCE_SECONDS, 1), else_=0)), 0)
+    ).filter(*window).group_by(hour).all()
+    for bucket, visits, unique_visitors, duration_sum, bounced in rows:
+        bucket = _as_datetime(bucket)
+        buckets[bucket] = HourlyVisitStats(
+            hour=bucket,
+            visits=visits,
+            unique_visitors=unique_visitors,
+            new_visitors=0,
+            duration_sum=duration_sum,
+            bounced_visits=bounced
+        )
+
+    seen = db.session.query(
+        Visit.visitor_id,
+        func.min(Visit.timestamp),
+        func.max(Visit.timestamp),
+        func.count(Visit.id)
+    ).filter(*window).group_by(Visit.visitor_id).all()
+    known = {}
+    for chunk in _chunks([visitor_id for visitor_id, _, _, _ in seen]):
+        known.update((stats.visitor_id, stats) for stats in
+                     VisitorStats.query.filter(VisitorStats.visitor_id.in_(chunk)))
+    for visitor_id, first_seen, last_seen, visits in seen:
+        stats = known.get(visitor_id)
+        if stats is None:
+            db.session.add(VisitorStats(visitor_id=visitor_id, first_seen=first_seen,
+                                        last_seen=last_seen, visits=visits))
+            buckets[floor_hour(first_seen)].new_visitors += 1
+        else:
+            stats.last_seen = max(stats.last_seen, last_seen)
+            stats.visits += visits
+
+    HourlyVisitStats.query.filter(HourlyVisitStats.hour >= start, HourlyVisitStats.hour < end)\
+        .delete(synchronize_session=False)
+    db.session.add_all(buckets.values())
+
+
+def _compact_exhibitor_analytics(start, end):
+    """Fold the exhibitor actions in [start, end) into DailyExhibitorStats"""
+    day = func.date(ExhibitorAnalytics.created_at)
+    rows = db.session.query(
+        ExhibitorAnalytics.exhibitor_id,
+        day,
+        ExhibitorAnalytics.action_type,
+        func.count(ExhibitorAnalytics.id),
+        func.count(func.distinct(ExhibitorAnalytics.user_id)),
+        func.coalesce(func.sum(ExhibitorAnalytics.session_duration), 0)
+    ).filter(
+        ExhibitorAnalytics.created_at >= start,
+        ExhibitorAnalytics.created_at < end
+    ).group_by(ExhibitorAnalytics.exhibitor_id, day, ExhibitorAnalytics.action_type).all()
+
+    DailyExhibitorStats.query.filter(
+        DailyExhibitorStats.day >= start.date(),
+        DailyExhibitorStats.day < end.date()
+    ).delete(synchronize_session=False)
+    db.session.add_all(
+        DailyExhibitorStats(
+            exhibitor_id=exhibitor_id,
+            day=_as_date(bucket),
+            action_type=action_type,
+            events=events,
+            unique_visitors=unique_visitors,
+            duration_sum=duration_sum
+        )
+        for exhibitor_id, bucket, action_type, events, unique_visitors, duration_sum in rows
+    )
+
+
+def _compact(name, timestamp_column, floor, cutoff, compact_window):
+    """Run compact_window one step at a time up to cutoff, return the number of steps"""
+    start = _start_checkpoint(name, timestamp_column, floor)
+    steps = 0
+    while start is not None and start < cutoff:
+        end = min(start + COMPACTION_STEP, cutoff)
+        try:
+            compact_window(start, end)
+            if not _advance_checkpoint(name, start, end):
+                db.session.rollback()
+                break
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        start = end
+        steps += 1
+    return steps
+
+
+def compact_analytics():
+    """Fold every closed bucket into the rollup tables"""
+    # Visit.timestamp is stored in UTC, ExhibitorAnalytics.created_at in local time
+    return {
+        VISITS: _compact(VISITS, Visit.timestamp, floor_hour,
+                         floor_hour(datetime.utcnow() - SETTLE_TIME), _compact_visits),
+        EXHIBITOR_ANALYTICS: _compact(EXHIBITOR_ANALYTICS, ExhibitorAnalytics.created_at, floor_day,
+                                      floor_day(datetime.now() - SETTLE_TIME), _compact_exhibitor_analytics),
+    }
+
+
+# Readers - rollups plus the raw tail since the checkpoint
+
+def _visits_tail():
+    """Filter for the visits that are not in the rollups yet"""
+    until = compacted_until(VISITS)
+    return Visit.timestamp >= until if until else Visit.timestamp.isnot(None)
+
+
+def visit_totals():
+    """Return (visits, duration_sum, bounced_visits) over all visits"""
+    rolled = db.session.query(
+        func.coalesce(func.sum(HourlyVisitStats.visits), 0),
+        func.coalesce(func.sum(HourlyVisitStats.duration_sum), 0),
+        func.coalesce(func.sum(HourlyVisitStats.bounced_visits), 0)
+    ).one()
+    tail = db.session.query(
+        func.count(Visit.id),
+        func.coalesce(func.sum(Visit.duration), 0),
+        func.coalesce(func.sum(case((Visit.duration < BOUNCE_SECONDS, 1), else_=0)), 0)
+    ).filter(_visits_tail()).one()
+    return tuple(a + b for a, b in zip(rolled, tail))
+
+
+def _tail_visitors():
+    """Subquery of (visitor_id, first_seen, visits) for the visitors in the tail"""
+    return db.session.query(
+        Visit.visitor_id.label('visitor_id'),
+        func.min(Visit.timestamp).label('first_seen'),
+        func.count(Visit.id).label('visits')
+    ).filter(_visits_tail()).group_by(Visit.visitor_id).subquery()
+
+
+def visitor_counts():
+    """Return (unique_visitors, repeat_visitors) over all visits"""
+    unique_visitors = VisitorStats.query.count()
+    repeat_visitors = VisitorStats.query.filter(VisitorStats.visits > 1).count()
+    tail = _tail_visitors()
+    previous = func.coalesce(VisitorStats.visits, 0)
+    new_visitors, new_repeat_visitors = db.session.query(
+        func.count(func.distinct(case((previous == 0, tail.c.visitor_id)))),
+        func.count(func.distinct(case((and_(previous <= 1, previous + tail.c.visits > 1), tail.c.visitor_id))))
+    ).select_from(tail).outerjoin(VisitorStats, VisitorStats.visitor_id == tail.c.visitor_id).one()
+    return unique_visitors + new_visitors, repeat_visitors + new_repeat_visitors
+
+
+def visits_by_day(since=None, visitor_type='all'):
+    """Return {'YYYY-MM-DD': visits} for visits newer than since
+
+    visitor_type 'new' counts first visits only, 'returning' every later visit.
+    """
+    if visitor_type not in ('new', 'returning'):
+        visitor_type = 'all'
+
+    if visitor_type == 'new':
+        measure = HourlyVisitStats.new_visitors
+    elif visitor_type == 'returning':
+        measure = HourlyVisitStats.visits - HourlyVisitStats.new_visitors
+    else:
+        measure = HourlyVisitStats.visits
+
+    day = func.date(HourlyVisitStats.hour)
+    query = db.session.query(day, func.sum(measure))
+    if since:
+        query = query.filter(HourlyVisitStats.hour >= since)
+    counts = {str(bucket): total for bucket, total in query.group_by(day).all() if total}
+
+    def add(key, amount):
+        if amount:
+            counts[key] = counts.get(key, 0) + amount
+
+    tail_visits = {}
+    if visitor_type != 'new':
+        tail_day = func.date(Visit.timestamp)
+        tail = db.session.query(tail_day, func.count(Visit.id)).filter(_visits_tail())
+        if since:
+            tail = tail.filter(Visit.timestamp >= since)
+        tail_visits = {str(bucket): total for bucket, total in tail.group_by(tail_day).all()}
+
+    tail_new = {}
+    if visitor_type != 'all':
+        # New visits are the first visits of the visitors missing from VisitorStats
+        tail = _tail_visitors()
+        first_day = func.date(tail.c.first_seen)
+        query = db.session.query(first_day, func.count(tail.c.visitor_id))\
+            .select_from(tail)\
+            .outerjoin(VisitorStats, VisitorStats.visitor_id == tail.c.visitor_id)\
+            .filter(VisitorStats.visitor_id.is_(None))
+        if since:
+            query = query.filter(tail.c.first_seen >= since)
+        tail_new = {str(bucket): total for bucket, total in query.group_by(first_day).all()}
+
+    for key in tail_visits.keys() | tail_new.keys():
+        if visitor_type == 'new':
+            add(key, tail_new.get(key, 0))
+        elif visitor_type == 'returning':
+            add(key, tail_visits.get(key, 0) - tail_new.get(key, 0))
+        else:
+            add(key, tail_visits.get(key, 0))
+    return counts
+
+
+def visits_by_hour_of_day():
+    """Return {hour 0-23: (visits, duration_sum)} over all visits"""
+    totals = {}
+    hour = func.extract('hour', HourlyVisitStats.hour)
+    for bucket, visits, duration_sum in db.session.query(
+            hour, func.sum(HourlyVisitStats.visits), func.sum(HourlyVisitStats.duration_sum))\
+            .group_by(hour).all():
+        totals[int(bucket)] = (visits, duration_sum)
+
+    tail_hour = func.extract('hour', Visit.timestamp)
+    for bucket, visits, duration_sum in db.session.query(
+            tail_hour, func.count(Visit.id), func.coalesce(func.sum(Visit.duration), 0))\
+            .filter(_visits_tail())\
+            .group_by(tail_hour).all():
+        rolled_visits, rolled_duration = totals.get(int(bucket), (0, 0))
+        totals[int(bucket)] = (rolled_visits + visits, rolled_duration + duration_sum)
+    return totals
+
+
+def exhibitor_action_counts(exhibitor_id):
+    """Return {action_type: events} for one exhibitor"""
+    counts = dict(
+        db.session.query(DailyExhibitorStats.action_type, func.sum(DailyExhibitorStats.events))
+        .filter(DailyExhibitorStats.exhibitor_id == exhibitor_id)
+        .group_by(DailyExhibitorStats.action_type)
+        .all()
+    )
+    until = compacted_until(EXHIBITOR_ANALYTICS)
+    tail = db.session.query(ExhibitorAnalytics.action_type, func.count(ExhibitorAnalytics.id))\
+        .filter(ExhibitorAnalytics.exhibitor_id == exhibitor_id)
+    if until:
+        tail = tail.filter(ExhibitorAnalytics.created_at >= until)
+    for action_type, events in tail.group_by(ExhibitorAnalytics.action_type).all():
+        counts[action_type] = counts.get(action_type, 0) + events
+    return counts
+
+
+def start_compaction_worker(app, interval):
+    """Run compact_analytics() every interval seconds in a daemon thread"""
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            with app.app_context():
+                try:
+                    steps = compact_analytics()
+                    if any(steps.values()):
+                        app.logger.info(f"Analytics compacted: {steps}")
+                except Exception as e:
+                    app.logger.error(f"Error compacting analytics: {str(e)}")
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name='analytics-compaction', daemon=True)
+    thread.start()
+    return stop
+
+
+def init_analytics_rollup(app):
+    """Register the compact-analytics command and start the background job"""
+
+    @app.cli.command('compact-analytics')
+    def compact_analytics_command():
+        """Fold raw analytics rows into the rollup tables"""
+        print(compact_analytics())
+
+    interval = app.config.get('ANALYTICS_COMPACTION_INTERVAL', 0)
+    if interval > 0:
+        app.extensions['analytics_compaction'] = start_compaction_worker(app, interval)
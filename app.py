@@ -5,6 +5,11 @@ import os
 from werkzeug.middleware.proxy_fix import ProxyFix
 import logging
 from extensions import db, migrate, socketio
+from analytics_buffer import analytics_buffer
+from database import (
+    MIGRATIONS_DIR, READ_BIND, create_schema, database_url, database_settings, engine_options, init_sqlite,
+    init_sqlite_replica, read_database_url
+)
 from flask_migrate import Migrate
 import socket_handlers  # Import socket handlers
 from dotenv import load_dotenv  # Load environment variables from .env file
@@ -30,35 +35,52 @@ def create_app():
     
     # Set up database configuration
     db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "food_exhibit.db")
-    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url(db_path)
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-        "pool_pre_ping": True,
-        "pool_recycle": 300,
-        "pool_timeout": 30,
-        "pool_size": 10,
-        "max_overflow": 20
-    }
+    # Engine profile per dialect - SQLite pragmas and write queue, PostgreSQL pool sizing (see database.py)
+    app.config.update(database_settings())
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"], app.config)
+    # Optional read replica for the @read_only views
+    read_url = read_database_url()
+    if read_url:
+        app.config["SQLALCHEMY_BINDS"] = {READ_BIND: {"url": read_url, **engine_options(read_url, app.config)}}
+    # Page-view analytics are queued and written in batches (see analytics_buffer.py)
+    app.config["ANALYTICS_BUFFER_SIZE"] = int(os.environ.get("ANALYTICS_BUFFER_SIZE", 10000))
+    app.config["ANALYTICS_BATCH_SIZE"] = int(os.environ.get("ANALYTICS_BATCH_SIZE", 500))
+    app.config["ANALYTICS_FLUSH_INTERVAL"] = float(os.environ.get("ANALYTICS_FLUSH_INTERVAL", 2.0))
+    app.config["ANALYTICS_BACKPRESSURE"] = os.environ.get("ANALYTICS_BACKPRESSURE", "drop_oldest")
+    # Seconds before other workers notice a gallery change (see gallery_cache.py)
+    app.config["GALLERY_VERSION_CHECK_SECONDS"] = float(os.environ.get("GALLERY_VERSION_CHECK_SECONDS", 5))
+    # Seconds before other workers notice a schedule change, 0 checks on every lookup (see schedule_index.py)
+    app.config["SCHEDULE_VERSION_CHECK_SECONDS"] = float(os.environ.get("SCHEDULE_VERSION_CHECK_SECONDS", 0))
+    app.config["SCHEDULE_INDEX_CACHE_SIZE"] = int(os.environ.get("SCHEDULE_INDEX_CACHE_SIZE", 1000))
+    # Seconds between analytics rollup compactions, 0 disables the background job
+    app.config["ANALYTICS_COMPACTION_INTERVAL"] = int(os.environ.get("ANALYTICS_COMPACTION_INTERVAL", 300))
+    # Chatbot session state - "memory" per worker or "database" shared by all workers (see state_store.py)
+    app.config["CHATBOT_STATE_BACKEND"] = os.environ.get("CHATBOT_STATE_BACKEND", "memory")
+    app.config["CHATBOT_STATE_TTL"] = int(os.environ.get("CHATBOT_STATE_TTL", 1800))
+    app.config["CHATBOT_STATE_MAX_ENTRIES"] = int(os.environ.get("CHATBOT_STATE_MAX_ENTRIES", 10000))
+    # Build the chatbot and connect to the AI provider in the background at startup (see provider_registry.py)
+    app.config["CHATBOT_WARMUP"] = os.environ.get("CHATBOT_WARMUP", "1") == "1"
 
     # Initialize extensions with app
     db.init_app(app)
-    migrate.init_app(app, db)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            init_sqlite(app, db.engine)
+        if read_url and db.engines[READ_BIND].dialect.name == 'sqlite':
+            init_sqlite_replica(app, db.engines[READ_BIND])
+    migrate.init_app(app, db, directory=MIGRATIONS_DIR)
     socketio.init_app(app)
+    analytics_buffer.init_app(app)
 
     # Create database directory if it doesn't exist
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     
-    # Create database and tables if they don't exist
+    # Create an empty database, anything else is left to `flask db upgrade`
     with app.app_context():
         try:
-            if not os.path.exists(db_path):
-                db.create_all()
-                app.logger.info("Database created successfully!")
-            else:
-                # Verify database connection and create tables if needed
-                db.engine.connect()
-                db.create_all()
-                app.logger.info("Database verified and tables updated if needed!")
+            create_schema(app, db)
         except Exception as e:
             app.logger.error(f"Error initializing database: {str(e)}")
 
@@ -86,6 +108,18 @@ def create_app():
         # Register chatbot routes
         register_chatbot_routes(app)
 
+    # In-memory gallery hall snapshots
+    from gallery_cache import gallery_cache
+    gallery_cache.init_app(app)
+
+    # Per-exhibitor schedule interval indexes
+    from schedule_index import schedule_indexes
+    schedule_indexes.init_app(app)
+
+    # Fold raw analytics into the rollup tables in the background
+    from analytics_rollup import init_analytics_rollup
+    init_analytics_rollup(app)
+
     # Language settings
     @app.before_request
     def before_request():
@@ -0,0 +1,378 @@
+"""
+Availability calendar - تقويم المواعيد المتاحة
+
+exhibitor_profile() and /api/available-slots used to expand every
+AvailabilitySchedule over the next 30 days and check each slot against the
+bookings of that day. The free slots are now materialized in
+availability_days: one row per schedule and day holding a bitmap, bit k set
+when slot k (first_slot + k * session_duration) is free. A schedule repeats
+weekly on day_of_week, or covers a single day when on_date is set.
+
+Rows are built the first time a day is read, in their own transaction that
+reads the bookings and stores the rows while holding off booking writers of
+the same exhibitors: BEGIN IMMEDIATE takes the database write lock on
+SQLite, and on other databases the exhibitor rows are locked FOR NO KEY
+UPDATE, which waits for (and blocks) the FOR SHARE lock every booking
+change takes on its exhibitor row. A booking is therefore either visible to
+the build or flips the bit of the stored row afterwards. If the lock is not
+granted in time, the read gets rows built in memory from the committed
+bookings and nothing is stored. After that the
+rows are kept current in the transaction of every change:
+    Booking created, cancelled, moved or deleted  flip the bit of its slot
+    AvailabilitySchedule edited                   drop the schedule's rows
+    bulk UPDATE/DELETE on either table            drop every row
+Dropped rows are rebuilt on the next read, so reading 30 days of
+availability is a single indexed query in steady state.
+"""
+
+import logging
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import and_, delete, event, func, inspect, insert, select, update
+from sqlalchemy.exc import DBAPIError
+
+from database import serialized_write
+from extensions import db
+from models import BOOKING_ACTIVE_STATUSES, AvailabilityDay, AvailabilitySchedule, Booking, User
+
+logger = logging.getLogger(__name__)
+
+# Bookings in these states hold their slot
+ACTIVE_STATUSES = BOOKING_ACTIVE_STATUSES
+
+CALENDAR_DAYS = 30
+
+BOOKING_FIELDS = ('exhibitor_id', 'booking_date', 'start_time', 'end_time', 'status')
+# Changing any of these reshapes the slots of a schedule
+SCHEDULE_FIELDS = ('exhibitor_id', 'day_of_week', 'on_date', 'start_time', 'end_time', 'session_duration', 'is_active')
+
+days_table = AvailabilityDay.__table__
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _time(minutes):
+    return time(minutes // 60, minutes % 60)
+
+
+def schedule_slot_count(schedule):
+    """Number of whole sessions between the start and end of a schedule"""
+    if not schedule.session_duration or schedule.session_duration <= 0:
+        return 0
+    return max((_minutes(schedule.end_time) - _minutes(schedule.start_time)) // schedule.session_duration, 0)
+
+
+def slot_index(first_slot, duration, slot_count, start, end):
+    """Index of the slot running from start to end, or None if it is not one of the day's slots"""
+    offset = _minutes(start) - first_slot
+    if duration <= 0 or offset < 0 or offset % duration or _minutes(end) - _minutes(start) != duration:
+        return None
+    index = offset // duration
+    return index if index < slot_count else None
+
+
+def is_schedule_slot(schedule, day, start, end):
+    """True if start-end is one of the sessions of schedule on day"""
+    return schedule.runs_on(day) and slot_index(
+        _minutes(schedule.start_time), schedule.session_duration, schedule_slot_count(schedule), start, end
+    ) is not None
+
+
+def _pack(mask, slot_count):
+    return mask.to_bytes((slot_count + 7) // 8, 'little')
+
+
+def _unpack(free_slots):
+    return int.from_bytes(free_slots or b'', 'little')
+
+
+def build_day(schedule, day, booked_times):
+    """availability_days values of one schedule on one day; booked_times holds (start, end) pairs"""
+    first_slot = _minutes(schedule.start_time)
+    slot_count = schedule_slot_count(schedule)
+    mask = 0
+    for index in range(slot_count):
+        start = first_slot + index * schedule.session_duration
+        if (_time(start), _time(start + schedule.session_duration)) not in booked_times:
+            mask |= 1 << index
+    return {
+        'exhibitor_id': schedule.exhibitor_id,
+        'schedule_id': schedule.id,
+        'day': day,
+        'first_slot': first_slot,
+        'session_duration': schedule.session_duration,
+        'slot_count': slot_count,
+        'free_slots': _pack(mask, slot_count),
+    }
+
+
+def _schedule_days(schedule, start, end):
+    if schedule.on_date is not None:
+        if start <= schedule.on_date <= end:
+            yield schedule.on_date
+        return
+    day = start + timedelta(days=(schedule.day_of_week - start.weekday()) % 7)
+    while day <= end:
+        yield day
+        day += timedelta(days=7)
+
+
+def _free_slots(row):
+    mask = _unpack(row['free_slots'])
+    slots = []
+    for index in range(row['slot_count']):
+        if mask >> index & 1:
+            start = row['first_slot'] + index * row['session_duration']
+            slots.append({
+                'date': row['day'],
+                'start': _time(start),
+                'end': _time(start + row['session_duration']),
+                'schedule_id': row['schedule_id'],
+            })
+    return slots
+
+
+def _row_values(row):
+    return {column.name: getattr(row, column.name) for column in days_table.columns}
+
+
+def available_slots(exhibitor_id, start=None, days=CALENDAR_DAYS, schedule_id=None):
+    """Free slots of an exhibitor's active schedules for days days from start, ordered by date and time"""
+    return slots_by_exhibitor([exhibitor_id], start, days, schedule_id).get(exhibitor_id, [])
+
+
+def slots_by_exhibitor(exhibitor_ids, start=None, days=CALENDAR_DAYS, schedule_id=None):
+    """Free slots of several exhibitors at once, as {exhibitor_id: slots}
+
+    One query reads the schedules with their materialized days; days that
+    are not materialized yet cost one more bookings query for all of them.
+    """
+    start = start or datetime.now().date()
+    end = start + timedelta(days=days - 1)
+    exhibitor_ids = list(exhibitor_ids)
+    if not exhibitor_ids:
+        return {}
+
+    # Active schedules with whatever part of the window is already materialized
+    query = db.session.query(AvailabilitySchedule, AvailabilityDay).outerjoin(
+        AvailabilityDay, and_(
+            AvailabilityDay.schedule_id == AvailabilitySchedule.id,
+            AvailabilityDay.day >= start,
+            AvailabilityDay.day <= end,
+        )
+    ).filter(
+        AvailabilitySchedule.exhibitor_id.in_(exhibitor_ids),
+        AvailabilitySchedule.is_active == True
+    )
+    if schedule_id is not None:
+        query = query.filter(AvailabilitySchedule.id == schedule_id)
+
+    schedules = {}
+    rows = {}
+    for schedule, row in query:
+        schedules[schedule.id] = schedule
+        if row is not None:
+            rows[(row.schedule_id, row.day)] = _row_values(row)
+
+    missing = [
+        (schedule, day)
+        for schedule in schedules.values()
+        for day in _schedule_days(schedule, start, end)
+        if (schedule.id, day) not in rows
+    ]
+    if missing:
+        rows.update(materialize(missing))
+
+    slots = {}
+    for row in rows.values():
+        slots.setdefault(row['exhibitor_id'], []).extend(_free_slots(row))
+    for exhibitor_slots in slots.values():
+        exhibitor_slots.sort(key=lambda slot: (slot['date'], slot['start']))
+    return slots
+
+
+def _booked_times(connection, exhibitor_ids, days):
+    """{(exhibitor_id, day): {(start, end), ...}} of the active bookings on days"""
+    booked = {}
+    for booking in connection.execute(
+        select(Booking.exhibitor_id, Booking.booking_date, Booking.start_time, Booking.end_time).where(
+            Booking.exhibitor_id.in_(exhibitor_ids),
+            Booking.booking_date >= min(days),
+            Booking.booking_date <= max(days),
+            Booking.status.in_(ACTIVE_STATUSES),
+        )
+    ):
+        booked.setdefault((booking.exhibitor_id, booking.booking_date), set()).add(
+            (booking.start_time, booking.end_time))
+    return booked
+
+
+def _build_rows(missing, booked):
+    return {
+        (schedule.id, day): build_day(schedule, day, booked.get((schedule.exhibitor_id, day), ()))
+        for schedule, day in missing
+    }
+
+
+def materialize(missing):
+    """Build and store the rows of (schedule, day) pairs; return them keyed by (schedule_id, day)
+
+    When the write lock cannot be taken in time the rows are built from the
+    bookings as they are now and returned without being stored.
+    """
+    exhibitor_ids = {schedule.exhibitor_id for schedule, _ in missing}
+    days = [day for _, day in missing]
+    rows = None
+    with serialized_write(), db.engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            # Keep bookings of these exhibitors from committing between the read below and the insert
+            if connection.dialect.name == 'sqlite':
+                # pysqlite only sends BEGIN before the first INSERT - take the write lock before reading
+                connection.exec_driver_sql('BEGIN IMMEDIATE')
+            else:
+                connection.execute(
+                    select(User.id).where(User.id.in_(exhibitor_ids)).order_by(User.id)
+                    .with_for_update(key_share=True)
+                )
+            rows = _build_rows(missing, _booked_times(connection, exhibitor_ids, days))
+            connection.execute(delete(days_table).where(
+                days_table.c.exhibitor_id.in_(exhibitor_ids),
+                days_table.c.day < datetime.now().date()
+            ))
+            connection.execute(insert(days_table), list(rows.values()))
+            transaction.commit()
+        except DBAPIError as e:
+            # Another request built the same days first, or the lock timed out - the rows are built next time
+            transaction.rollback()
+            logger.info(f"Availability calendar for exhibitors {sorted(exhibitor_ids)} not stored: "
+                        f"{e.__class__.__name__}")
+            if rows is None:
+                rows = _build_rows(missing, _booked_times(connection, exhibitor_ids, days))
+    return rows
+
+
+# Incremental maintenance - runs inside the transaction that changes bookings or schedules
+
+def _holds_slot(values):
+    return values is not None and (values['status'] or 'pending') in ACTIVE_STATUSES
+
+
+def _booking_values(state, committed):
+    """Column values of a booking before (committed=True) or after the flush"""
+    values = {}
+    for field in BOOKING_FIELDS:
+        history = state.attrs[field].history
+        if committed:
+            values[field] = history.deleted[0] if history.deleted else getattr(state.obj(), field)
+        else:
+            values[field] = getattr(state.obj(), field)
+    return values
+
+
+def _slot_changes(session):
+    """(holds, values) pairs for every booking slot taken or released by this flush"""
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, Booking):
+            new = _booking_values(inspect(obj), committed=False)
+            if _holds_slot(new):
+                changes.append((True, new))
+    for obj in session.dirty:
+        if isinstance(obj, Booking):
+            state = inspect(obj)
+            if not any(state.attrs[field].history.has_changes() for field in BOOKING_FIELDS):
+                continue
+            old = _booking_values(state, committed=True)
+            new = _booking_values(state, committed=False)
+            if old == new:
+                continue
+            if _holds_slot(old):
+                changes.append((False, old))
+            if _holds_slot(new):
+                changes.append((True, new))
+    for obj in session.deleted:
+        if isinstance(obj, Booking):
+            old = _booking_values(inspect(obj), committed=True)
+            if _holds_slot(old):
+                changes.append((False, old))
+    return changes
+
+
+def _changed_schedules(session):
+    schedule_ids = set()
+    for obj in session.dirty:
+        if isinstance(obj, AvailabilitySchedule):
+            attrs = inspect(obj).attrs
+            if any(attrs[field].history.has_changes() for field in SCHEDULE_FIELDS):
+                schedule_ids.add(obj.id)
+    return schedule_ids
+
+
+def _set_slot(connection, values, free):
+    """Flip the bit of a booking's slot in every materialized row of that exhibitor and day"""
+    if free:
+        # Another active booking may still hold the same slot
+        holders = connection.execute(
+            select(func.count(Booking.id)).where(
+                Booking.exhibitor_id == values['exhibitor_id'],
+                Booking.booking_date == values['booking_date'],
+                Booking.start_time == values['start_time'],
+                Booking.end_time == values['end_time'],
+                Booking.status.in_(ACTIVE_STATUSES),
+            )
+        ).scalar()
+        if holders:
+            return
+
+    rows = connection.execute(
+        select(days_table).where(
+            days_table.c.exhibitor_id == values['exhibitor_id'],
+            days_table.c.day == values['booking_date'],
+        ).with_for_update()
+    ).all()
+    for row in rows:
+        index = slot_index(row.first_slot, row.session_duration, row.slot_count,
+                           values['start_time'], values['end_time'])
+        if index is None:
+            continue
+        mask = _unpack(row.free_slots)
+        updated = mask | 1 << index if free else mask & ~(1 << index)
+        if updated != mask:
+            connection.execute(
+                update(days_table).where(days_table.c.id == row.id)
+                .values(free_slots=_pack(updated, row.slot_count))
+            )
+
+
+def _after_flush(session, flush_context):
+    changes = _slot_changes(session)
+    schedule_ids = _changed_schedules(session)
+    if not changes and not schedule_ids:
+        return
+    connection = session.connection()
+    if changes and connection.dialect.name != 'sqlite':
+        # Wait for a materialize() of these exhibitors to commit so _set_slot sees its rows
+        exhibitor_ids = sorted({values['exhibitor_id'] for _, values in changes})
+        connection.execute(
+            select(User.id).where(User.id.in_(exhibitor_ids)).order_by(User.id).with_for_update(read=True)
+        )
+    if schedule_ids:
+        connection.execute(delete(days_table).where(days_table.c.schedule_id.in_(schedule_ids)))
+    for holds, values in changes:
+        _set_slot(connection, values, free=not holds)
+
+
+def _do_orm_execute(orm_execute_state):
+    # Bulk query.update() / query.delete() - the affected exhibitors are unknown
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, (Booking, AvailabilitySchedule)):
+        orm_execute_state.session.connection().execute(delete(days_table))
+
+
+event.listen(db.session, 'after_flush', _after_flush)
+event.listen(db.session, 'do_orm_execute', _do_orm_execute)
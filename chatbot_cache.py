@@ -0,0 +1,394 @@
+"""
+Chatbot response cache - ذاكرة مؤقتة لردود الشات بوت
+
+Most chatbot questions are the same few FAQs asked in slightly different
+spellings. ChatbotManager.get_response() answers those from a ResponseCache
+keyed by (language, normalize_question(text)) instead of calling Gemini or
+ChatGPT. Entries expire after CHATBOT_CACHE_TTL seconds, the least recently
+used one is evicted beyond CHATBOT_CACHE_SIZE entries, and the whole cache
+is dropped when chatbot_guidelines.txt changes (see ChatbotManager).
+
+Paraphrases miss that exact key, so a SemanticCache sits behind it: every
+cached question is embedded as hashed character n-gram TF-IDF over
+SEMANTIC_DIMENSIONS features, and a question whose cosine similarity to a
+cached one in the same language reaches CHATBOT_SEMANTIC_THRESHOLD gets that
+answer. The vectors are stored sparsely; a dense copy folded down to
+PREFILTER_DIMENSIONS shortlists PREFILTER_CANDIDATES rows with one
+matrix-vector product and only those are scored in the full feature space,
+so unrelated questions do not meet on colliding buckets. NumPy is optional -
+without it only the exact tier runs.
+
+Questions that miss both tiers while the same question is already being
+answered join that upstream call through SingleFlight instead of starting
+their own, so a burst of identical questions costs one provider call. A
+waiter gives up after CHATBOT_SINGLE_FLIGHT_WAIT seconds and makes its own
+call, so a stalled leader (a streamed answer whose client stopped reading)
+holds nobody else up.
+"""
+
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import Counter, OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+CACHE_SIZE = int(os.environ.get('CHATBOT_CACHE_SIZE', 5000))
+CACHE_TTL = int(os.environ.get('CHATBOT_CACHE_TTL', 86400))
+SEMANTIC_THRESHOLD = float(os.environ.get('CHATBOT_SEMANTIC_THRESHOLD', 0.88))
+# Seconds a coalesced question waits for the leader before making its own call
+SINGLE_FLIGHT_WAIT = float(os.environ.get('CHATBOT_SINGLE_FLIGHT_WAIT', 20))
+
+# Hashed feature space of the question vectors - stored sparsely, at most
+# SEMANTIC_MAX_FEATURES distinct n-grams per question (longer questions are only cached exactly)
+SEMANTIC_DIMENSIONS = 1 << 14
+SEMANTIC_MAX_FEATURES = 256
+# Dense folded copy used to shortlist the rows scored in the full feature space
+PREFILTER_DIMENSIONS = 256
+PREFILTER_CANDIDATES = 32
+NGRAM_SIZES = (3, 4)
+# Re-weight every stored vector once the cache grew by this fraction since the IDF was fixed
+REWEIGHT_GROWTH = 0.1
+
+# Harakat, superscript alef and Quranic annotation marks, plus tatweel
+_ARABIC_MARKS = re.compile('[\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_WHITESPACE = re.compile(r'\s+')
+_EDGE_PUNCTUATION = '?!.,;:؟،؛'
+
+
+def normalize_question(text: str) -> str:
+    """Cache key text: diacritics and tatweel removed, case folded, whitespace collapsed"""
+    text = unicodedata.normalize('NFKC', text or '')
+    text = _ARABIC_MARKS.sub('', text).casefold()
+    return _WHITESPACE.sub(' ', text).strip().strip(_EDGE_PUNCTUATION).strip()
+
+
+class ResponseCache:
+    """LRU of answers keyed by (language, normalized question) with a TTL"""
+
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl: int = CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (expires at, answer), least recently used first
+        self._entries = OrderedDict()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    @staticmethod
+    def key(language: str, question: str):
+        return (language, normalize_question(question))
+
+    def get(self, language: str, question: str):
+        key = self.key(language, question)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[1]
+
+    def put(self, language: str, question: str, answer: str):
+        key = self.key(language, question)
+        if not key[1]:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.counters['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {
+                'entries': len(self._entries),
+                **self.counters,
+                'hit_rate': round(self.counters['hits'] / lookups, 4) if lookups else 0.0,
+            }
+
+
+def ngram_counts(text: str) -> Counter:
+    """Hashed character n-gram counts of a question, normalized as for the exact cache"""
+    text = f" {normalize_question(text)} "
+    counts = Counter()
+    for size in NGRAM_SIZES:
+        for i in range(len(text) - size + 1):
+            counts[zlib.crc32(text[i:i + size].encode('utf-8')) % SEMANTIC_DIMENSIONS] += 1
+    return counts
+
+
+class SemanticCache:
+    """Answers of cached questions found by cosine similarity of hashed n-gram TF-IDF vectors
+
+    Rows live in preallocated arrays of max_entries rows, each holding the
+    feature ids of a question (padded to SEMANTIC_MAX_FEATURES) with their
+    sublinear term frequencies. The IDF-weighted, L2-normalized weights and
+    their folded _prefilter copy are rebuilt whenever the number of stored
+    questions grew by REWEIGHT_GROWTH since the IDF was last fixed, and new
+    rows are weighted with the current IDF in between. When full, the least
+    recently used row is replaced.
+    """
+
+    available = np is not None
+
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl: int = CACHE_TTL,
+                 threshold: float = SEMANTIC_THRESHOLD):
+        if np is None:
+            raise RuntimeError("numpy is required for the semantic chatbot cache")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._features = np.zeros((max_entries, SEMANTIC_MAX_FEATURES), dtype=np.int16)
+        self._tf = np.zeros((max_entries, SEMANTIC_MAX_FEATURES), dtype=np.float32)  # 0 in padding
+        self._weights = np.zeros((max_entries, SEMANTIC_MAX_FEATURES), dtype=np.float32)
+        self._prefilter = np.zeros((max_entries, PREFILTER_DIMENSIONS), dtype=np.float32)
+        self._df = np.zeros(SEMANTIC_DIMENSIONS, dtype=np.int64)
+        self._expires = np.zeros(max_entries, dtype=np.float64)  # 0 marks an empty row
+        self._used = np.zeros(max_entries, dtype=np.float64)
+        self._languages = np.zeros(max_entries, dtype=np.int16)
+        self._language_codes = {}
+        self._answers = [None] * max_entries
+        self._size = 0  # rows ever filled - rows past it are empty
+        self._idf = np.ones(SEMANTIC_DIMENSIONS, dtype=np.float32)
+        self._weighted_at = 0
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'reweights': 0, 'invalidations': 0}
+
+    @staticmethod
+    def _sparse(counts):
+        """(features, tf) padded to SEMANTIC_MAX_FEATURES, or None for an empty or too long question"""
+        if not counts or len(counts) > SEMANTIC_MAX_FEATURES:
+            return None
+        features = np.zeros(SEMANTIC_MAX_FEATURES, dtype=np.int16)
+        tf = np.zeros(SEMANTIC_MAX_FEATURES, dtype=np.float32)
+        features[:len(counts)] = list(counts)
+        tf[:len(counts)] = [1 + math.log(count) for count in counts.values()]
+        return features, tf
+
+    def _weigh(self, features, tf):
+        """IDF-weighted unit vectors of padded rows"""
+        weighted = tf * self._idf[features]
+        norms = np.linalg.norm(weighted, axis=-1, keepdims=True)
+        return weighted / np.maximum(norms, 1e-12)
+
+    @staticmethod
+    def _fold(features, weights):
+        """Unit vectors of weighted padded rows summed into PREFILTER_DIMENSIONS buckets"""
+        features = features.reshape(-1, SEMANTIC_MAX_FEATURES)
+        count = len(features)
+        index = np.arange(count)[:, None] * PREFILTER_DIMENSIONS + features.astype(np.int64) % PREFILTER_DIMENSIONS
+        folded = np.bincount(index.ravel(), weights=weights.ravel(), minlength=count * PREFILTER_DIMENSIONS)\
+            .reshape(count, PREFILTER_DIMENSIONS).astype(np.float32)
+        folded /= np.maximum(np.linalg.norm(folded, axis=-1, keepdims=True), 1e-12)
+        return folded.reshape(weights.shape[:-1] + (PREFILTER_DIMENSIONS,))
+
+    def _live_rows(self):
+        return int(np.count_nonzero(self._expires[:self._size]))
+
+    def _reweight(self):
+        live = self._live_rows()
+        self._idf = (np.log((1 + live) / (1 + self._df)) + 1).astype(np.float32)
+        empty = self._expires[:self._size] == 0
+        self._weights[:self._size] = self._weigh(self._features[:self._size], self._tf[:self._size])
+        self._weights[:self._size][empty] = 0
+        self._prefilter[:self._size] = self._fold(self._features[:self._size], self._weights[:self._size])
+        self._prefilter[:self._size][empty] = 0
+        self._weighted_at = live
+        self.counters['reweights'] += 1
+
+    def _language(self, language):
+        return self._language_codes.setdefault(language, len(self._language_codes) + 1)
+
+    def get(self, language: str, question: str):
+        sparse = self._sparse(ngram_counts(question))
+        now = time.monotonic()
+        with self._lock:
+            if self._size == 0 or sparse is None:
+                self.counters['misses'] += 1
+                return None
+            features, tf = sparse
+            weights = self._weigh(features, tf)
+            shortlist = self._prefilter[:self._size] @ self._fold(features, weights)
+            shortlist[(self._languages[:self._size] != self._language(language))
+                      | (self._expires[:self._size] <= now)] = -1
+            if self._size > PREFILTER_CANDIDATES:
+                candidates = np.argpartition(shortlist, -PREFILTER_CANDIDATES)[-PREFILTER_CANDIDATES:]
+            else:
+                candidates = np.arange(self._size)
+            candidates = candidates[shortlist[candidates] > -1]
+            if not len(candidates):
+                self.counters['misses'] += 1
+                return None
+            # Exact cosine in the full feature space
+            query = np.zeros(SEMANTIC_DIMENSIONS, dtype=np.float32)
+            np.add.at(query, features, weights)
+            scores = (query[self._features[candidates]] * self._weights[candidates]).sum(axis=1)
+            best = int(np.argmax(scores))
+            row = int(candidates[best])
+            if scores[best] < self.threshold:
+                self.counters['misses'] += 1
+                return None
+            self._used[row] = now
+            self.counters['hits'] += 1
+            return self._answers[row]
+
+    def _free_row(self, now):
+        """Index of an empty, expired or else least recently used row"""
+        if self._size < self.max_entries:
+            self._size += 1
+            return self._size - 1
+        expired = np.flatnonzero(self._expires <= now)
+        if len(expired):
+            row = int(expired[0])
+        else:
+            row = int(np.argmin(self._used))
+            self.counters['evictions'] += 1
+        if self._expires[row]:
+            self._df[self._features[row][self._tf[row] > 0]] -= 1
+        return row
+
+    def put(self, language: str, question: str, answer: str):
+        sparse = self._sparse(ngram_counts(question))
+        if sparse is None:
+            return
+        features, tf = sparse
+        now = time.monotonic()
+        with self._lock:
+            row = self._free_row(now)
+            self._features[row] = features
+            self._tf[row] = tf
+            self._df[features[tf > 0]] += 1
+            self._expires[row] = now + self.ttl
+            self._used[row] = now
+            self._languages[row] = self._language(language)
+            self._answers[row] = answer
+            if self._live_rows() > self._weighted_at * (1 + REWEIGHT_GROWTH):
+                self._reweight()
+            else:
+                self._weights[row] = self._weigh(features, tf)
+                self._prefilter[row] = self._fold(features, self._weights[row])
+
+    def clear(self):
+        with self._lock:
+            self._expires[:] = 0
+            self._weights[:] = 0
+            self._prefilter[:] = 0
+            self._df[:] = 0
+            self._answers = [None] * self.max_entries
+            self._size = 0
+            self._weighted_at = 0
+            self.counters['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {
+                'entries': self._live_rows(),
+                **self.counters,
+                'hit_rate': round(self.counters['hits'] / lookups, 4) if lookups else 0.0,
+                'threshold': self.threshold,
+            }
+
+
+class FlightTimeout(TimeoutError):
+    """The leader of a flight did not land within the wait timeout"""
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share the first caller's result
+
+    The first caller of a key leads: it runs the call and finish()es the
+    flight. Callers arriving before that wait up to wait_timeout seconds for
+    the leader and get its result (or its exception) - nothing is kept once
+    the flight lands.
+    """
+
+    def __init__(self, wait_timeout: float = SINGLE_FLIGHT_WAIT):
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.counters = {'leaders': 0, 'coalesced': 0, 'failed': 0, 'wait_timeouts': 0}
+
+    def join(self, key):
+        """(flight, True) for the leader of key, else (flight, False) for a waiter"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.counters['coalesced'] += 1
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            self.counters['leaders'] += 1
+            return flight, True
+
+    def finish(self, key, flight, result=None, error=None):
+        """Hand the leader's result to the waiters of its flight"""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if error is not None:
+                self.counters['failed'] += 1
+        flight.result = result
+        flight.error = error
+        flight.done.set()
+
+    def wait(self, flight):
+        """The leader's result - raises FlightTimeout after wait_timeout seconds"""
+        if not flight.done.wait(self.wait_timeout):
+            with self._lock:
+                self.counters['wait_timeouts'] += 1
+            raise FlightTimeout(f"no result within {self.wait_timeout} s")
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def do(self, key, fn):
+        """fn() - or the result of the identical call already in flight"""
+        flight, leader = self.join(key)
+        if not leader:
+            try:
+                return self.wait(flight)
+            except FlightTimeout:
+                # The leader is stuck - make our own call
+                return fn()
+        try:
+            result = fn()
+        except Exception as e:
+            self.finish(key, flight, error=e)
+            raise
+        self.finish(key, flight, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            calls = self.counters['leaders'] + self.counters['coalesced']
+            return {
+                'in_flight': len(self._flights),
+                **self.counters,
+                'coalesced_rate': round(self.counters['coalesced'] / calls, 4) if calls else 0.0,
+            }
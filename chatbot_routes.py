@@ -3,14 +3,23 @@ Chatbot Routes for AI-powered chat integration
 مسارات الشات بوت الذكي
 """
 
-from flask import Blueprint, request, jsonify, session, current_app, render_template
+from flask import Blueprint, Response, request, jsonify, session, current_app, render_template, stream_with_context
 from flask_login import login_required, current_user
 from datetime import datetime
+import inspect
+import json
+import uuid
 from extensions import db
 from models import ChatMessage, User, Specialization, Package
 from werkzeug.security import generate_password_hash
 import logging
-from ai_chatbot import get_chatbot, handle_user_registration, validate_registration_data, detect_language
+from state_store import StateStore
+from intent_matcher import match_message
+from ai_chatbot import (
+    get_chatbot, handle_user_registration, validate_registration_data, detect_language, set_history_loader,
+    start_chatbot_warmup
+)
+from provider_registry import provider_registry
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,11 +29,20 @@ logger = logging.getLogger(__name__)
 chatbot_bp = Blueprint('chatbot', __name__, url_prefix='/api/chatbot')
 
 # Store conversation contexts per user
-conversation_contexts = {}
+conversation_contexts = StateStore('conversation_contexts')
 # Store registration state per user session
-registration_state = {}
+registration_state = StateStore('registration_state')
 # Store message drafts per user
-message_drafts = {}
+message_drafts = StateStore('message_drafts')
+
+STATE_STORES = (conversation_contexts, registration_state, message_drafts)
+
+
+def chatbot_session_id():
+    """Key of the chat session's state - kept in the session cookie so every worker sees it"""
+    if 'chatbot_session' not in session:
+        session['chatbot_session'] = uuid.uuid4().hex
+    return session['chatbot_session']
 
 
 @chatbot_bp.route('/', methods=['GET'])
@@ -52,9 +70,44 @@ def chat_with_bot():
     
     Response will be in the same language as the user's message
     """
+    return handle_chat_message(request.get_json())
+
+
+@chatbot_bp.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming variant of /chat - Server-Sent Events
+    
+    Takes the same JSON body. A normal chat answer arrives as "chunk" events
+    with {"chunk": "..."} while the AI generates it, then one "done" event
+    with the fields /chat returns. Registration, account status and email
+    flow steps (and errors) are answered with plain JSON as by /chat.
+    """
+    result = handle_chat_message(request.get_json(), stream=True)
+    if not inspect.isgenerator(result):
+        return result
+    return Response(stream_with_context(sse_events(result)), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Stop nginx from buffering the stream
+        'X-Accel-Buffering': 'no',
+    })
+
+
+def sse_events(events):
+    for event in events:
+        name = 'done' if event.get('done') else 'chunk'
+        yield f"event: {name}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def handle_chat_message(data, stream: bool = False):
+    """
+    Answer one chat message (see chat_with_bot)
+    
+    With stream=True a normal chat answer is returned as a generator of
+    chatbot.stream_response events (see stream_chat_reply); everything else
+    is returned as a JSON response either way.
+    """
     try:
-        data = request.get_json()
-        
         if not data or 'message' not in data:
             return jsonify({
                 'status': 'error',
@@ -74,19 +127,19 @@ def chat_with_bot():
         user_id = current_user.id if current_user.is_authenticated else None
         
         # Get session ID for registration tracking
-        session_id = session.get('id', request.remote_addr)
-        
-        # Initialize registration state for this session if needed
-        if session_id not in registration_state:
-            registration_state[session_id] = {}
+        session_id = chatbot_session_id()
         
-        user_state = registration_state[session_id]
+        # Registration state of this session - written back once the message is handled
+        user_state = registration_state.get(session_id, {})
+        had_state = bool(user_state)
         
         try:
             # 1️⃣ Check if user wants to register
             from ai_chatbot import detect_account_status_request, detect_email_request
             
-            reg_check = handle_user_registration(user_message, user_id)
+            # Intents and language of the message in one scan
+            intents = match_message(user_message)
+            reg_check = handle_user_registration(user_message, user_id, intents)
             
             if reg_check['action'] == 'start_registration':
                 # Start registration flow
@@ -104,8 +157,8 @@ def chat_with_bot():
                 }), 200
             
             # 2️⃣ Check if user wants to check account status
-            elif detect_account_status_request(user_message):
-                language = detect_language(user_message)
+            elif detect_account_status_request(user_message, intents):
+                language = intents.language
                 
                 if language == 'ar':
                     ask_msg = 'لأتحقق من حالة حسابك، أحتاج إلى بريدك الإلكتروني. ما هو بريدك؟'
@@ -136,8 +189,8 @@ def chat_with_bot():
                 return status_response
             
             # 4️⃣ Check if user wants to create a company email
-            elif detect_email_request(user_message):
-                language = detect_language(user_message)
+            elif detect_email_request(user_message, intents):
+                language = intents.language
                 
                 if language == 'ar':
                     ask_msg = 'حسناً! لإنشاء رسالة بريدية للشركة، أحتاج إلى:\n\n1️⃣ بريدك الإلكتروني (عنوان البريد المسجل)\n\nما هو بريدك؟'
@@ -170,40 +223,19 @@ def chat_with_bot():
                 # Get chatbot instance
                 chatbot = get_chatbot()
                 
-                # Get or initialize user conversation context
-                context_key = f"user_{user_id}_{conversation_id or 'default'}"
+                # Anonymous visitors keep one conversation set per session
+                if not user_id:
+                    conversation_id = f"{session_id}:{conversation_id or 'default'}"
+                
+                if stream:
+                    return stream_chat_reply(chatbot, user_message, user_id, conversation_id)
                 
                 # Get response from AI (language will be auto-detected)
-                response = chatbot.get_response(user_message, user_id=user_id)
+                response = chatbot.get_response(user_message, user_id=user_id, conversation_id=conversation_id)
                 
                 # Save conversation to database if user is logged in
                 if user_id and response['success']:
-                    try:
-                        # Save user message
-                        user_msg = ChatMessage(
-                            sender_id=user_id,
-                            receiver_id=None,  # Null for bot messages
-                            message=user_message,
-                            timestamp=datetime.now(),
-                            is_read=False
-                        )
-                        db.session.add(user_msg)
-                        
-                        # Save bot response
-                        bot_msg = ChatMessage(
-                            sender_id=None,  # Null for bot
-                            receiver_id=user_id,
-                            message=response['response'],
-                            timestamp=datetime.now(),
-                            is_read=True  # Bot messages are already "read"
-                        )
-                        db.session.add(bot_msg)
-                        db.session.commit()
-                        
-                    except Exception as db_error:
-                        logger.error(f"Error saving chat message: {str(db_error)}")
-                        db.session.rollback()
-                        # Continue even if save fails
+                    save_chat_exchange(user_id, conversation_id, user_message, response['response'])
                 
                 return jsonify({
                     'status': 'success',
@@ -221,6 +253,13 @@ def chat_with_bot():
                 'error': str(ai_error)
             }), 500
         
+        finally:
+            # Sessions that never started a flow store nothing
+            if user_state:
+                registration_state.set(session_id, user_state)
+            elif had_state:
+                registration_state.delete(session_id)
+        
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
         return jsonify({
@@ -230,6 +269,46 @@ def chat_with_bot():
         }), 500
 
 
+def stream_chat_reply(chatbot, user_message: str, user_id: int, conversation_id: str):
+    """chatbot.stream_response events, saving the exchange like /chat once it is complete"""
+    for event in chatbot.stream_response(user_message, user_id=user_id, conversation_id=conversation_id):
+        if event.get('done') and user_id and event['success']:
+            save_chat_exchange(user_id, conversation_id, user_message, event['response'])
+        yield event
+
+
+def save_chat_exchange(user_id: int, conversation_id: str, user_message: str, bot_response: str):
+    """Store a question to the chatbot and its answer as ChatMessage rows"""
+    try:
+        # Save user message
+        user_msg = ChatMessage(
+            sender_id=user_id,
+            receiver_id=None,  # Null for bot messages
+            conversation_id=conversation_id or 'default',
+            message=user_message,
+            timestamp=datetime.now(),
+            is_read=False
+        )
+        db.session.add(user_msg)
+        
+        # Save bot response
+        bot_msg = ChatMessage(
+            sender_id=None,  # Null for bot
+            receiver_id=user_id,
+            conversation_id=conversation_id or 'default',
+            message=bot_response,
+            timestamp=datetime.now(),
+            is_read=True  # Bot messages are already "read"
+        )
+        db.session.add(bot_msg)
+        db.session.commit()
+        
+    except Exception as db_error:
+        logger.error(f"Error saving chat message: {str(db_error)}")
+        db.session.rollback()
+        # Continue even if save fails
+
+
 def handle_registration_input(user_message: str, session_id: str, user_state: dict):
     """
     Handle user input during registration process
@@ -361,7 +440,8 @@ def handle_registration_input(user_message: str, session_id: str, user_state: di
                     'timestamp': datetime.now().isoformat()
                 }), 200
             
-            reg_data['password'] = user_message
+            # Only the hash is kept in the registration state
+            reg_data['password_hash'] = generate_password_hash(user_message, method='scrypt')
             user_state['data'] = reg_data
             user_state['step'] = 'phone'
             
@@ -625,7 +705,7 @@ def handle_registration_input(user_message: str, session_id: str, user_state: di
             
             if is_confirmed:
                 # Create the account
-                return create_account_from_registration(reg_data, session_id, language)
+                return create_account_from_registration(reg_data, session_id, language, user_state)
             else:
                 # Cancel registration
                 user_state['registering'] = False
@@ -936,7 +1016,7 @@ Or do you want to modify the subject and regenerate? (type: edit)"""
                     'status': 'draft'
                 }
                 
-                message_drafts[message_id] = email_draft
+                message_drafts.set(message_id, email_draft)
                 
                 # رسالة النجاح
                 if language == 'ar':
@@ -1077,7 +1157,7 @@ def format_exhibitor_summary(data: dict, language: str) -> str:
 """
 
 
-def create_account_from_registration(reg_data: dict, session_id: str, language: str) -> tuple:
+def create_account_from_registration(reg_data: dict, session_id: str, language: str, user_state: dict) -> tuple:
     """
     Create user account from registration data
     Handles both regular users and exhibitors with full company details
@@ -1086,6 +1166,7 @@ def create_account_from_registration(reg_data: dict, session_id: str, language:
         reg_data: Dictionary with user registration data
         session_id: Session ID for cleanup
         language: User's language preference
+        user_state: Registration state of the session, emptied once the account exists
         
     Returns:
         JSON response with status
@@ -1167,7 +1248,7 @@ def create_account_from_registration(reg_data: dict, session_id: str, language:
         # Create new user
         new_user = User(
             email=reg_data['email'],
-            password=generate_password_hash(reg_data['password'], method='scrypt'),
+            password=reg_data['password_hash'],
             first_name=reg_data['first_name'],
             last_name=reg_data['last_name'],
             role=reg_data.get('role', 'user'),
@@ -1186,8 +1267,8 @@ def create_account_from_registration(reg_data: dict, session_id: str, language:
         db.session.commit()
         
         # Clean up registration state
-        if session_id in registration_state:
-            del registration_state[session_id]
+        user_state.clear()
+        registration_state.delete(session_id)
         
         # Success message
         if language == 'ar':
@@ -1277,7 +1358,7 @@ def quick_answer():
         
         try:
             chatbot = get_chatbot()
-            response = chatbot.get_response(message)
+            response = chatbot.get_response(message, remember=False)
             
             return jsonify({
                 'status': 'success',
@@ -1304,17 +1385,9 @@ def get_conversation_history():
     """
     try:
         # Get all messages where user is involved with chatbot
-        messages = ChatMessage.query.filter(
-            db.or_(
-                ChatMessage.sender_id == current_user.id,
-                ChatMessage.receiver_id == current_user.id
-            )
-        ).filter(
-            db.or_(
-                ChatMessage.sender_id.is_(None),
-                ChatMessage.receiver_id.is_(None)
-            )
-        ).order_by(ChatMessage.timestamp).all()
+        messages = bot_messages(current_user.id, request.args.get('conversation_id')).order_by(
+            ChatMessage.timestamp
+        ).all()
         
         history = []
         for msg in messages:
@@ -1346,20 +1419,16 @@ def clear_conversation_history():
     """
     try:
         # Delete all messages for this user with bot
-        ChatMessage.query.filter(
-            db.or_(
-                ChatMessage.sender_id == current_user.id,
-                ChatMessage.receiver_id == current_user.id
-            )
-        ).filter(
-            db.or_(
-                ChatMessage.sender_id.is_(None),
-                ChatMessage.receiver_id.is_(None)
-            )
-        ).delete()
+        bot_messages(current_user.id).delete(synchronize_session=False)
         
         db.session.commit()
         
+        # The prompt context must not outlive the deleted messages
+        try:
+            get_chatbot().clear_history(current_user.id)
+        except Exception:
+            pass
+        
         return jsonify({
             'status': 'success',
             'message': 'تم حذف السجل'
@@ -1383,13 +1452,22 @@ def get_chatbot_info():
         try:
             chatbot = get_chatbot()
             provider = chatbot.provider_name
+            cache = chatbot.cache.stats()
+            semantic_cache = chatbot.semantic_cache.stats() if chatbot.semantic_cache else None
+            coalescing = chatbot.inflight.stats()
         except:
             provider = 'unknown'
+            cache = None
+            semantic_cache = None
+            coalescing = None
         
         return jsonify({
             'status': 'success',
             'name': 'Esco Fairs AI Assistant',
             'provider': provider,
+            'cache': cache,
+            'semantic_cache': semantic_cache,
+            'coalescing': coalescing,
             'languages': ['ar', 'en'],
             'available': True,
             'message_ar': 'مرحباً! أنا مساعدك الذكي لمعرض Esco Fairs. كيف يمكنني مساعدتك؟',
@@ -1408,14 +1486,26 @@ def get_chatbot_info():
 def health_check():
     """Health check endpoint for chatbot service"""
     try:
+        providers = None
+        registry = provider_registry.stats()
+        warming_up = registry['warmup']['state'] == 'running'
         try:
+            # Not ready until the warmup thread has built the chatbot - don't wait for it here
+            if warming_up:
+                raise RuntimeError('warming up')
             chatbot = get_chatbot()
             is_healthy = chatbot.provider is not None
+            # Timeouts, hedges and the circuit breaker state of each provider
+            providers = chatbot.gateway.stats()
         except:
             is_healthy = False
         
         return jsonify({
-            'status': 'healthy' if is_healthy else 'unhealthy',
+            'status': 'healthy' if is_healthy else 'warming_up' if warming_up else 'unhealthy',
+            'warmup': registry['warmup'],
+            'clients': registry['clients'],
+            'state': {store.namespace: store.stats() for store in STATE_STORES},
+            'providers': providers,
             'timestamp': datetime.now().isoformat()
         }), 200 if is_healthy else 503
         
@@ -1647,7 +1737,7 @@ def create_company_email():
             'status': 'draft'
         }
         
-        message_drafts[message_id] = email_draft
+        message_drafts.set(message_id, email_draft)
         
         # إرجاع النتيجة
         if language == 'ar':
@@ -1708,7 +1798,40 @@ Message ID: `{message_id}`
         }), 500
 
 
+def bot_messages(user_id: int, conversation_id: str = None):
+    """Query of the messages between a user and the chatbot, optionally of one conversation"""
+    query = ChatMessage.query.filter(
+        db.or_(
+            db.and_(ChatMessage.sender_id == user_id, ChatMessage.receiver_id.is_(None)),
+            db.and_(ChatMessage.receiver_id == user_id, ChatMessage.sender_id.is_(None))
+        )
+    )
+    if conversation_id is None:
+        return query
+    if conversation_id == 'default':
+        # Messages saved before conversations were tracked belong to the default one
+        return query.filter(db.or_(ChatMessage.conversation_id == conversation_id,
+                                   ChatMessage.conversation_id.is_(None)))
+    return query.filter(ChatMessage.conversation_id == conversation_id)
+
+
+def load_chat_history(user_id: int, conversation_id: str, limit: int) -> list:
+    """The newest `limit` chatbot messages of a conversation, oldest first (ConversationHistory loader)"""
+    messages = bot_messages(user_id, conversation_id or 'default').order_by(
+        ChatMessage.timestamp.desc(), ChatMessage.id.desc()
+    ).limit(limit).all()
+    return [
+        {'role': 'user' if msg.sender_id == user_id else 'assistant', 'content': msg.message}
+        for msg in reversed(messages)
+    ]
+
+
 # Register blueprint with app
 def register_chatbot_routes(app):
     """Register chatbot routes with Flask app"""
     app.register_blueprint(chatbot_bp)
+    set_history_loader(load_chat_history)
+    for store in STATE_STORES:
+        store.init_app(app)
+    if app.config.get('CHATBOT_WARMUP', True):
+        start_chatbot_warmup()
@@ -0,0 +1,146 @@
+"""
+Availability calendar race check - a booking committed while a day is materialized
+فحص التزامن بين بناء تقويم المواعيد والحجوزات
+
+Creates a throwaway SQLite database with one exhibitor and a weekly schedule,
+then opens a second connection that books tomorrow's first slot and keeps
+its transaction open while available_slots() materializes tomorrow. The
+build has to wait for that booking to commit and store the slot as taken -
+reading the bookings before the write lock is held would store it as free
+and /api/available-slots would keep offering it. Then it holds the write
+lock past the busy timeout while next week's day is read: the read must
+still answer from the committed bookings, without storing the row.
+
+Usage:
+    python check_availability_race.py
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time as timer
+from datetime import datetime, time, timedelta
+
+# Seconds the booking transaction stays open while the calendar is built
+HOLD = 0.5
+# Milliseconds SQLite waits for the write lock
+BUSY_TIMEOUT = 1000
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='availability_race_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'availability.db')}"
+    os.environ['ANALYTICS_COMPACTION_INTERVAL'] = '0'
+    os.environ['CHATBOT_WARMUP'] = '0'
+    os.environ['SQLITE_BUSY_TIMEOUT'] = str(BUSY_TIMEOUT)
+    logging.disable(logging.INFO)
+
+    from sqlalchemy import create_engine, insert
+
+    from app import app
+    from availability_calendar import _free_slots, _row_values, available_slots
+    from extensions import db
+    from models import AvailabilityDay, AvailabilitySchedule, Booking, User
+
+    tomorrow = datetime.now().date() + timedelta(days=1)
+    with app.app_context():
+        db.create_all()
+        exhibitor = User(email='exhibitor@availability.test', password='x', first_name='Race',
+                         last_name='Exhibitor', country='EG', role='exhibitor', company_name='Race Foods')
+        visitor = User(email='visitor@availability.test', password='x', first_name='Visitor', last_name='One',
+                       country='EG')
+        db.session.add_all([exhibitor, visitor])
+        db.session.flush()
+        schedule = AvailabilitySchedule(exhibitor_id=exhibitor.id, day_of_week=tomorrow.weekday(),
+                                        start_time=time(10, 0), end_time=time(12, 0), session_duration=30)
+        db.session.add(schedule)
+        db.session.commit()
+        exhibitor_id, visitor_id, schedule_id = exhibitor.id, visitor.id, schedule.id
+
+    # Another process booking the first slot - outside the app's session hooks and write queue
+    engine = create_engine(os.environ['DATABASE_URL'])
+
+    def book(connection, day):
+        connection.execute(insert(Booking.__table__).values(
+            user_id=visitor_id, exhibitor_id=exhibitor_id, schedule_id=schedule_id, booking_date=day,
+            start_time=time(10, 0), end_time=time(10, 30), status='confirmed',
+            created_at=datetime.now(), updated_at=datetime.now()))
+
+    other = engine.connect()
+    other.exec_driver_sql('BEGIN IMMEDIATE')
+    book(other, tomorrow)
+
+    result = {}
+
+    def read_calendar():
+        with app.app_context():
+            started = timer.perf_counter()
+            result['slots'] = available_slots(exhibitor_id, start=tomorrow, days=1)
+            result['seconds'] = timer.perf_counter() - started
+
+    reader = threading.Thread(target=read_calendar)
+    reader.start()
+    timer.sleep(HOLD)
+    other.commit()
+    other.close()
+    reader.join()
+
+    failures = 0
+
+    def report(ok, message):
+        print(f"[{'ok' if ok else 'FAIL'}] {message}")
+        return not ok
+
+    starts = [slot['start'].strftime('%H:%M') for slot in result['slots']]
+    failures += report(starts == ['10:30', '11:00', '11:30'],
+                       f"calendar built in {result['seconds']:.2f} s offers {starts}")
+
+    with app.app_context():
+        rows = AvailabilityDay.query.filter_by(schedule_id=schedule_id, day=tomorrow).all()
+        stored = [slot['start'].strftime('%H:%M') for row in rows for slot in _free_slots(_row_values(row))]
+        failures += report(len(rows) == 1 and stored == ['10:30', '11:00', '11:30'],
+                           f"stored row has the booked slot taken: {stored}")
+        starts = [slot['start'].strftime('%H:%M') for slot in available_slots(exhibitor_id, start=tomorrow, days=1)]
+        failures += report(starts == ['10:30', '11:00', '11:30'], f"next read offers {starts}")
+
+    # A writer that keeps the lock past the busy timeout
+    next_week = tomorrow + timedelta(days=7)
+    other = engine.connect()
+    book(other, next_week)
+    other.commit()
+    other.exec_driver_sql('BEGIN IMMEDIATE')
+    try:
+        with app.app_context():
+            started = timer.perf_counter()
+            try:
+                slots = available_slots(exhibitor_id, start=next_week, days=1)
+            except Exception as e:
+                slots, error = [], e.__class__.__name__
+            else:
+                error = None
+            seconds = timer.perf_counter() - started
+    finally:
+        other.rollback()
+        other.close()
+    starts = [slot['start'].strftime('%H:%M') for slot in slots]
+    failures += report(error is None and starts == ['10:30', '11:00', '11:30'],
+                       f"read while the lock is held answers in {seconds:.2f} s with {error or starts}")
+    with app.app_context():
+        stored = AvailabilityDay.query.filter_by(schedule_id=schedule_id, day=next_week).count()
+        failures += report(stored == 0, f"nothing stored while the lock was held ({stored} row(s))")
+        starts = [slot['start'].strftime('%H:%M') for slot in available_slots(exhibitor_id, start=next_week, days=1)]
+        stored = AvailabilityDay.query.filter_by(schedule_id=schedule_id, day=next_week).count()
+        failures += report(stored == 1 and starts == ['10:30', '11:00', '11:30'],
+                           f"next read stores the day and offers {starts}")
+
+    if failures:
+        print(f"\n{failures} check(s) failed")
+        return 1
+    print("\nA booking committed during the build is never stored as free, and a held lock never fails a read")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
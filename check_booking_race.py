@@ -0,0 +1,108 @@
+"""
+Concurrent booking check for /book-appointment
+فحص الحجز المتزامن للمواعيد
+
+Creates a throwaway SQLite database, then fires BOOKINGS simultaneous
+requests from different visitors at SLOTS slots of one exhibitor through a
+thread pool. Exactly one request per slot must win; every other one must
+get the "already booked" answer, and the database must hold exactly one
+active booking per slot.
+
+Usage:
+    python check_booking_race.py [bookings] [slots]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+
+WORKERS = 64
+BOOKINGS = 400
+SLOTS = 8
+SESSION_MINUTES = 30
+
+
+def main(bookings=BOOKINGS, slots=SLOTS):
+    workdir = tempfile.mkdtemp(prefix='booking_race_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'race.db')}"
+    os.environ['ANALYTICS_COMPACTION_INTERVAL'] = '0'
+    logging.disable(logging.INFO)
+
+    from app import app
+    from extensions import db
+    from models import BOOKING_ACTIVE_STATUSES, AvailabilitySchedule, Booking, User
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    day = datetime.now().date() + timedelta(days=7)
+
+    with app.app_context():
+        db.create_all()
+        exhibitor = User(email='exhibitor@race.test', password='x', first_name='Race', last_name='Exhibitor',
+                         country='EG', role='exhibitor', company_name='Race Foods')
+        visitors = [User(email=f'visitor{i}@race.test', password='x', first_name='Visitor', last_name=str(i),
+                         country='EG') for i in range(bookings)]
+        db.session.add(exhibitor)
+        db.session.add_all(visitors)
+        db.session.flush()
+        schedule = AvailabilitySchedule(
+            exhibitor_id=exhibitor.id,
+            day_of_week=day.weekday(),
+            start_time=time(10, 0),
+            end_time=time(10 + (slots * SESSION_MINUTES) // 60, (slots * SESSION_MINUTES) % 60),
+            session_duration=SESSION_MINUTES
+        )
+        db.session.add(schedule)
+        db.session.commit()
+        exhibitor_id, schedule_id = exhibitor.id, schedule.id
+        visitor_ids = [visitor.id for visitor in visitors]
+
+    slot_times = [
+        (datetime.combine(day, time(10, 0)) + timedelta(minutes=SESSION_MINUTES * i)).strftime('%H:%M')
+        for i in range(slots)
+    ]
+
+    def book(i):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(visitor_ids[i])
+            sess['_fresh'] = True
+        slot = slot_times[i % slots]
+        response = client.post('/book-appointment', json={
+            'schedule_id': schedule_id,
+            'date': day.strftime('%Y-%m-%d'),
+            'time': slot,
+        })
+        return slot, response.get_json()['status']
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        results = list(pool.map(book, range(bookings)))
+
+    wins = Counter(slot for slot, status in results if status == 'success')
+    with app.app_context():
+        stored = Counter(
+            start.strftime('%H:%M') for start, in db.session.query(Booking.start_time).filter(
+                Booking.exhibitor_id == exhibitor_id,
+                Booking.booking_date == day,
+                Booking.status.in_(BOOKING_ACTIVE_STATUSES)
+            )
+        )
+
+    failures = 0
+    for slot in slot_times:
+        ok = wins[slot] == 1 and stored[slot] == 1
+        print(f"[{'ok' if ok else 'FAIL'}] {slot}: {wins[slot]} winning request(s), {stored[slot]} active booking(s)")
+        failures += not ok
+
+    if failures:
+        print(f"\n{failures} slot(s) were double booked or lost")
+        return 1
+    print(f"\n{bookings} concurrent requests, exactly one booking per slot")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:3])))
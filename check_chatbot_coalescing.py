@@ -0,0 +1,162 @@
+"""
+Chatbot request coalescing check
+فحص دمج الأسئلة المتطابقة المتزامنة للشات بوت
+
+VISITORS threads ask the same question (in differing spellings) at once
+while a fake provider takes ANSWER_DELAY seconds per call. They must share a
+single provider call and all get its answer, a different question must
+still get its own call, and streamed requests must join the same flight.
+Waiters of a stalled leader - a slow provider call, or a streamed answer
+whose client stopped reading - must give up after WAIT_TIMEOUT seconds and
+make their own call.
+
+Usage:
+    python check_chatbot_coalescing.py
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+
+from ai_chatbot import AIProvider, ChatbotManager
+
+VISITORS = 50
+ANSWER_DELAY = 0.3
+# Waiters give up on a stalled leader after this many seconds
+WAIT_TIMEOUT = 0.5
+# The first provider call of StallingProvider takes this long
+STALL = 3
+SPELLINGS = ['How do I register as an exhibitor?', 'how do i register as an exhibitor',
+             'HOW DO I  REGISTER AS AN EXHIBITOR ?']
+
+
+class SlowProvider(AIProvider):
+    def __init__(self):
+        self.calls = 0
+        super().__init__(api_key='fake')
+
+    def get_response(self, user_message, conversation_history=None):
+        raise NotImplementedError
+
+    async def aget_response(self, user_message, conversation_history=None):
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(ANSWER_DELAY)
+        return f"answer {call}"
+
+    def stream_response(self, user_message, conversation_history=None):
+        self.calls += 1
+        for word in ('streamed ', 'answer'):
+            threading.Event().wait(ANSWER_DELAY / 2)
+            yield word
+
+
+class StallingProvider(SlowProvider):
+    """The first call hangs for STALL seconds, later calls answer at once"""
+
+    async def aget_response(self, user_message, conversation_history=None):
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(STALL if call == 1 else 0)
+        return f"answer {call}"
+
+
+class FakeChatbot(ChatbotManager):
+    provider_class = SlowProvider
+
+    def _initialize_provider(self):
+        self.provider = self.provider_class()
+
+
+class StallingChatbot(FakeChatbot):
+    provider_class = StallingProvider
+
+
+def ask_together(questions, ask):
+    barrier = threading.Barrier(len(questions))
+    answers = [None] * len(questions)
+
+    def visitor(i):
+        barrier.wait()
+        answers[i] = ask(questions[i])
+
+    threads = [threading.Thread(target=visitor, args=(i,)) for i in range(len(questions))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return answers
+
+
+def report(ok, message):
+    print(f"[{'ok' if ok else 'FAIL'}] {message}")
+    return not ok
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    failures = 0
+
+    chatbot = FakeChatbot(provider='fake', api_key='fake')
+    questions = [SPELLINGS[i % len(SPELLINGS)] for i in range(VISITORS)]
+    answers = ask_together(questions, lambda q: chatbot.get_response(q, remember=False)['response'])
+    stats = chatbot.inflight.stats()
+    failures += report(chatbot.provider.calls == 1 and set(answers) == {'answer 1'}
+                       and stats['coalesced'] == VISITORS - 1 and stats['in_flight'] == 0,
+                       f"{VISITORS} identical questions -> {chatbot.provider.calls} provider call(s), "
+                       f"{stats['coalesced']} coalesced")
+
+    chatbot = FakeChatbot(provider='fake', api_key='fake')
+    answers = ask_together(['What are the opening hours?', 'How much is the gold package?'],
+                           lambda q: chatbot.get_response(q, remember=False)['response'])
+    failures += report(chatbot.provider.calls == 2 and len(set(answers)) == 2,
+                       f"different questions -> {chatbot.provider.calls} provider calls")
+
+    chatbot = FakeChatbot(provider='fake', api_key='fake')
+
+    def stream(question):
+        events = list(chatbot.stream_response(question, remember=False))
+        return events[-1]['response']
+
+    answers = ask_together(questions[:10], stream)
+    failures += report(chatbot.provider.calls == 1 and set(answers) == {'streamed answer'},
+                       f"10 identical streamed questions -> {chatbot.provider.calls} provider call(s), "
+                       f"{chatbot.inflight.counters['coalesced']} coalesced")
+
+    chatbot = StallingChatbot(provider='fake', api_key='fake')
+    chatbot.inflight.wait_timeout = WAIT_TIMEOUT
+    leader = threading.Thread(target=chatbot.get_response, args=(questions[0],), kwargs={'remember': False})
+    leader.start()
+    time.sleep(0.1)
+    started = time.perf_counter()
+    answer = chatbot.get_response(questions[1], remember=False)['response']
+    waited = time.perf_counter() - started
+    leader.join()
+    failures += report(answer == 'answer 2' and waited < STALL - 1
+                       and chatbot.inflight.counters['wait_timeouts'] == 1,
+                       f"waiter of a stalled call answered on its own in {waited:.2f} s: {answer}")
+
+    chatbot = FakeChatbot(provider='fake', api_key='fake')
+    chatbot.inflight.wait_timeout = WAIT_TIMEOUT
+    # The leader's client reads one chunk and stops
+    stalled = chatbot.stream_response(questions[0], remember=False)
+    next(stalled)
+    started = time.perf_counter()
+    events = list(chatbot.stream_response(questions[1], remember=False))
+    waited = time.perf_counter() - started
+    stalled.close()
+    failures += report(events[-1]['response'] == 'streamed answer' and chatbot.provider.calls == 2
+                       and waited < WAIT_TIMEOUT + 2 * ANSWER_DELAY,
+                       f"waiter of a stalled stream streamed its own answer in {waited:.2f} s")
+
+    if failures:
+        print(f"\n{failures} check(s) failed")
+        return 1
+    print("\nIdentical concurrent questions share one provider call")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
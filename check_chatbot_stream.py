@@ -0,0 +1,123 @@
+"""
+Streaming chatbot check for /api/chatbot/chat/stream and the chatbot_message event
+فحص البث المباشر لردود الشات بوت
+
+Runs the app on a throwaway SQLite database with a fake AI provider that
+yields CHUNKS with CHUNK_DELAY seconds between them. The SSE endpoint and the
+Socket.IO event must deliver every chunk in order followed by one done event
+carrying the joined answer, and the first chunk must arrive before the
+provider has finished. Asking an answered question again must send the
+cached answer as one chunk followed by the done event.
+
+Usage:
+    python check_chatbot_stream.py
+"""
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+CHUNKS = ['Welcome ', 'to ', 'Esco ', 'Fairs', '!']
+CHUNK_DELAY = 0.2
+QUESTION = 'Tell me something nice about the exhibition'
+# Opening questions are cached - every streamed case needs its own
+SOCKET_QUESTION = 'What do visitors like most about the exhibition'
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='chatbot_stream_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'stream.db')}"
+    os.environ['ANALYTICS_COMPACTION_INTERVAL'] = '0'
+    # The fake chatbot below must not race a real one built by the warmup thread
+    os.environ['CHATBOT_WARMUP'] = '0'
+    logging.disable(logging.INFO)
+
+    import ai_chatbot
+    from ai_chatbot import AIProvider, ChatbotManager
+    from app import app
+    from extensions import socketio
+
+    class FakeProvider(AIProvider):
+        def get_response(self, user_message, conversation_history=None, language='ar'):
+            return ''.join(CHUNKS)
+
+        def stream_response(self, user_message, conversation_history=None):
+            for chunk in CHUNKS:
+                time.sleep(CHUNK_DELAY)
+                yield chunk
+
+    class FakeChatbot(ChatbotManager):
+        def _initialize_provider(self):
+            self.provider = FakeProvider(self.api_key)
+
+    ai_chatbot._chatbot_instance = FakeChatbot(provider='fake', api_key='fake')
+    app.config['WTF_CSRF_ENABLED'] = False
+    expected = ''.join(CHUNKS)
+    failures = 0
+
+    # Server-Sent Events
+    client = app.test_client()
+    started = time.perf_counter()
+    response = client.post('/api/chatbot/chat/stream', json={'message': QUESTION, 'conversation_id': 'sse'},
+                           buffered=False)
+    events = []
+    first_chunk_at = None
+    for name, data in _sse_blocks(response):
+        if name == 'chunk' and first_chunk_at is None:
+            first_chunk_at = time.perf_counter() - started
+        events.append((name, data))
+    total = time.perf_counter() - started
+
+    chunks = [data['chunk'] for name, data in events if name == 'chunk']
+    done = [data for name, data in events if name == 'done']
+    ok = (response.mimetype == 'text/event-stream' and chunks == CHUNKS and len(done) == 1
+          and done[0]['response'] == expected and first_chunk_at is not None
+          and first_chunk_at < total - CHUNK_DELAY)
+    print(f"[{'ok' if ok else 'FAIL'}] SSE: {len(chunks)} chunk(s), first after {first_chunk_at or 0:.2f} s "
+          f"of {total:.2f} s, done={done[0]['response'] if done else None!r}")
+    failures += not ok
+
+    # Socket.IO
+    socket_client = socketio.test_client(app, flask_test_client=client)
+    socket_client.emit('chatbot_message', {'message': SOCKET_QUESTION, 'conversation_id': 'socket'})
+    received = socket_client.get_received()
+    chunks = [item['args'][0]['chunk'] for item in received if item['name'] == 'chatbot_chunk']
+    done = [item['args'][0] for item in received if item['name'] == 'chatbot_done']
+    ok = chunks == CHUNKS and len(done) == 1 and done[0]['response'] == expected
+    print(f"[{'ok' if ok else 'FAIL'}] Socket.IO: {len(chunks)} chatbot_chunk event(s), "
+          f"chatbot_done={done[0]['response'] if done else None!r}")
+    failures += not ok
+    socket_client.disconnect()
+
+    # Cached answer
+    response = client.post('/api/chatbot/chat/stream', json={'message': QUESTION, 'conversation_id': 'cached'},
+                           buffered=False)
+    events = list(_sse_blocks(response))
+    ok = (len(events) == 2 and events[0] == ('chunk', {'chunk': expected})
+          and events[1][0] == 'done' and events[1][1]['cached'] and events[1][1]['response'] == expected)
+    print(f"[{'ok' if ok else 'FAIL'}] cached answer: {[name for name, _ in events]}")
+    failures += not ok
+
+    if failures:
+        print(f"\n{failures} check(s) failed")
+        return 1
+    print("\nChatbot answers stream chunk by chunk")
+    return 0
+
+
+def _sse_blocks(response):
+    """(event name, data) pairs read from a streamed response as they arrive"""
+    buffer = ''
+    for piece in response.response:
+        buffer += piece.decode('utf-8') if isinstance(piece, bytes) else piece
+        while '\n\n' in buffer:
+            block, buffer = buffer.split('\n\n', 1)
+            fields = dict(line.split(': ', 1) for line in block.split('\n') if ': ' in line)
+            yield fields.get('event', 'message'), json.loads(fields.get('data', 'null'))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Chatbot warmup check - provider clients built once, off the request path
+فحص التهيئة المسبقة للشات بوت
+
+Replaces create_chatbot with a fake whose construction and warm_up() take
+BUILD_DELAY seconds each, starts the warmup thread and then sends THREADS
+concurrent "first requests". The chatbot must be built exactly once and
+warmed exactly once, the warmup state must go from running to done, and
+requests arriving after the warmup must not wait for anything.
+
+Usage:
+    python check_chatbot_warmup.py
+"""
+
+import logging
+import sys
+import threading
+import time
+
+import ai_chatbot
+from ai_chatbot import AIProvider, ChatbotManager
+from provider_registry import ProviderRegistry
+
+BUILD_DELAY = 0.3
+THREADS = 20
+
+
+class SlowProvider(AIProvider):
+    warm_ups = 0
+
+    def __init__(self):
+        time.sleep(BUILD_DELAY)
+        super().__init__(api_key='fake')
+
+    def get_response(self, user_message, conversation_history=None):
+        return 'answer'
+
+    def warm_up(self):
+        time.sleep(BUILD_DELAY)
+        SlowProvider.warm_ups += 1
+
+
+class FakeChatbot(ChatbotManager):
+    builds = 0
+
+    def _initialize_provider(self):
+        FakeChatbot.builds += 1
+        self.provider = SlowProvider()
+
+
+def report(ok, message):
+    print(f"[{'ok' if ok else 'FAIL'}] {message}")
+    return not ok
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    ai_chatbot.create_chatbot = lambda provider=None, api_key=None: FakeChatbot(provider='fake', api_key='fake')
+    ai_chatbot.provider_registry = registry = ProviderRegistry()
+    failures = 0
+
+    thread = ai_chatbot.start_chatbot_warmup()
+    failures += report(registry.warmup['state'] == 'running', "warmup running in the background")
+    failures += report(ai_chatbot.start_chatbot_warmup() is thread, "a second start reuses the warmup thread")
+
+    chatbots = []
+    requests = [threading.Thread(target=lambda: chatbots.append(ai_chatbot.get_chatbot())) for _ in range(THREADS)]
+    for request in requests:
+        request.start()
+    for request in requests:
+        request.join()
+    thread.join()
+    failures += report(FakeChatbot.builds == 1 and len({id(chatbot) for chatbot in chatbots}) == 1,
+                       f"{THREADS} concurrent first requests and the warmup built {FakeChatbot.builds} chatbot(s)")
+    failures += report(registry.warmup['state'] == 'done' and SlowProvider.warm_ups == 1,
+                       f"warmup {registry.warmup['state']} after {registry.warmup['seconds']} s, "
+                       f"provider warmed {SlowProvider.warm_ups} time(s)")
+
+    started = time.perf_counter()
+    ai_chatbot.get_chatbot()
+    waited = time.perf_counter() - started
+    failures += report(waited < 0.01, f"request after warmup got the chatbot in {waited * 1000:.2f} ms")
+
+    created = []
+    for _ in range(3):
+        registry._client(('fake', 'key'), lambda: created.append(object()) or created[-1])
+    failures += report(len(created) == 1 and registry.stats()['clients'] == ['fake'],
+                       "registry creates each client once")
+
+    if failures:
+        print(f"\n{failures} check(s) failed")
+        return 1
+    print("\nThe chatbot is built and warmed once, before the first visitor")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
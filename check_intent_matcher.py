@@ -0,0 +1,136 @@
+"""
+Chat intent matcher check and microbenchmark
+فحص ومقارنة أداء كشف نوايا رسائل الشات بوت
+
+Compares intent_matcher.match_message() with the keyword scans it replaced
+(copied below as they were): both must agree on the language and on the
+registration, account status and email intents of a corpus of real-looking
+messages plus RANDOM_MESSAGES random ones built from keyword fragments, and
+the single pass must be faster than the old per-message work - three keyword
+scans and two detect_language() calls - at every message length.
+
+Usage:
+    python check_intent_matcher.py
+"""
+
+import random
+import re
+import sys
+import timeit
+
+from intent_matcher import INTENT_KEYWORDS, match_message
+
+RANDOM_MESSAGES = 20000
+REPEAT = 5
+
+MESSAGES = [
+    'مرحبا', 'Hello!', 'How do I register as an exhibitor?', 'اريد حساب جديد في المعرض',
+    'هل تم الموافقة على حسابي؟', 'When will my account be approved?', 'check status please',
+    'أكتب بريد للشركة', 'I want to write an email to a company', 'ما هي الباقات المتاحة؟',
+    'Can I join the exhibition as a visitor?', 'متى يبدأ المعرض؟ ابدأ', 'send email to exhibitor@example.com',
+    'activemail', 'انشاء حسابي', 'WRITE MESSAGE', 'Signup / sign up / SIGN UP', '123 ???', '',
+    'ما هي ساعات العمل وكيف أتواصل معكم hello',
+]
+
+
+def legacy_detect_language(text):
+    if not text:
+        return 'ar'
+    arabic_count = len(re.findall(r'[\u0600-\u06FF]', text))
+    english_count = len(re.findall(r'[a-zA-Z]', text))
+    if arabic_count > english_count:
+        return 'ar'
+    elif english_count > arabic_count:
+        return 'en'
+    return 'ar'
+
+
+def legacy_wants_to_register(user_message):
+    language = legacy_detect_language(user_message)
+    ar_keywords = ['تسجيل', 'حساب جديد', 'انشاء حساب', 'عضو جديد', 'مستخدم جديد', 'اريد حساب', 'ابدأ']
+    en_keywords = ['register', 'sign up', 'create account', 'new account', 'new user', 'join', 'account']
+    user_message_lower = user_message.lower()
+    if language == 'ar':
+        return any(keyword in user_message_lower for keyword in ar_keywords)
+    return any(keyword in user_message_lower for keyword in en_keywords)
+
+
+def legacy_detect_account_status_request(user_message):
+    ar_keywords = ['حالة', 'موافقة', 'تفعيل', 'حسابي', 'الموافقة', 'متى', 'تم تفعيل', 'هل تم الموافقة', 'حسابي']
+    en_keywords = ['status', 'approval', 'active', 'activate', 'approved', 'account', 'when', 'check']
+    user_message_lower = user_message.lower()
+    ar_check = any(keyword in user_message_lower for keyword in ar_keywords)
+    en_check = any(keyword in user_message_lower for keyword in en_keywords)
+    return ar_check or en_check
+
+
+def legacy_detect_email_request(user_message):
+    ar_keywords = ['رسالة', 'بريد', 'رسالة بريدية', 'أرسل رسالة', 'اكتب رسالة', 'أكتب بريد', 'تواصل']
+    en_keywords = ['email', 'message', 'compose', 'send email', 'write message', 'draft', 'write email']
+    user_message_lower = user_message.lower()
+    ar_check = any(keyword in user_message_lower for keyword in ar_keywords)
+    en_check = any(keyword in user_message_lower for keyword in en_keywords)
+    return ar_check or en_check
+
+
+def legacy(message):
+    """What handle_chat_message computed per message before: three scans and two detect_language calls"""
+    return (legacy_detect_language(message), legacy_wants_to_register(message),
+            legacy_detect_account_status_request(message), legacy_detect_email_request(message))
+
+
+def current(message):
+    match = match_message(message)
+    return (match.language, match.wants(f'register_{match.language}'),
+            match.wants('account_status'), match.wants('email'))
+
+
+def random_message(rng):
+    fragments = [word for words in INTENT_KEYWORDS.values() for word in words]
+    fragments += ['معرض', 'الزوار', 'exhibition', 'booth', ' ', ' ', '?', '؟', 'A', 'ي', 'e', '1']
+    parts = []
+    for _ in range(rng.randint(0, 8)):
+        fragment = rng.choice(fragments)
+        if rng.random() < 0.3:
+            # Cut keywords so they overlap with neighbours
+            start = rng.randint(0, len(fragment) - 1)
+            fragment = fragment[start:start + rng.randint(1, len(fragment))]
+        if rng.random() < 0.2:
+            fragment = fragment.upper()
+        parts.append(fragment)
+    return ''.join(parts)
+
+
+def main():
+    rng = random.Random(24)
+    failures = 0
+
+    corpus = MESSAGES + [random_message(rng) for _ in range(RANDOM_MESSAGES)]
+    mismatches = [message for message in corpus if legacy(message) != current(message)]
+    ok = not mismatches
+    print(f"[{'ok' if ok else 'FAIL'}] same language and intents for {len(corpus)} messages"
+          + ('' if ok else f" - {len(mismatches)} differ, e.g. {mismatches[0]!r}: "
+                           f"{legacy(mismatches[0])} vs {current(mismatches[0])}"))
+    failures += not ok
+
+    for label, messages in (('short', MESSAGES[:14]),
+                            ('long', [' '.join(MESSAGES) * 3, 'معرض ' * 200, 'exhibition ' * 200])):
+        runs = max(1, 200000 // sum(len(message) for message in messages))
+        old = min(timeit.repeat(lambda: [legacy(m) for m in messages], number=runs, repeat=REPEAT))
+        new = min(timeit.repeat(lambda: [current(m) for m in messages], number=runs, repeat=REPEAT))
+        per_old = old / (runs * len(messages)) * 1e6
+        per_new = new / (runs * len(messages)) * 1e6
+        ok = new < old
+        print(f"[{'ok' if ok else 'FAIL'}] {label} messages: {per_old:.1f} us before, {per_new:.1f} us now "
+              f"({old / new:.1f}x)")
+        failures += not ok
+
+    if failures:
+        print(f"\n{failures} check(s) failed")
+        return 1
+    print("\nOne scan finds the same intents faster")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Migration chain check - `flask db upgrade` from an empty and from a baseline database
+فحص سلسلة ترحيلات قاعدة البيانات
+
+Runs the real `flask db upgrade` command on throwaway SQLite databases:
+
+- an empty database (startup auto-create off) must upgrade from the initial
+  schema to the head revision,
+- a baseline database - the tables the app created with db.create_all()
+  before there were migrations, with a slot and an appointment in them -
+  must start the app and upgrade to head, with the appointment folded into
+  bookings,
+- an empty database created at startup must be stamped at head.
+
+Each result must match models.py: the same tables, columns and indexes.
+
+Usage:
+    python check_migrations.py
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, inspect, text
+
+from database import MIGRATIONS_DIR
+from extensions import db
+import models  # noqa: F401
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+INITIAL = '0c5e8a2f4b17'
+
+
+def flask(url, *args, auto_create=True):
+    env = dict(os.environ, DATABASE_URL=url, DATABASE_AUTO_CREATE='1' if auto_create else '0',
+               CHATBOT_WARMUP='0', ANALYTICS_COMPACTION_INTERVAL='0')
+    return subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', *args], cwd=HERE, env=env,
+                          capture_output=True, text=True, timeout=300)
+
+
+def state(url):
+    """(revisions, differences from models.py) of the database at url"""
+    engine = create_engine(url)
+    with engine.connect() as connection:
+        context = MigrationContext.configure(connection)
+        revisions = set(context.get_current_heads())
+        differences = compare_metadata(context, db.metadata)
+    engine.dispose()
+    return revisions, differences
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='migrations_')
+    heads = set(ScriptDirectory(MIGRATIONS_DIR).get_heads())
+    failures = 0
+
+    def report(ok, message):
+        print(f"[{'ok' if ok else 'FAIL'}] {message}")
+        return not ok
+
+    def upgraded(label, url, result):
+        revisions, differences = state(url)
+        ok = result.returncode == 0 and revisions == heads and not differences
+        detail = result.stderr.strip().splitlines()[-1:] if result.returncode else differences[:3]
+        return report(ok, f"{label}: at {sorted(revisions)}" + ('' if ok else f" - {detail}"))
+
+    # Empty database, schema built by the migrations alone
+    url = f"sqlite:///{os.path.join(workdir, 'empty.db')}"
+    failures += upgraded('empty database upgraded', url, flask(url, 'db', 'upgrade', auto_create=False))
+
+    # Database of an installation from before the migrations
+    url = f"sqlite:///{os.path.join(workdir, 'baseline.db')}"
+    result = flask(url, 'db', 'upgrade', INITIAL, auto_create=False)
+    failures += report(result.returncode == 0, "baseline schema created")
+    engine = create_engine(url)
+    start = datetime.now().replace(hour=10, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE alembic_version"))
+        connection.execute(text(
+            "INSERT INTO users (id, email, password, first_name, last_name, country, role, is_active) "
+            "VALUES (1, 'exhibitor@migrations.test', 'x', 'A', 'B', 'EG', 'exhibitor', 1), "
+            "(2, 'visitor@migrations.test', 'x', 'C', 'D', 'EG', 'visitor', 1)"))
+        connection.execute(text(
+            "INSERT INTO available_slot (id, exhibitor_id, start_time, end_time, duration_minutes, is_available) "
+            "VALUES (1, 1, :start, :end, 30, 1)"), {'start': start, 'end': start + timedelta(minutes=30)})
+        connection.execute(text(
+            "INSERT INTO appointment (id, user_id, exhibitor_id, slot_id, appointment_date, duration_minutes, status) "
+            "VALUES (1, 2, 1, 1, :start, 30, 'scheduled')"), {'start': start})
+    engine.dispose()
+    # Starting the app must leave the tables of pending revisions alone
+    result = flask(url, 'routes')
+    engine = create_engine(url)
+    tables = inspect(engine).get_table_names()
+    engine.dispose()
+    failures += report(result.returncode == 0 and 'daily_exhibitor_stats' not in tables,
+                       "app started on the baseline database without creating tables")
+    failures += upgraded('baseline database upgraded', url, flask(url, 'db', 'upgrade'))
+    engine = create_engine(url)
+    with engine.connect() as connection:
+        bookings = connection.execute(text("SELECT status, booking_date FROM bookings")).all()
+    engine.dispose()
+    failures += report(len(bookings) == 1 and bookings[0].status == 'confirmed',
+                       f"appointment folded into bookings: {bookings}")
+
+    # Empty database created by the app at startup
+    url = f"sqlite:///{os.path.join(workdir, 'startup.db')}"
+    result = flask(url, 'routes')
+    failures += upgraded('empty database created at startup', url, result)
+    failures += upgraded('upgrade after startup is a no-op', url, flask(url, 'db', 'upgrade'))
+
+    if failures:
+        print(f"\n{failures} check(s) failed")
+        return 1
+    print("\nEvery database reaches the head revision with the schema of models.py")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
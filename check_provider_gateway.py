@@ -0,0 +1,270 @@
+"""
+AI provider gateway check - deadlines, circuit breaker and hedged requests
+فحص بوابة مزودي الذكاء الاصطناعي
+
+A local HTTP server stands in for both upstream APIs: it answers the OpenAI
+chat completions and the Gemini generateContent routes after a configurable
+delay or with a configurable error status. Two providers talk to it over
+real sockets from the gateway's event loop, and the script checks that
+
+- a slow provider is cut off at the deadline,
+- repeated failures open the circuit breaker, which then fails fast without
+  calling the upstream and closes again after a successful trial call,
+- a slow primary is hedged to the secondary, which wins the race,
+- ChatbotManager answers with the fallback text while both breakers are open,
+- streamed answers get a first-chunk and an overall deadline and are hedged
+  too, and a visitor disconnecting during the half-open trial does not leave
+  the breaker locked.
+
+Usage:
+    python check_provider_gateway.py
+"""
+
+import asyncio
+import json
+import logging
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ai_chatbot import AIProvider, ChatbotManager
+from provider_gateway import ProviderGateway
+
+OPENAI_PATH = '/v1/chat/completions'
+GEMINI_PATH = '/v1beta/models/gemini-2.0-flash:generateContent'
+
+# Route -> {'delay': seconds, 'status': HTTP status, 'requests': count}, changed by the checks
+UPSTREAMS = {OPENAI_PATH: {}, GEMINI_PATH: {}}
+
+
+def configure(path, delay=0.0, status=200):
+    UPSTREAMS[path].update(delay=delay, status=status, requests=0)
+
+
+class FakeUpstream(BaseHTTPRequestHandler):
+    def do_POST(self):
+        upstream = UPSTREAMS.get(self.path)
+        if upstream is None:
+            self.send_error(404)
+            return
+        upstream['requests'] += 1
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(upstream['delay'])
+        if self.path == OPENAI_PATH:
+            body = {'choices': [{'message': {'role': 'assistant', 'content': 'answer from chatgpt'}}]}
+        else:
+            body = {'candidates': [{'content': {'role': 'model', 'parts': [{'text': 'answer from gemini'}]}}]}
+        payload = json.dumps(body).encode('utf-8')
+        try:
+            self.send_response(upstream['status'])
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The gateway cancelled the call
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTPProvider(AIProvider):
+    """Provider calling one route of the fake upstream"""
+
+    def __init__(self, port, path):
+        self.port = port
+        self.path = path
+        super().__init__(api_key='fake')
+
+    def get_response(self, user_message, conversation_history=None):
+        raise NotImplementedError
+
+    async def aget_response(self, user_message, conversation_history=None):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        try:
+            body = json.dumps({'message': user_message}).encode('utf-8')
+            writer.write(f"POST {self.path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('ascii') + body)
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        head, _, payload = response.partition(b'\r\n\r\n')
+        status = int(head.split(b' ', 2)[1])
+        if status != 200:
+            raise RuntimeError(f"upstream answered {status}")
+        data = json.loads(payload)
+        if self.path == OPENAI_PATH:
+            return data['choices'][0]['message']['content']
+        return data['candidates'][0]['content']['parts'][0]['text']
+
+
+class StreamProvider(AIProvider):
+    """Provider streaming `chunks` chunks, the first after first_delay and the rest every chunk_delay seconds"""
+
+    def __init__(self, name, first_delay=0.0, chunk_delay=0.0, chunks=3, fail=False):
+        self.name = name
+        self.first_delay = first_delay
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.fail = fail
+        super().__init__(api_key='fake')
+
+    def get_response(self, user_message, conversation_history=None):
+        return ''.join(self.stream_response(user_message, conversation_history))
+
+    def stream_response(self, user_message, conversation_history=None):
+        time.sleep(self.first_delay)
+        if self.fail:
+            raise RuntimeError('upstream answered 503')
+        for index in range(self.chunks):
+            if index:
+                time.sleep(self.chunk_delay)
+            yield f"{self.name}{index} "
+
+
+def timed_stream(gateway, question='How do I register?'):
+    """(chunks, error, seconds) of one streamed answer"""
+    started = time.perf_counter()
+    chunks = []
+    try:
+        for chunk in gateway.stream(question):
+            chunks.append(chunk)
+    except Exception as e:
+        return chunks, e, time.perf_counter() - started
+    return chunks, None, time.perf_counter() - started
+
+
+def timed(gateway, question='How do I register?'):
+    started = time.perf_counter()
+    answer = gateway.call(question)
+    return answer, time.perf_counter() - started
+
+
+def report(ok, message):
+    print(f"[{'ok' if ok else 'FAIL'}] {message}")
+    return not ok
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeUpstream)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    gemini = HTTPProvider(port, GEMINI_PATH)
+    chatgpt = HTTPProvider(port, OPENAI_PATH)
+    failures = 0
+
+    # Deadline
+    configure(GEMINI_PATH, delay=2.0)
+    gateway = ProviderGateway(gemini, timeout=0.3)
+    answer, seconds = timed(gateway)
+    failures += report(answer is None and seconds < 0.6 and gateway.counters['timeouts'] == 1,
+                       f"slow provider cut off at the deadline after {seconds:.2f} s")
+
+    # Circuit breaker
+    configure(GEMINI_PATH, status=503)
+    gateway = ProviderGateway(gemini, timeout=1.0, breaker_failures=3, breaker_reset=0.3)
+    for _ in range(3):
+        gateway.call('How do I register?')
+    answer, seconds = timed(gateway)
+    breaker = gateway.breakers[id(gemini)]
+    failures += report(answer is None and seconds < 0.05 and UPSTREAMS[GEMINI_PATH]['requests'] == 3
+                       and breaker.state == 'open',
+                       f"breaker open after 3 failures, next call failed fast in {seconds * 1000:.1f} ms "
+                       f"without reaching the upstream")
+    configure(GEMINI_PATH)
+    time.sleep(0.35)
+    answer, _ = timed(gateway)
+    failures += report(answer == 'answer from gemini' and breaker.state == 'closed',
+                       f"trial call after the reset closed the breaker ({breaker.state})")
+
+    # Hedged requests
+    configure(GEMINI_PATH, delay=1.0)
+    configure(OPENAI_PATH, delay=0.05)
+    gateway = ProviderGateway(gemini, chatgpt, timeout=3.0, hedge_delay=0.1)
+    answer, seconds = timed(gateway)
+    failures += report(answer == 'answer from chatgpt' and seconds < 0.5 and gateway.counters['hedge_wins'] == 1,
+                       f"slow primary hedged - secondary answered after {seconds:.2f} s")
+    configure(GEMINI_PATH, delay=0.01)
+    configure(OPENAI_PATH)
+    answer, _ = timed(gateway)
+    failures += report(answer == 'answer from gemini' and UPSTREAMS[OPENAI_PATH]['requests'] == 0,
+                       "fast primary answered without a hedge")
+
+    # p95 hedge delay
+    gateway = ProviderGateway(gemini, chatgpt, timeout=3.0)
+    for _ in range(40):
+        gateway.call('How do I register?')
+    delay = gateway.current_hedge_delay()
+    failures += report(0.01 <= delay < 0.2, f"p95 hedge delay tracks the primary latency: {delay * 1000:.1f} ms")
+
+    # Fallback text through ChatbotManager
+    class FakeChatbot(ChatbotManager):
+        def _initialize_provider(self):
+            self.provider = gemini
+            self.secondary = chatgpt
+
+    chatbot = FakeChatbot(provider='gemini', api_key='fake')
+    chatbot.gateway = ProviderGateway(gemini, chatgpt, timeout=1.0, breaker_failures=1, breaker_reset=60)
+    configure(GEMINI_PATH, status=500)
+    configure(OPENAI_PATH, status=500)
+    chatbot.get_response('first question', remember=False)
+    started = time.perf_counter()
+    result = chatbot.get_response('How do I register as an exhibitor?', remember=False)
+    seconds = time.perf_counter() - started
+    failures += report(result['response'] == ChatbotManager._fallback_message('en') and seconds < 0.05
+                       and UPSTREAMS[GEMINI_PATH]['requests'] == 1,
+                       f"both breakers open - fallback text in {seconds * 1000:.1f} ms")
+
+    # Streamed answers
+    gateway = ProviderGateway(StreamProvider('slow', first_delay=2.0), timeout=3.0, first_chunk_timeout=0.3)
+    chunks, error, seconds = timed_stream(gateway)
+    failures += report(not chunks and error is None and seconds < 0.5 and gateway.counters['timeouts'] == 1,
+                       f"stream with no first chunk cut off after {seconds:.2f} s")
+
+    gateway = ProviderGateway(StreamProvider('endless', chunk_delay=0.1, chunks=100), timeout=0.5)
+    chunks, error, seconds = timed_stream(gateway)
+    failures += report(chunks and isinstance(error, TimeoutError) and seconds < 0.7,
+                       f"stream cut off at the deadline after {len(chunks)} chunks in {seconds:.2f} s")
+
+    gateway = ProviderGateway(StreamProvider('primary', first_delay=1.0), StreamProvider('secondary'),
+                              timeout=3.0, hedge_delay=0.1)
+    chunks, error, seconds = timed_stream(gateway)
+    failures += report(chunks == ['secondary0 ', 'secondary1 ', 'secondary2 '] and seconds < 0.5
+                       and gateway.counters['hedge_wins'] == 1,
+                       f"slow streaming primary hedged - secondary streamed after {seconds:.2f} s")
+
+    gateway = ProviderGateway(StreamProvider('failing', fail=True), StreamProvider('secondary'),
+                              timeout=3.0, hedge_delay=1.0)
+    chunks, error, seconds = timed_stream(gateway)
+    failures += report(chunks == ['secondary0 ', 'secondary1 ', 'secondary2 '] and seconds < 0.5,
+                       f"failing streaming primary replaced by the secondary after {seconds:.2f} s")
+
+    # Visitor disconnects while the half-open trial is streaming
+    primary = StreamProvider('primary', fail=True)
+    gateway = ProviderGateway(primary, timeout=1.0, breaker_failures=1, breaker_reset=0.1)
+    timed_stream(gateway)
+    breaker = gateway.breakers[id(primary)]
+    primary.fail = False
+    time.sleep(0.15)
+    stream = gateway.stream('How do I register?')
+    next(stream)
+    stream.close()
+    answer, _ = timed(gateway)
+    failures += report(breaker.state == 'closed' and answer == 'primary0 primary1 primary2 ',
+                       f"disconnect during the trial released it, the next call closed the breaker "
+                       f"({breaker.state})")
+
+    server.shutdown()
+    if failures:
+        print(f"\n{failures} check(s) failed")
+        return 1
+    print("\nProvider calls honour deadlines, fail fast and hedge")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Query count check for the admin report pages
+فحص عدد الاستعلامات في صفحات التقارير
+
+Seeds a throwaway SQLite database with packages, exhibitors, orders,
+bookings and visits, renders the admin report views for a short and a long
+timeRange and counts the SQL statements each one issues. Then it seeds
+SCALE times more rows and counts again. The reports must use a fixed number
+of queries (one GROUP BY per chart) whatever the date range and however
+many rows there are.
+
+Usage:
+    python check_query_counts.py
+"""
+
+import inspect
+import logging
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import event
+
+# Maximum statements per report page
+QUERY_BUDGET = {
+    'admin.sales_report': 8,
+    # Rollup totals plus the raw tail for each chart
+    'admin.visit_statistics': 16,
+}
+
+TIME_RANGES = (7, 365)
+
+# Rows per seeding round, the second round adds SCALE times as many
+BASE_ROWS = {'packages': 3, 'exhibitors': 4, 'visitors': 10, 'orders': 20, 'bookings': 10, 'visits': 50}
+SCALE = 5
+
+
+def seed(round_number, multiplier, rng):
+    """Add multiplier times BASE_ROWS rows of every kind, spread over the last year"""
+    from extensions import db
+    from models import AvailabilitySchedule, Booking, ExhibitorAnalytics, Order, Package, User, Visit
+
+    counts = {name: count * multiplier for name, count in BASE_ROWS.items()}
+    now = datetime.now()
+
+    def moment():
+        return now - timedelta(days=rng.randint(0, 364), minutes=rng.randint(0, 1439))
+
+    packages = [Package(name=f"Package {round_number}-{i}", price=100 * (i + 1)) for i in range(counts['packages'])]
+    db.session.add_all(packages)
+    db.session.flush()
+    exhibitors = [
+        User(email=f"exhibitor{round_number}-{i}@reports.test", password='x', first_name='E', last_name=str(i),
+             country='EG', role='exhibitor', company_name=f"Company {i}", package_id=rng.choice(packages).id)
+        for i in range(counts['exhibitors'])
+    ]
+    visitors = [
+        User(email=f"visitor{round_number}-{i}@reports.test", password='x', first_name='V', last_name=str(i),
+             country='EG', role='visitor')
+        for i in range(counts['visitors'])
+    ]
+    db.session.add_all(exhibitors + visitors)
+    db.session.flush()
+    schedules = [
+        AvailabilitySchedule(exhibitor_id=exhibitor.id, day_of_week=0, start_time=time(9, 0),
+                             end_time=time(17, 0), session_duration=30)
+        for exhibitor in exhibitors
+    ]
+    db.session.add_all(schedules)
+    db.session.flush()
+
+    db.session.add_all(
+        Order(user_id=rng.choice(exhibitors).id, package_id=rng.choice(packages).id, amount=rng.randint(50, 500),
+              status='completed', created_at=moment())
+        for _ in range(counts['orders'])
+    )
+    for i in range(counts['bookings']):
+        schedule = rng.choice(schedules)
+        db.session.add(Booking(user_id=rng.choice(visitors).id, exhibitor_id=schedule.exhibitor_id,
+                               schedule_id=schedule.id, booking_date=moment().date(),
+                               start_time=time(9 + i % 8, 0), end_time=time(9 + i % 8, 30),
+                               status=rng.choice(['confirmed', 'cancelled', 'completed'])))
+    db.session.add_all(
+        Visit(visitor_id=f"visitor-{rng.randint(0, counts['visits'] // 2)}", timestamp=moment(),
+              duration=rng.randint(5, 600), page_views=rng.randint(1, 10), user_id=rng.choice(visitors).id)
+        for _ in range(counts['visits'])
+    )
+    db.session.add_all(
+        ExhibitorAnalytics(exhibitor_id=rng.choice(exhibitors).id, user_id=rng.choice(visitors).id,
+                           action_type=rng.choice(['profile_view', 'product_view', 'booking']),
+                           session_duration=rng.randint(5, 600), created_at=moment())
+        for _ in range(counts['visits'])
+    )
+    db.session.commit()
+
+
+def count_queries(app, db, endpoint, time_range):
+    """Run the view behind endpoint (without the login decorators) and count its statements"""
+    view = inspect.unwrap(app.view_functions[endpoint])
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.test_request_context(query_string={'timeRange': time_range}):
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            view()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+            db.session.remove()
+    return len(statements)
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='query_counts_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'reports.db')}"
+    os.environ['ANALYTICS_COMPACTION_INTERVAL'] = '0'
+    os.environ['CHATBOT_WARMUP'] = '0'
+    logging.disable(logging.INFO)
+
+    from app import app
+    from extensions import db
+
+    rng = random.Random(3)
+    counts = {endpoint: {} for endpoint in QUERY_BUDGET}
+    rows = 0
+    for round_number, multiplier in enumerate((1, SCALE)):
+        with app.app_context():
+            seed(round_number, multiplier, rng)
+        rows += sum(BASE_ROWS.values()) * multiplier
+        for endpoint in QUERY_BUDGET:
+            for time_range in TIME_RANGES:
+                counts[endpoint][(rows, time_range)] = count_queries(app, db, endpoint, time_range)
+
+    failures = 0
+    for endpoint, budget in QUERY_BUDGET.items():
+        constant = len(set(counts[endpoint].values())) == 1
+        within_budget = max(counts[endpoint].values()) <= budget
+        status = 'ok' if constant and within_budget else 'FAIL'
+        details = ', '.join(f"{rows} rows/{days} days: {count}"
+                            for (rows, days), count in counts[endpoint].items())
+        print(f"[{status}] {endpoint} ({details}, budget {budget})")
+        failures += status == 'FAIL'
+
+    if failures:
+        print(f"\n{failures} report(s) issue too many queries")
+        return 1
+    print("\nAll reports use a constant number of queries")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
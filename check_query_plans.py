@@ -0,0 +1,200 @@
+"""
+Query plan check for the hot request-path queries
+فحص خطط تنفيذ الاستعلامات الأكثر استخداماً
+
+Builds the schema from models.py in an in-memory SQLite database, runs
+EXPLAIN QUERY PLAN for the queries issued by routes.py and admin_routes.py
+and exits with a non-zero status if any of them does a full table scan.
+
+Usage:
+    python check_query_plans.py
+"""
+
+import sys
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import and_, create_engine, func, select
+
+from admin_routes import exhibitor_stats_columns
+from extensions import db
+from models import (
+    User, Package, Product, Video, FavoriteExhibitor, FavoriteProduct,
+    AvailabilitySchedule, AvailabilityDay, Booking, ExhibitorAnalytics, Order, Visit,
+    HourlyVisitStats, VisitorStats, DailyExhibitorStats
+)
+
+# Configuration tables with a handful of rows - scanning them is cheaper than an index lookup
+SMALL_TABLES = {'banners', 'packages', 'specializations', 'settings', 'partners', 'gallery_ads'}
+
+
+def hot_queries():
+    """(label, statement) pairs mirroring the queries in routes.py and admin_routes.py"""
+    today = date.today()
+    exhibitor_id = 1
+    user_id = 2
+
+    return [
+        # routes.py
+        ('index: homepage featured products',
+         select(Product).where(Product.is_homepage_featured == True, Product.is_active == True)),
+        ('index: hall exhibitor counts',
+         select(func.count(User.id)).where(
+             User.gallery_hall == 'hall1', User.role == 'exhibitor', User.is_active == True)),
+        ('gallery / gallery_hall: exhibitors by hall',
+         select(User).where(
+             User.gallery_hall == 'hall1', User.role == 'exhibitor', User.is_active == True
+         ).order_by(User.ranking)),
+        ('exhibitor_profile: featured products',
+         select(Product).where(
+             Product.exhibitor_id == exhibitor_id, Product.is_active == True, Product.is_featured == True)),
+        ('exhibitor_profile: videos',
+         select(Video).where(Video.exhibitor_id == exhibitor_id, Video.is_active == True)),
+        ('exhibitor_profile: is favorited',
+         select(FavoriteExhibitor).where(
+             FavoriteExhibitor.user_id == user_id, FavoriteExhibitor.exhibitor_id == exhibitor_id)),
+        ('availability_calendar: schedules with materialized days',
+         select(AvailabilitySchedule, AvailabilityDay).outerjoin(AvailabilityDay, and_(
+             AvailabilityDay.schedule_id == AvailabilitySchedule.id,
+             AvailabilityDay.day >= today,
+             AvailabilityDay.day <= today + timedelta(days=29))).where(
+             AvailabilitySchedule.exhibitor_id.in_([exhibitor_id, user_id]),
+             AvailabilitySchedule.is_active == True)),
+        ('availability_calendar: bookings to materialize',
+         select(Booking.exhibitor_id, Booking.booking_date, Booking.start_time, Booking.end_time).where(
+             Booking.exhibitor_id.in_([exhibitor_id, user_id]),
+             Booking.booking_date >= today,
+             Booking.booking_date <= today + timedelta(days=29),
+             Booking.status.in_(['pending', 'confirmed']))),
+        ('availability_calendar: days of a booking',
+         select(AvailabilityDay).where(AvailabilityDay.exhibitor_id == exhibitor_id, AvailabilityDay.day == today)),
+        ('manage_schedule: upcoming bookings',
+         select(Booking).where(
+             Booking.exhibitor_id == exhibitor_id,
+             Booking.booking_date >= today,
+             Booking.status.in_(['pending', 'confirmed'])
+         ).order_by(Booking.booking_date, Booking.start_time)),
+        ('my_box: favorite exhibitors',
+         select(User).join(FavoriteExhibitor, FavoriteExhibitor.exhibitor_id == User.id).where(
+             FavoriteExhibitor.user_id == user_id, User.role == 'exhibitor')),
+        ('my_box: favorite products',
+         select(Product).join(FavoriteProduct).where(FavoriteProduct.user_id == user_id)),
+        ('my_box: visited exhibitors',
+         select(ExhibitorAnalytics.exhibitor_id).distinct().where(
+             ExhibitorAnalytics.user_id == user_id, ExhibitorAnalytics.action_type == 'visit')),
+        ('my_box: meetings count',
+         select(func.count(Booking.id)).where(
+             Booking.user_id == user_id, Booking.status != 'cancelled')),
+        ('exhibitor.profile: your bookings',
+         select(Booking).where(
+             Booking.user_id == user_id,
+             Booking.exhibitor_id == exhibitor_id,
+             Booking.booking_date >= today,
+             Booking.status.in_(['pending', 'confirmed'])
+         ).order_by(Booking.booking_date, Booking.start_time)),
+
+        # admin_routes.py
+        ('admin.dashboard: exhibitor count',
+         select(func.count(User.id)).where(User.role == 'exhibitor')),
+        ('admin.exhibitors: exhibitor page with aggregates',
+         select(User, *exhibitor_stats_columns()).outerjoin(Package).where(
+             User.role == 'exhibitor'
+         ).order_by(User.created_at.desc(), User.id.desc()).limit(20)),
+        ('admin.sales_report: recent sales',
+         select(Order).order_by(Order.created_at.desc()).limit(10)),
+        ('admin.sales_report: orders per package',
+         select(Order.package_id, func.count(Order.id)).group_by(Order.package_id)),
+        ('admin.sales_report: daily sales',
+         select(func.date(Order.created_at), func.count(Order.id)).where(
+             Order.created_at >= datetime.combine(today - timedelta(days=30), time.min)
+         ).group_by(func.date(Order.created_at))),
+        ('analytics_rollup: visits tail',
+         select(func.count(Visit.id), func.sum(Visit.duration)).where(
+             Visit.timestamp >= datetime.combine(today, time.min))),
+        ('analytics_rollup: daily rollup trend',
+         select(func.date(HourlyVisitStats.hour), func.sum(HourlyVisitStats.visits)).where(
+             HourlyVisitStats.hour >= datetime.combine(today - timedelta(days=30), time.min)
+         ).group_by(func.date(HourlyVisitStats.hour))),
+        ('analytics_rollup: repeat visitors',
+         select(func.count()).select_from(VisitorStats).where(VisitorStats.visits > 1)),
+        ('analytics_rollup: exhibitor actions',
+         select(DailyExhibitorStats.action_type, func.sum(DailyExhibitorStats.events)).where(
+             DailyExhibitorStats.exhibitor_id == exhibitor_id
+         ).group_by(DailyExhibitorStats.action_type)),
+        ('analytics_rollup: exhibitor actions tail',
+         select(ExhibitorAnalytics.action_type, func.count(ExhibitorAnalytics.id)).where(
+             ExhibitorAnalytics.exhibitor_id == exhibitor_id,
+             ExhibitorAnalytics.created_at >= datetime.combine(today, time.min)
+         ).group_by(ExhibitorAnalytics.action_type)),
+        ('analytics_rollup: compaction window',
+         select(ExhibitorAnalytics.exhibitor_id, func.count(ExhibitorAnalytics.id)).where(
+             ExhibitorAnalytics.created_at >= datetime.combine(today - timedelta(days=1), time.min),
+             ExhibitorAnalytics.created_at < datetime.combine(today, time.min)
+         ).group_by(ExhibitorAnalytics.exhibitor_id)),
+        ('admin.visit_statistics: daily visits',
+         select(func.date(Visit.timestamp), func.count(Visit.id)).where(
+             Visit.timestamp >= datetime.combine(today - timedelta(days=30), time.min)
+         ).group_by(func.date(Visit.timestamp))),
+    ]
+
+
+def _driver_value(value):
+    """SQLite stores dates and times as ISO strings"""
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+def explain(connection, statement):
+    """Return the EXPLAIN QUERY PLAN detail rows for a SQLAlchemy statement"""
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = tuple(_driver_value(compiled.params[name]) for name in compiled.positiontup)
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).fetchall()
+    return str(compiled), [row[-1] for row in rows]
+
+
+def full_scans(sql, plan, tables):
+    """Return the plan steps that scan a large table row by row"""
+    # Walking an index in ORDER BY order stops after LIMIT rows
+    limited = ' LIMIT ' in sql
+    scans = []
+    for detail in plan:
+        parts = detail.split()
+        if len(parts) < 2 or parts[0] != 'SCAN':
+            continue
+        table = parts[1]
+        if table not in tables or table in SMALL_TABLES:
+            continue
+        # A covering index scan never touches the table itself
+        if 'COVERING INDEX' in detail:
+            continue
+        if limited and 'USING INDEX' in detail:
+            continue
+        scans.append(detail)
+    return scans
+
+
+def main():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    tables = set(db.metadata.tables)
+
+    failures = 0
+    with engine.connect() as connection:
+        for label, statement in hot_queries():
+            sql, plan = explain(connection, statement)
+            scans = full_scans(sql, plan, tables)
+            status = 'FAIL' if scans else 'ok'
+            print(f"[{status}] {label}")
+            for detail in plan:
+                print(f"       {detail}")
+            failures += bool(scans)
+
+    if failures:
+        print(f"\n{failures} query(ies) do a full table scan")
+        return 1
+    print("\nAll hot queries use an index")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+Schedule index check for /exhibitor/schedule and /api/next-free-slot
+فحص فهرس جداول المواعيد
+
+Creates a throwaway SQLite database with an exhibitor holding one 20-minute
+window every hour of every weekday, then drives the real routes:
+
+- adding and editing a schedule that overlaps another one is refused, a free
+  window is saved, and the next overlap check already sees it,
+- /api/next-free-slot returns the first free session and skips it once it
+  is booked,
+- repeated lookups reuse the cached index instead of rebuilding it, a
+  schedule change only rebuilds the index of that exhibitor (a bulk update
+  rebuilds all of them), and a cached lookup is faster than loading and
+  indexing the schedules.
+
+Usage:
+    python check_schedule_index.py
+"""
+
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time as timer
+from datetime import datetime, time, timedelta
+
+LOOKUPS = 200
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='schedule_index_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'schedules.db')}"
+    os.environ['ANALYTICS_COMPACTION_INTERVAL'] = '0'
+    os.environ['CHATBOT_WARMUP'] = '0'
+    logging.disable(logging.INFO)
+
+    from app import app
+    from extensions import db
+    from models import AvailabilitySchedule, Booking, User
+    from schedule_index import ScheduleIndex, schedule_indexes
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    tomorrow = datetime.now().date() + timedelta(days=1)
+    # Weekday of the schedule edits - far from tomorrow so the next free slot stays put
+    edit_day = (tomorrow.weekday() + 3) % 7
+
+    with app.app_context():
+        db.create_all()
+        exhibitor = User(email='exhibitor@schedule.test', password='x', first_name='Schedule',
+                         last_name='Exhibitor', country='EG', role='exhibitor', company_name='Schedule Foods')
+        visitor = User(email='visitor@schedule.test', password='x', first_name='Visitor', last_name='One',
+                       country='EG')
+        other = User(email='other@schedule.test', password='x', first_name='Other', last_name='Exhibitor',
+                     country='EG', role='exhibitor', company_name='Other Foods')
+        db.session.add_all([exhibitor, visitor, other])
+        db.session.flush()
+        db.session.add(AvailabilitySchedule(exhibitor_id=other.id, day_of_week=edit_day, start_time=time(9, 0),
+                                            end_time=time(12, 0), session_duration=30))
+        db.session.add_all([
+            AvailabilitySchedule(exhibitor_id=exhibitor.id, day_of_week=day, start_time=time(hour, 0),
+                                 end_time=time(hour, 20), session_duration=20)
+            for day in range(7) for hour in range(24)
+        ])
+        db.session.commit()
+        exhibitor_id, visitor_id, other_id = exhibitor.id, visitor.id, other.id
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(exhibitor_id)
+        sess['_fresh'] = True
+    failures = 0
+
+    def flashes():
+        with client.session_transaction() as sess:
+            return [message for _, message in sess.pop('_flashes', [])]
+
+    def schedule_count():
+        with app.app_context():
+            return AvailabilitySchedule.query.filter_by(exhibitor_id=exhibitor_id, is_active=True).count()
+
+    def add(start, end):
+        # The schedule page renders its own flashes, so read them from the page
+        page = client.post('/exhibitor/schedule', data={'day_of_week': edit_day, 'start_time': start,
+                                                        'end_time': end, 'session_duration': 20})
+        text = page.get_data(as_text=True)
+        return [message for message in ('overlaps your schedule from 10:00 to 10:20',
+                                         'overlaps your schedule from 10:30 to 10:50',
+                                         'Schedule added successfully') if message in text]
+
+    def report(ok, message):
+        print(f"[{'ok' if ok else 'FAIL'}] {message}")
+        return not ok
+
+    def builds_for(exhibitor_ids):
+        """Exhibitors among exhibitor_ids whose index the next lookup rebuilds"""
+        rebuilt = []
+        with app.app_context():
+            for exhibitor_id in exhibitor_ids:
+                builds = schedule_indexes.counters['builds']
+                schedule_indexes.get(exhibitor_id)
+                if schedule_indexes.counters['builds'] > builds:
+                    rebuilt.append(exhibitor_id)
+        return rebuilt
+
+    # Overlap checks through manage_schedule and update_schedule
+    builds_for([exhibitor_id, other_id])
+    count = schedule_count()
+    messages = add('10:10', '10:40')
+    failures += report(schedule_count() == count and any('10:00 to 10:20' in m for m in messages),
+                       f"overlapping schedule refused: {messages}")
+    builds = schedule_indexes.counters['builds']
+    messages = add('10:30', '10:50')
+    failures += report(schedule_count() == count + 1 and any('successfully' in m for m in messages),
+                       f"free window saved: {messages}")
+    messages = add('10:40', '10:45')
+    failures += report(schedule_count() == count + 1 and any('10:30 to 10:50' in m for m in messages)
+                       and schedule_indexes.counters['builds'] == builds + 1,
+                       f"next check rebuilt the index and sees the new schedule: {messages}")
+    rebuilt = builds_for([other_id])
+    failures += report(rebuilt == [], f"other exhibitor's index kept (rebuilt: {rebuilt})")
+
+    with app.app_context():
+        new_id = AvailabilitySchedule.query.filter_by(exhibitor_id=exhibitor_id, day_of_week=edit_day,
+                                                      start_time=time(10, 30)).one().id
+    client.post(f'/exhibitor/schedule/{new_id}', data={'action': 'update', 'start_time': '10:05',
+                                                      'end_time': '10:50', 'session_duration': 20})
+    messages = flashes()
+    failures += report(any('10:00 to 10:20' in m for m in messages), f"overlapping edit refused: {messages}")
+    client.post(f'/exhibitor/schedule/{new_id}', data={'action': 'update', 'start_time': '10:25',
+                                                      'end_time': '10:55', 'session_duration': 30})
+    messages = flashes()
+    failures += report(any('successfully' in m for m in messages), f"edit overlapping only itself saved: {messages}")
+
+    # Next free slot
+    after = datetime.combine(tomorrow, time(10, 5))
+    url = f"/api/next-free-slot/{exhibitor_id}?after={after.strftime('%Y-%m-%dT%H:%M')}"
+    slot = client.get(url).get_json()['slot']
+    failures += report(slot is not None and slot['date'] == tomorrow.strftime('%Y-%m-%d') and slot['start'] == '11:00',
+                       f"next free slot after {after:%a %H:%M}: {slot}")
+
+    with app.app_context():
+        db.session.add(Booking(user_id=visitor_id, exhibitor_id=exhibitor_id, schedule_id=slot['schedule_id'],
+                               booking_date=tomorrow, start_time=time(11, 0), end_time=time(11, 20),
+                               status='confirmed'))
+        db.session.commit()
+    slot = client.get(url).get_json()['slot']
+    failures += report(slot is not None and slot['start'] == '12:00', f"booked slot skipped: {slot}")
+
+    # Cached index
+    builds = schedule_indexes.counters['builds']
+    for _ in range(5):
+        client.get(url)
+    failures += report(schedule_indexes.counters['builds'] == builds,
+                       f"repeated lookups reuse the index ({schedule_indexes.stats()})")
+
+    with app.app_context():
+        AvailabilitySchedule.query.filter_by(exhibitor_id=other_id).update({'session_duration': 20})
+        db.session.commit()
+    rebuilt = builds_for([exhibitor_id, other_id])
+    failures += report(rebuilt == [exhibitor_id, other_id], f"bulk update rebuilt every index: {rebuilt}")
+
+    with app.app_context():
+        cached, uncached = [], []
+        for _ in range(LOOKUPS):
+            started = timer.perf_counter()
+            schedule_indexes.get(exhibitor_id).overlapping(edit_day, time(9, 0), time(9, 10))
+            cached.append(timer.perf_counter() - started)
+            started = timer.perf_counter()
+            ScheduleIndex.for_exhibitor(exhibitor_id).overlapping(edit_day, time(9, 0), time(9, 10))
+            uncached.append(timer.perf_counter() - started)
+    cached_ms, uncached_ms = statistics.median(cached) * 1000, statistics.median(uncached) * 1000
+    failures += report(cached_ms < uncached_ms,
+                       f"lookup over {count + 1} schedules: {cached_ms:.2f} ms cached, "
+                       f"{uncached_ms:.2f} ms loading and indexing")
+
+    if failures:
+        print(f"\n{failures} check(s) failed")
+        return 1
+    print("\nSchedule lookups use the cached index and see every change")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Semantic chatbot cache check
+فحص الذاكرة المؤقتة الدلالية للشات بوت
+
+Fills a SemanticCache with ENTRIES synthetic questions, checks that
+paraphrases of a cached FAQ (other spacing, diacritics, punctuation, a typo,
+an extra word) get its answer while a different question - even one that
+differs in a single word - and the other language do not, that unrelated
+everyday questions never answer each other, then times LOOKUPS lookups
+against the full cache.
+
+Usage:
+    python check_semantic_cache.py [entries]
+"""
+
+import random
+import statistics
+import sys
+import time
+
+from chatbot_cache import SemanticCache
+
+ENTRIES = 50000
+LOOKUPS = 200
+# Lookups over the full cache must stay below this median
+MAX_MEDIAN_MS = 10
+
+FAQ = [
+    ('ar', 'كيف أسجل كعارض في المعرض', 'للتسجيل كعارض اختر "تسجيل عارض" ثم اختر الباقة.'),
+    ('en', 'how do i register as an exhibitor', 'Choose "Register as exhibitor" and pick a package.'),
+    ('en', 'what are the opening hours of the exhibition', 'The exhibition is open from 10:00 to 18:00.'),
+]
+PARAPHRASES = [
+    ('ar', 'كَيْفَ أُسَجِّـل كعارض في المعرض؟', 0),
+    ('en', 'How do I   register as an exhibitor?', 1),
+    ('en', 'how do i register as an exhibitor please', 1),
+    ('en', 'how do i registr as an exhibitor', 1),
+    ('en', 'What are the opening hours of the exhibition', 2),
+]
+MISSES = [
+    ('en', 'how much does the gold package cost'),
+    ('en', 'how do i register as a visitor'),
+    ('ar', 'كيف أسجل كزائر في المعرض'),
+    ('ar', 'how do i register as an exhibitor'),
+]
+
+# Every question is about something else - the cached half must not answer the other half
+UNRELATED = [
+    ('en', 'where can i park my car'), ('en', 'is there wifi in the hall'),
+    ('en', 'can i bring my children'), ('en', 'how do i reset my password'),
+    ('en', 'what payment methods do you accept'), ('en', 'where is the nearest hotel'),
+    ('en', 'can i get a refund for my ticket'), ('en', 'how do i upload a product video'),
+    ('en', 'who do i contact about my invoice'), ('en', 'is food tasting allowed at the booths'),
+    ('en', 'how big is a standard booth'), ('en', 'can i change my company name'),
+    ('en', 'when does registration close'), ('en', 'do you offer halal certification'),
+    ('en', 'how do i book a meeting with an exhibitor'), ('en', 'is the exhibition open on friday'),
+    ('en', 'can i cancel my booking'), ('en', 'where do i pick up my badge'),
+    ('ar', 'أين يمكنني ركن سيارتي'), ('ar', 'هل يوجد انترنت في القاعة'),
+    ('ar', 'كيف أغير كلمة المرور'), ('ar', 'متى يغلق التسجيل'),
+    ('ar', 'هل يمكنني إلغاء الحجز'), ('ar', 'ما هي طرق الدفع المتاحة'),
+]
+
+WORDS = ('package booth hall product price visitor company order meeting schedule video banner '
+         'gallery exhibitor account email phone country login password payment invoice').split()
+
+
+def synthetic_question(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 9))) + f' {rng.randint(0, 10 ** 6)}'
+
+
+def main(entries=ENTRIES):
+    if not SemanticCache.available:
+        print("numpy is not installed - the semantic cache is disabled")
+        return 1
+
+    rng = random.Random(7)
+    cache = SemanticCache(max_entries=entries + len(FAQ) + len(UNRELATED), ttl=3600)
+    started = time.perf_counter()
+    for language, question, answer in FAQ:
+        cache.put(language, question, answer)
+    for language, question in UNRELATED[::2]:
+        cache.put(language, question, question)
+    for i in range(entries):
+        cache.put('en' if i % 2 else 'ar', synthetic_question(rng), f'answer {i}')
+    fill_seconds = time.perf_counter() - started
+
+    failures = 0
+    for language, question, index in PARAPHRASES:
+        ok = cache.get(language, question) == FAQ[index][2]
+        print(f"[{'ok' if ok else 'FAIL'}] paraphrase hit: {question}")
+        failures += not ok
+    for language, question in MISSES:
+        answer = cache.get(language, question)
+        ok = answer is None
+        print(f"[{'ok' if ok else 'FAIL'}] miss ({language}): {question}" + ('' if ok else f" -> {answer}"))
+        failures += not ok
+    for language, question in UNRELATED[1::2]:
+        answer = cache.get(language, question)
+        ok = answer is None
+        print(f"[{'ok' if ok else 'FAIL'}] unrelated ({language}): {question}" + ('' if ok else f" -> {answer}"))
+        failures += not ok
+
+    timings = []
+    for _ in range(LOOKUPS):
+        question = synthetic_question(rng)
+        started = time.perf_counter()
+        cache.get('en', question)
+        timings.append((time.perf_counter() - started) * 1000)
+    median = statistics.median(timings)
+    p99 = sorted(timings)[int(len(timings) * 0.99) - 1]
+    ok = median <= MAX_MEDIAN_MS
+    print(f"[{'ok' if ok else 'FAIL'}] {LOOKUPS} lookups over {entries + len(FAQ) + len(UNRELATED) // 2} questions: "
+          f"median {median:.2f} ms, p99 {p99:.2f} ms (filled in {fill_seconds:.1f} s)")
+    failures += not ok
+
+    if failures:
+        print(f"\n{failures} check(s) failed")
+        return 1
+    print("\nSemantic cache matches paraphrases within the time budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:2])))
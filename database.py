@@ -0,0 +1,404 @@
+"""
+Database engine profiles - إعدادات محرك قاعدة البيانات
+
+DATABASE_URL selects the database (default: the SQLite file in instance/)
+and engine_options() returns the SQLALCHEMY_ENGINE_OPTIONS for its dialect.
+
+DATABASE_READ_URL optionally names a read replica (or the same SQLite file
+opened with ?mode=ro&uri=true). Views decorated with @read_only send their
+queries there; everything else, and every flush, uses the primary. Once a
+request commits a write its later queries - and the user's requests for
+DATABASE_READ_STICKY_SECONDS (default 5) - stay on the primary so users
+always read their own writes.
+
+SQLite allows a single writer per database file. In production mode every
+connection runs in WAL mode with synchronous=NORMAL, a busy timeout, memory
+mapped I/O and a larger page cache, and all writes from this process wait
+their turn in SQLiteWriteQueue instead of retrying on "database is locked".
+
+The schema is owned by the migrations in migrations/ (`flask db upgrade`).
+create_schema() only creates a database that is still empty, unless
+DATABASE_AUTO_CREATE=0.
+
+Settings (environment variables of the same name):
+    SQLITE_POOL          queue (default) - reuse up to SQLITE_POOL_SIZE connections
+                         null - a new connection per checkout
+                         static - one shared connection, for :memory: databases
+                         used from a single thread
+    SQLITE_POOL_SIZE     connections kept by the queue pool (default 5)
+    SQLITE_BUSY_TIMEOUT  milliseconds to wait for the write lock (default 5000)
+    SQLITE_MMAP_SIZE     bytes of the file to memory map (default 256 MiB)
+    SQLITE_CACHE_SIZE    page cache in KiB (default 65536)
+
+PostgreSQL runs with a pool sized so that every worker process together
+stays within DB_MAX_CONNECTIONS, a server-side statement_timeout and batched
+executemany. Server-side prepared statements need the psycopg 3 driver
+(postgresql+psycopg://); psycopg2 has no support for them.
+    WEB_CONCURRENCY          worker processes sharing the database (default 1)
+    DB_MAX_CONNECTIONS       connections this app may open in total (default 90)
+    DB_POOL_SIZE             per-process pool size, overrides the computed one
+    DB_STATEMENT_TIMEOUT     milliseconds before a statement is cancelled (default 30000)
+    DB_PREPARE_THRESHOLD     executions before psycopg 3 prepares a statement (default 5)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
+
+logger = logging.getLogger(__name__)
+
+SQLITE_POOLS = {'queue': QueuePool, 'null': NullPool, 'static': StaticPool}
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def database_url(default_sqlite_path):
+    """Return DATABASE_URL, or the SQLite file when it is not set"""
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        return f"sqlite:///{default_sqlite_path}"
+    # Heroku style URLs are not accepted by SQLAlchemy
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def read_database_url():
+    """Return DATABASE_READ_URL, or None when reads share the primary"""
+    url = os.environ.get('DATABASE_READ_URL')
+    if url and url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url or None
+
+
+def database_settings():
+    """Read the settings of every engine profile from the environment"""
+    # Create an empty database at startup instead of waiting for `flask db upgrade`
+    settings = {'DATABASE_AUTO_CREATE': os.environ.get('DATABASE_AUTO_CREATE', '1') == '1'}
+    settings.update(sqlite_settings())
+    settings.update(postgresql_settings())
+    return settings
+
+
+def engine_options(url, config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the dialect of url"""
+    backend = make_url(url).get_backend_name()
+    if backend == 'sqlite':
+        return sqlite_engine_options(config)
+    if backend == 'postgresql':
+        return postgresql_engine_options(url, config)
+    return {'pool_pre_ping': True, 'pool_recycle': 300}
+
+
+def schema_revisions(connection, directory=MIGRATIONS_DIR):
+    """(revisions the database is stamped with, head revisions of the migrations)"""
+    from alembic.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+    current = set(MigrationContext.configure(connection).get_current_heads())
+    return current, set(ScriptDirectory(directory).get_heads())
+
+
+def create_schema(app, db):
+    """Bring up the schema of the primary database at startup
+
+    Only an empty database is created here - with db.create_all() and
+    stamped at the latest migration, which is the same schema. Any other
+    database belongs to the migrations: create_all() would add the tables of
+    a pending revision ahead of it, so `flask db upgrade` then fails on
+    them, and it never adds columns to tables that exist.
+    """
+    from alembic.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+    from sqlalchemy import inspect
+
+    with db.engine.begin() as connection:
+        current, heads = schema_revisions(connection)
+        if not current and not inspect(connection).get_table_names():
+            if not app.config['DATABASE_AUTO_CREATE']:
+                logger.info("Empty database - create the schema with `flask db upgrade`")
+                return
+            db.metadata.create_all(connection)
+            MigrationContext.configure(connection).stamp(ScriptDirectory(MIGRATIONS_DIR), 'heads')
+            logger.info("Database created at the latest migration")
+        elif current != heads:
+            logger.warning(f"Database schema is at {sorted(current) or 'no revision'}, migrations are at "
+                           f"{sorted(heads)} - run `flask db upgrade`")
+
+
+def postgresql_settings():
+    """Read the PostgreSQL profile from the environment"""
+    pool_size = os.environ.get('DB_POOL_SIZE')
+    return {
+        'WEB_CONCURRENCY': int(os.environ.get('WEB_CONCURRENCY', 1)),
+        'DB_MAX_CONNECTIONS': int(os.environ.get('DB_MAX_CONNECTIONS', 90)),
+        'DB_POOL_SIZE': int(pool_size) if pool_size else None,
+        'DB_STATEMENT_TIMEOUT': int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000)),
+        'DB_PREPARE_THRESHOLD': int(os.environ.get('DB_PREPARE_THRESHOLD', 5)),
+    }
+
+
+def postgresql_engine_options(url, config):
+    """SQLALCHEMY_ENGINE_OPTIONS for a PostgreSQL database"""
+    # Every worker process has its own pool - split the connection budget between them
+    per_worker = max(config['DB_MAX_CONNECTIONS'] // max(config['WEB_CONCURRENCY'], 1), 2)
+    pool_size = config['DB_POOL_SIZE'] or per_worker // 2
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max(per_worker - pool_size, 0),
+        'pool_timeout': 30,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+        'connect_args': {
+            'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}",
+        },
+    }
+    driver = make_url(url).get_driver_name()
+    if driver == 'psycopg2':
+        # Multi-row INSERT ... VALUES for executemany, execute_batch for UPDATE/DELETE
+        options['executemany_mode'] = 'values_plus_batch'
+    elif driver == 'psycopg':
+        # Prepare statements on the server after they ran this many times on a connection
+        options['connect_args']['prepare_threshold'] = config['DB_PREPARE_THRESHOLD']
+    return options
+
+
+def sqlite_settings():
+    """Read the SQLite profile from the environment"""
+    return {
+        'DATABASE_READ_STICKY_SECONDS': int(os.environ.get('DATABASE_READ_STICKY_SECONDS', 5)),
+        'SQLITE_POOL': os.environ.get('SQLITE_POOL', 'queue'),
+        'SQLITE_POOL_SIZE': int(os.environ.get('SQLITE_POOL_SIZE', 5)),
+        'SQLITE_BUSY_TIMEOUT': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+        'SQLITE_MMAP_SIZE': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'SQLITE_CACHE_SIZE': int(os.environ.get('SQLITE_CACHE_SIZE', 65536)),
+    }
+
+
+def sqlite_engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for a SQLite database"""
+    pool = config['SQLITE_POOL']
+    if pool not in SQLITE_POOLS:
+        raise ValueError(f"SQLITE_POOL must be one of {', '.join(SQLITE_POOLS)}")
+    options = {
+        'poolclass': SQLITE_POOLS[pool],
+        'connect_args': {
+            # pysqlite's own busy wait, in seconds
+            'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000,
+            # Connections are handed between request, Socket.IO and background threads
+            'check_same_thread': False,
+        },
+    }
+    if pool == 'queue':
+        # Only one connection writes at a time, the rest serve concurrent reads
+        options['pool_size'] = config['SQLITE_POOL_SIZE']
+        options['max_overflow'] = config['SQLITE_POOL_SIZE'] * 2
+    return options
+
+
+class SQLiteWriteQueue:
+    """First come, first served lock held by one writing thread at a time
+
+    A thread that already holds it may acquire it again (nested sessions in
+    the same thread); it is released when every acquire has been released.
+    """
+
+    def __init__(self, timeout=5.0):
+        self.timeout = timeout
+        self._condition = threading.Condition()
+        self._waiting = deque()
+        self._owner = None
+        self._depth = 0
+        self.counters = {'writes': 0, 'waited': 0, 'timeouts': 0, 'max_wait_ms': 0}
+
+    def acquire(self):
+        """Wait for our turn, return False if the timeout expired first"""
+        me = threading.get_ident()
+        with self._condition:
+            if self._owner == me:
+                self._depth += 1
+                return True
+            started = time.monotonic()
+            self._waiting.append(me)
+            acquired = self._condition.wait_for(
+                lambda: self._owner is None and self._waiting[0] == me, self.timeout)
+            if not acquired:
+                self._waiting.remove(me)
+                self._condition.notify_all()
+                self.counters['timeouts'] += 1
+                return False
+            self._waiting.popleft()
+            self._owner = me
+            self._depth = 1
+            waited_ms = int((time.monotonic() - started) * 1000)
+            self.counters['writes'] += 1
+            self.counters['waited'] += waited_ms > 0
+            self.counters['max_wait_ms'] = max(self.counters['max_wait_ms'], waited_ms)
+            return True
+
+    def release(self):
+        with self._condition:
+            if self._owner != threading.get_ident():
+                return
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        acquired = self.acquire()
+        try:
+            yield
+        finally:
+            if acquired:
+                self.release()
+
+    def stats(self):
+        with self._condition:
+            return dict(self.counters, queued=len(self._waiting))
+
+
+# Set by init_sqlite() when the app runs on SQLite
+write_queue = None
+
+
+@contextmanager
+def serialized_write():
+    """Hold the SQLite write queue around writes that bypass the ORM session"""
+    if write_queue is None:
+        yield
+        return
+    with write_queue.writing():
+        yield
+
+
+def _set_sqlite_pragmas(config, read_only=False):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not read_only:
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}")
+        cursor.execute(f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}")
+        # Negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE'])}")
+        cursor.close()
+    return on_connect
+
+
+def _begin_write(session):
+    """Take the write queue the first time a session transaction writes"""
+    if not session.info.get('sqlite_write_queue'):
+        session.info['sqlite_write_queue'] = write_queue.acquire()
+        if not session.info['sqlite_write_queue']:
+            logger.warning("SQLite write queue timed out, falling back to busy_timeout")
+
+
+def _before_flush(session, flush_context, instances):
+    _begin_write(session)
+
+
+def _do_orm_execute(orm_execute_state):
+    # Bulk query.update() / query.delete() and insert() statements do not flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _begin_write(orm_execute_state.session)
+
+
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None and session.info.pop('sqlite_write_queue', False):
+        write_queue.release()
+
+
+def init_sqlite_replica(app, engine):
+    """Apply the read pragmas to every new connection of a read-only SQLite engine"""
+    event.listen(engine, 'connect', _set_sqlite_pragmas(app.config, read_only=True))
+
+
+def init_sqlite(app, engine):
+    """Apply the pragmas to every new connection and serialize session writes"""
+    global write_queue
+    config = app.config
+    event.listen(engine, 'connect', _set_sqlite_pragmas(config))
+
+    write_queue = SQLiteWriteQueue(timeout=config['SQLITE_BUSY_TIMEOUT'] / 1000)
+    app.extensions['sqlite_write_queue'] = write_queue
+    if not event.contains(Session, 'before_flush', _before_flush):
+        event.listen(Session, 'before_flush', _before_flush)
+        event.listen(Session, 'do_orm_execute', _do_orm_execute)
+        event.listen(Session, 'after_transaction_end', _after_transaction_end)
+
+
+# Read/write routing
+
+READ_BIND = 'read'
+
+
+def read_only(view):
+    """Serve a view that never writes from the read engine when one is configured"""
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return decorated_function
+
+
+def _reads_from_replica():
+    if not has_app_context() or not g.get('db_read_only') or g.get('db_wrote'):
+        return False
+    if has_request_context():
+        return flask_session.get('db_primary_until', 0) <= time.time()
+    return True
+
+
+class RoutingSession(FlaskSession):
+    """Session sending the queries of @read_only views to the read engine"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or self._flushing:
+            return engine
+        engines = self._db.engines
+        if READ_BIND in engines and engine is engines.get(None) and _reads_from_replica():
+            return engines[READ_BIND]
+        return engine
+
+
+def _mark_write(session, *args):
+    session.info['db_wrote'] = True
+
+
+def _mark_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _mark_write(orm_execute_state.session)
+
+
+def _after_commit(session):
+    """Keep the rest of the request, and the user for a few seconds, on the primary"""
+    if not session.info.pop('db_wrote', False) or not has_app_context():
+        return
+    g.db_wrote = True
+    if has_request_context() and READ_BIND in session._db.engines:
+        sticky_seconds = current_app.config.get('DATABASE_READ_STICKY_SECONDS', 0)
+        if sticky_seconds:
+            flask_session['db_primary_until'] = time.time() + sticky_seconds
+
+
+def _after_rollback(session):
+    session.info.pop('db_wrote', None)
+
+
+event.listen(RoutingSession, 'after_flush', _mark_write)
+event.listen(RoutingSession, 'do_orm_execute', _mark_dml)
+event.listen(RoutingSession, 'after_commit', _after_commit)
+event.listen(RoutingSession, 'after_rollback', _after_rollback)
@@ -1,7 +1,9 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app
 from flask_login import login_required, current_user
-from models import AvailableSlot, db, User, Product, ExhibitorAnalytics, FavoriteExhibitor, Appointment, Specialization, ExhibitorBanner, Video
+from models import BOOKING_ACTIVE_STATUSES, db, User, Product, FavoriteExhibitor, Specialization, ExhibitorBanner, Video, Booking
 from werkzeug.utils import secure_filename
+from analytics_rollup import exhibitor_action_counts
+import availability_calendar
 from datetime import datetime
 import os
 from functools import wraps
@@ -25,23 +27,32 @@ def dashboard():
     # Use current_user directly - all exhibitor data is now in the User model
     exhibitor = current_user
     
-    # Get analytics data for this exhibitor
-    analytics = ExhibitorAnalytics.query.filter_by(exhibitor_id=exhibitor.id).first()
+    # Get analytics data for this exhibitor - daily rollups plus today's raw actions
+    analytics = exhibitor_action_counts(exhibitor.id)
     
     # Get favorite count for this exhibitor
     favorite_count = FavoriteExhibitor.query.filter_by(exhibitor_id=exhibitor.id).count()
     
+    # Get booking count for this exhibitor
+    booking_count = Booking.query.filter(
+        Booking.exhibitor_id == exhibitor.id,
+        Booking.status.in_(['pending', 'confirmed', 'completed'])
+    ).count()
+    
     # Get upcoming appointments for this exhibitor
-    upcoming_appointments = Appointment.query.filter_by(exhibitor_id=exhibitor.id)\
-        .filter(Appointment.status != 'cancelled')\
-        .order_by(Appointment.appointment_date.asc())\
-        .limit(5)\
-        .all()
+    upcoming_appointments = Booking.query.filter(
+        Booking.exhibitor_id == exhibitor.id,
+        Booking.booking_date >= datetime.now().date(),
+        Booking.status.in_(BOOKING_ACTIVE_STATUSES)
+    ).order_by(Booking.booking_date, Booking.start_time).limit(5).all()
     
     return render_template('exhibitor_dashboard.html',
                          exhibitor=exhibitor,
                          analytics=analytics,
                          favorite_count=favorite_count,
+                         total_visits=analytics.get('visit', 0),
+                         total_favorites=favorite_count,
+                         total_bookings=booking_count,
                          upcoming_appointments=upcoming_appointments)
 
 @exhibitor.route("/profile/<int:exhibitor_id>")
@@ -72,20 +83,18 @@ def profile(exhibitor_id):
             exhibitor_id=exhibitor_profile.id
         ).first() is not None
 
-    # Get available slots for this exhibitor
-    available_slots = AvailableSlot.query.filter_by(
-        exhibitor_id=exhibitor_profile.id,
-        is_available=True
-    ).order_by(AvailableSlot.start_time).all()
+    # Free slots for the next 30 days from the availability calendar
+    available_slots = availability_calendar.available_slots(exhibitor_profile.id)
 
     # Get booked slots for the current user with this exhibitor
     booked_slots = []
     if current_user.is_authenticated:
-        booked_slots = Appointment.query.filter_by(
-            user_id=current_user.id,
-            exhibitor_id=exhibitor_profile.id,
-            status='scheduled'
-        ).all()
+        booked_slots = Booking.query.filter(
+            Booking.user_id == current_user.id,
+            Booking.exhibitor_id == exhibitor_profile.id,
+            Booking.booking_date >= datetime.now().date(),
+            Booking.status.in_(BOOKING_ACTIVE_STATUSES)
+        ).order_by(Booking.booking_date, Booking.start_time).all()
 
     return render_template('exhibitor_profile.html',
                          exhibitor=exhibitor_profile,
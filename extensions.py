@@ -1,8 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_socketio import SocketIO
+from database import RoutingSession
 
-# Initialize SQLAlchemy with no settings
-db = SQLAlchemy()
+# Initialize SQLAlchemy with no settings - RoutingSession sends @read_only views to the read engine
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 socketio = SocketIO(cors_allowed_origins="*")
@@ -0,0 +1,204 @@
+"""
+Gallery hall snapshot cache - ذاكرة مؤقتة لقاعات المعرض
+
+gallery() and gallery_hall() render from immutable per-hall snapshots kept
+in memory and keyed by (hall, version). The version is a counter stored in
+the settings table (see version_counter.py); any committed change to the
+exhibitor fields shown in the gallery, to GalleryAd, ExhibitorBanner or to
+the product list bumps it in the same transaction. The process that made the change rebuilds on its
+next request, other worker processes notice the new version within
+GALLERY_VERSION_CHECK_SECONDS, so in steady state the gallery does no
+database reads.
+"""
+
+import hashlib
+import json
+import threading
+from types import SimpleNamespace
+
+from sqlalchemy import func, inspect
+
+from extensions import db
+from models import User, GalleryAd, ExhibitorBanner, Product
+from version_counter import VersionCounter
+
+HALLS = ('hall1', 'hall2', 'hall3')
+
+VERSION_KEY = 'gallery_version'
+
+# Exhibitor columns rendered by the gallery templates and the scene API
+EXHIBITOR_FIELDS = (
+    'id', 'company_name', 'description', 'company_description', 'logo_url', 'banner_url', 'video_url',
+    'gallery_hall', 'position_x', 'position_y', 'position_z', 'ranking', 'website',
+    'contact_email', 'contact_phone', 'specialization_id',
+)
+AD_FIELDS = ('id', 'title', 'description', 'image_url', 'link_url', 'position', 'hall', 'display_order')
+BANNER_FIELDS = ('id', 'title', 'image_path', 'display_order')
+
+# Changes to these User columns alter what the gallery shows
+WATCHED_USER_FIELDS = frozenset(EXHIBITOR_FIELDS) | {'role', 'is_active', 'hall'}
+WATCHED_MODELS = (GalleryAd, ExhibitorBanner, Product)
+
+
+def _freeze(row, fields):
+    return SimpleNamespace(**{field: getattr(row, field, None) for field in fields})
+
+
+# Columns of the /api/gallery/<hall>/scene payload
+SCENE_EXHIBITOR_COLUMNS = ('id', 'name', 'description', 'x', 'y', 'z', 'ranking', 'logo', 'banner', 'products')
+SCENE_AD_COLUMNS = ('id', 'title', 'description', 'image', 'link', 'position')
+
+
+class HallSnapshot:
+    """Exhibitors (with product counts and banners) and ads of one hall at one version"""
+
+    def __init__(self, hall, version, exhibitors, ads):
+        self.hall = hall
+        self.version = version
+        self.exhibitors = exhibitors
+        self.ads = ads
+        self._scene = None
+
+    @property
+    def etag(self):
+        """Content hash of the scene JSON"""
+        return hashlib.sha1(self.scene_json()).hexdigest()[:20]
+
+    def scene_json(self):
+        """Compact columnar JSON of the hall, encoded once per snapshot"""
+        if self._scene is None:
+            self._scene = json.dumps({
+                'hall': self.hall,
+                'version': self.version,
+                'exhibitors': {
+                    'columns': SCENE_EXHIBITOR_COLUMNS,
+                    'rows': [[
+                        exhibitor.id,
+                        exhibitor.company_name,
+                        (exhibitor.description or '')[:100],
+                        exhibitor.position_x or 0,
+                        exhibitor.position_y or 0,
+                        exhibitor.position_z or 0,
+                        exhibitor.ranking or 0,
+                        exhibitor.logo_url,
+                        exhibitor.banners[0].image_path if exhibitor.banners else exhibitor.banner_url,
+                        exhibitor.product_count,
+                    ] for exhibitor in self.exhibitors],
+                },
+                'ads': {
+                    'columns': SCENE_AD_COLUMNS,
+                    'rows': [[ad.id, ad.title, ad.description, ad.image_url, ad.link_url, ad.position]
+                             for ad in self.ads],
+                },
+            }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return self._scene
+
+
+class GalleryCache:
+    def __init__(self, versions):
+        self.versions = versions
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self.counters = {'hits': 0, 'builds': 0}
+
+    def init_app(self, app):
+        self.versions.check_seconds = app.config.get('GALLERY_VERSION_CHECK_SECONDS', self.versions.check_seconds)
+        app.extensions['gallery_cache'] = self
+
+    def version(self):
+        """Current version, read from the database at most every GALLERY_VERSION_CHECK_SECONDS"""
+        return self.versions.values(VERSION_KEY)[0]
+
+    def _cached(self, key, build):
+        version = self.version()
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None and snapshot.version == version:
+            self.counters['hits'] += 1
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is None or snapshot.version != version:
+                snapshot = build(version)
+                self._snapshots[key] = snapshot
+                self.counters['builds'] += 1
+        return snapshot
+
+    def hall(self, hall):
+        """HallSnapshot for one hall - only the known halls are kept in memory"""
+        if hall not in HALLS:
+            return build_hall_snapshot(hall, self.version())
+        return self._cached(hall, lambda version: build_hall_snapshot(hall, version))
+
+    def ads(self):
+        """Every active gallery ad, for the main gallery page"""
+        return self._cached(None, build_ads_snapshot).ads
+
+    def stats(self):
+        return dict(self.counters, **self.versions.counters, version=self.versions.last_read(VERSION_KEY),
+                    snapshots=len(self._snapshots))
+
+
+def build_hall_snapshot(hall, version):
+    exhibitors = User.query.filter_by(gallery_hall=hall, role='exhibitor', is_active=True)\
+        .order_by(User.ranking)\
+        .all()
+    exhibitor_ids = [exhibitor.id for exhibitor in exhibitors]
+
+    product_counts = {}
+    banners = {}
+    if exhibitor_ids:
+        product_counts = dict(
+            db.session.query(Product.exhibitor_id, func.count(Product.id))
+            .filter(Product.exhibitor_id.in_(exhibitor_ids))
+            .group_by(Product.exhibitor_id)
+            .all()
+        )
+        for banner in ExhibitorBanner.query.filter(
+                ExhibitorBanner.exhibitor_id.in_(exhibitor_ids),
+                ExhibitorBanner.is_active == True
+        ).order_by(ExhibitorBanner.display_order):
+            banners.setdefault(banner.exhibitor_id, []).append(_freeze(banner, BANNER_FIELDS))
+
+    frozen = []
+    for exhibitor in exhibitors:
+        item = _freeze(exhibitor, EXHIBITOR_FIELDS)
+        item.product_count = product_counts.get(exhibitor.id, 0)
+        item.banners = tuple(banners.get(exhibitor.id, ()))
+        frozen.append(item)
+
+    ads = GalleryAd.query.filter_by(hall=hall, is_active=True).order_by(GalleryAd.display_order).all()
+    return HallSnapshot(hall, version, tuple(frozen), tuple(_freeze(ad, AD_FIELDS) for ad in ads))
+
+
+def build_ads_snapshot(version):
+    ads = GalleryAd.query.filter_by(is_active=True).order_by(GalleryAd.display_order).all()
+    return HallSnapshot(None, version, (), tuple(_freeze(ad, AD_FIELDS) for ad in ads))
+
+
+# Version bumps - run inside the transaction that changes gallery data
+
+def _touches_gallery(session):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, WATCHED_MODELS):
+            return True
+        if isinstance(obj, User):
+            if obj in session.new or obj in session.deleted:
+                if obj.role == 'exhibitor':
+                    return True
+                continue
+            attrs = inspect(obj).attrs
+            if any(attrs[field].history.has_changes() for field in WATCHED_USER_FIELDS):
+                return True
+    return False
+
+
+def _changed_keys(session):
+    return (VERSION_KEY,) if _touches_gallery(session) else ()
+
+
+def _bulk_keys(mapper):
+    # Bulk statements on gallery tables
+    return (VERSION_KEY,) if issubclass(mapper.class_, (User,) + WATCHED_MODELS) else ()
+
+
+gallery_cache = GalleryCache(VersionCounter('gallery_changed', _changed_keys, _bulk_keys, check_seconds=5))
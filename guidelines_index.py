@@ -0,0 +1,211 @@
+"""
+Guidelines retrieval - البحث في توجيهات الشات بوت
+
+chatbot_guidelines.txt is far too long to send with every message, so
+AIProvider splits it into sections once when it loads and indexes them with
+BM25. Each prompt then carries the PINNED_SECTIONS (response style and the
+closing summary with the contact details) plus the sections that best match
+the question, most relevant first, until CHATBOT_CONTEXT_TOKENS is spent.
+
+Sections start at every "##"/"###" heading and every FAQ question line and
+keep the titles of their parent headings. Terms are normalized for both
+languages: Arabic diacritics, tatweel and letter variants are folded and
+the common prefixes/suffixes stripped, English is case folded with plural
+endings removed, and stop words of both languages are skipped. The file is
+written in Arabic, so QUERY_EXPANSIONS adds the Arabic terms of common
+English (and colloquial Arabic) question words to a query.
+"""
+
+import heapq
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+from chatbot_cache import normalize_question
+
+CONTEXT_TOKENS = int(os.environ.get('CHATBOT_CONTEXT_TOKENS', 1500))
+CONTEXT_SECTIONS = int(os.environ.get('CHATBOT_CONTEXT_SECTIONS', 5))
+
+# "## " titles of the sections sent with every question
+PINNED_SECTIONS = ('نوع الردود والسلوك المطلوب', 'الخلاصة والنقاط الذهبية')
+
+# Sections longer than this are split at blank lines
+MAX_SECTION_TOKENS = 400
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_HEADING = re.compile(r'^(#{2,3})\s+(.*?)\s*$')
+_QUESTION = re.compile(r'^\*\*(?:س|Q)\s*:')
+_RULE = re.compile(r'^[═─=\-]{5,}\s*$')
+_WORD = re.compile(r'\w+')
+
+_ARABIC_LETTERS = str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا', 'ة': 'ه', 'ى': 'ي', 'ؤ': 'و', 'ئ': 'ي'})
+_ARABIC_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال', 'و')
+# Single-letter proclitics, only stripped from longer words
+_ARABIC_PROCLITICS = ('ب', 'ك', 'ل', 'ف')
+_ARABIC_SUFFIXES = ('ها', 'ان', 'ات', 'ون', 'ين', 'يه', 'ه', 'ي')
+
+STOP_WORDS = frozenset("""
+    a an the and or of to in on at for with by from is are was were be been it this that these those
+    i you he she we they my your our me do does did can could how what when where which who why
+    please hi hello
+    في من الى علي عن مع هل ما ماذا كيف متي اين هذا هذه ذلك التي الذي هو هي انا انت نحن هم او ثم قد لا
+    كل اي ان بعد قبل عند لدي
+""".split())
+
+
+def estimate_tokens(text):
+    """Rough prompt size - about three characters per token across Arabic and English"""
+    return len(text) // 3 + 1
+
+
+def _stem(word):
+    if word.isascii():
+        if len(word) > 4 and word.endswith('ies'):
+            return word[:-3] + 'y'
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            return word[:-1]
+        return word
+    for prefix in _ARABIC_PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= 3:
+            word = word[len(prefix):]
+            break
+    else:
+        if word[0] in _ARABIC_PROCLITICS and len(word) >= 5:
+            word = word[1:]
+    for suffix in _ARABIC_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def terms(text):
+    """Index terms of a text - see the module docstring"""
+    words = _WORD.findall(normalize_question(text).translate(_ARABIC_LETTERS))
+    return [_stem(word) for word in words if word not in STOP_WORDS and not word.isdigit()]
+
+
+_EXPANSIONS = {
+    'register': 'التسجيل', 'signup': 'التسجيل', 'اسجل': 'التسجيل', 'سجل': 'التسجيل',
+    'exhibitor': 'العارض العارضين', 'visitor': 'الزائر الزوار', 'admin': 'المسؤول',
+    'package': 'الباقات الاشتراك', 'subscription': 'الاشتراك', 'plan': 'الباقات',
+    'price': 'تكلفة رسوم سعر', 'cost': 'تكلفة رسوم', 'fee': 'رسوم',
+    'hour': 'ساعات العمل', 'open': 'ساعات فتح', 'contact': 'التواصل الاتصال', 'support': 'الدعم',
+    'email': 'البريد الإلكتروني', 'phone': 'الهاتف', 'address': 'المقر الموقع', 'location': 'المقر الموقع',
+    'appointment': 'موعد حجز', 'meeting': 'موعد', 'book': 'حجز', 'booking': 'حجز',
+    'product': 'المنتجات', 'payment': 'الدفع', 'pay': 'الدفع', 'order': 'طلباتي الطلبات',
+    'company': 'الشركة', 'parent': 'الشركة الأم', 'owner': 'الشركة الأم',
+    'secure': 'آمنة الأمان', 'security': 'الأمان', 'safe': 'آمنة',
+    'account': 'الحساب', 'login': 'الدخول', 'password': 'كلمة المرور', 'problem': 'المشاكل مشكلة',
+    'international': 'الدولية', 'app': 'تطبيقات الجوال', 'mobile': 'الجوال',
+}
+QUERY_EXPANSIONS = {_stem(word): terms(arabic) for word, arabic in _EXPANSIONS.items()}
+
+
+def query_terms(text):
+    """Terms of a question plus the Arabic terms of its QUERY_EXPANSIONS"""
+    found = set()
+    for term in terms(text):
+        found.add(term)
+        found.update(QUERY_EXPANSIONS.get(term, ()))
+    return found
+
+
+class Section:
+    def __init__(self, titles, lines):
+        self.title = ' › '.join(titles)
+        self.top_title = titles[0] if titles else ''
+        self.text = '\n'.join(lines).strip()
+        self.tokens = estimate_tokens(self.text)
+
+
+def split_sections(text):
+    """Sections of the guidelines, in file order"""
+    sections = []
+    titles = []
+    lines = []
+
+    def heading():
+        return [f"{'#' * (len(titles) + 1)} {titles[-1]}"] if titles else []
+
+    def add(chunk):
+        # A heading followed only by sub-headings carries no text of its own
+        if sum(1 for line in chunk if line.strip()) > 1:
+            sections.append(Section(titles, chunk))
+
+    def close():
+        # Oversized sections are split at blank lines, every part starts with the heading
+        chunk, size = [], 0
+        for line in lines:
+            if not line.strip() and size >= MAX_SECTION_TOKENS * 3:
+                add(chunk)
+                chunk, size = heading(), 0
+            chunk.append(line)
+            size += len(line) + 1
+        add(chunk)
+        lines.clear()
+
+    for line in text.splitlines():
+        if _RULE.match(line):
+            continue
+        match = _HEADING.match(line)
+        if match:
+            close()
+            del titles[len(match.group(1)) - 2:]
+            titles.append(match.group(2).rstrip(':'))
+            lines.append(line)
+        elif _QUESTION.match(line):
+            close()
+            lines.extend(heading())
+            lines.append(line)
+        else:
+            lines.append(line)
+    close()
+    return sections
+
+
+class GuidelinesIndex:
+    """BM25 inverted index over the sections of the guidelines"""
+
+    def __init__(self, text):
+        self.sections = split_sections(text)
+        self.pinned = [i for i, section in enumerate(self.sections) if section.top_title in PINNED_SECTIONS]
+        self.postings = defaultdict(list)  # term -> [(section, term frequency)]
+        self.lengths = []
+        for i, section in enumerate(self.sections):
+            counts = Counter(terms(section.text))
+            self.lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                self.postings[term].append((i, count))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+        count = len(self.sections)
+        self.idf = {
+            term: math.log(1 + (count - len(found) + 0.5) / (len(found) + 0.5))
+            for term, found in self.postings.items()
+        }
+
+    def search(self, query, limit=CONTEXT_SECTIONS):
+        """(score, section index) of the best matching sections, best first"""
+        scores = defaultdict(float)
+        for term in query_terms(query):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, count in self.postings[term]:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / self.average_length)
+                scores[i] += idf * count * (BM25_K1 + 1) / (count + norm)
+        return heapq.nlargest(limit, ((score, i) for i, score in scores.items()))
+
+    def context(self, query, budget=CONTEXT_TOKENS, limit=CONTEXT_SECTIONS):
+        """Guidelines text for a prompt: pinned sections, then the best matches, within budget tokens"""
+        chosen = []
+        spent = 0
+        for i in self.pinned + [i for _, i in self.search(query, limit) if i not in self.pinned]:
+            section = self.sections[i]
+            if spent + section.tokens > budget:
+                continue
+            chosen.append(i)
+            spent += section.tokens
+        return '\n\n'.join(self.sections[i].text for i in sorted(chosen))
@@ -1,4 +1,5 @@
 from main import create_app, db
+from flask_migrate import upgrade
 from models import User, Package, Specialization, Product, Banner, ChatMessage, Visit
 from werkzeug.security import generate_password_hash
 import os
@@ -9,8 +10,8 @@ def init_db():
         # Create database directory if it doesn't exist
         db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "food_exhibit.db")
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        # Create all tables
-        db.create_all()
+        # Create or update the tables
+        upgrade()
         
         # Check if admin user exists
         admin = User.query.filter_by(email='admin@foodexhibit.com').first()
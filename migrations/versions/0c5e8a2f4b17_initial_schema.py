@@ -0,0 +1,321 @@
+"""initial schema
+
+Revision ID: 0c5e8a2f4b17
+Revises: 
+Create Date: 2026-10-16 20:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0c5e8a2f4b17'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _create_table(name, *columns, **kw):
+    """op.create_table, skipped for databases made by db.create_all() before the migrations existed"""
+    if name not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(name, *columns, **kw)
+
+
+def upgrade():
+    # The tables as models.py declared them before any later revision
+    _create_table('banners',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=100), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('title_en', sa.String(length=100), nullable=True),
+        sa.Column('description_en', sa.Text(), nullable=True),
+        sa.Column('title_fr', sa.String(length=100), nullable=True),
+        sa.Column('description_fr', sa.Text(), nullable=True),
+        sa.Column('image_path', sa.String(length=255), nullable=False),
+        sa.Column('link', sa.String(length=255), nullable=True),
+        sa.Column('order', sa.Integer(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('language', sa.String(length=2), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('gallery_ads',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('image_url', sa.String(), nullable=False),
+        sa.Column('link_url', sa.String(), nullable=True),
+        sa.Column('position', sa.String(length=20), nullable=True),
+        sa.Column('hall', sa.String(length=20), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('display_order', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('packages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('name_en', sa.String(length=100), nullable=True),
+        sa.Column('price', sa.Float(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('description_en', sa.Text(), nullable=True),
+        sa.Column('features', sa.Text(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('partners',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=200), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('image_path', sa.String(length=255), nullable=False),
+        sa.Column('website_url', sa.String(length=255), nullable=True),
+        sa.Column('display_order', sa.Integer(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('settings',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=50), nullable=False),
+        sa.Column('value', sa.String(length=255), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('key')
+    )
+    _create_table('specializations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+    _create_table('users',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=False),
+        sa.Column('password', sa.String(length=255), nullable=False),
+        sa.Column('first_name', sa.String(length=50), nullable=False),
+        sa.Column('last_name', sa.String(length=50), nullable=False),
+        sa.Column('profile_image_url', sa.String(length=255), nullable=True),
+        sa.Column('role', sa.String(length=20), nullable=True),
+        sa.Column('phone', sa.String(length=20), nullable=True),
+        sa.Column('country', sa.String(length=100), nullable=False),
+        sa.Column('company_name', sa.String(length=100), nullable=True),
+        sa.Column('hall', sa.String(length=20), nullable=True),
+        sa.Column('company_description', sa.Text(), nullable=True),
+        sa.Column('specialization_id', sa.Integer(), nullable=True),
+        sa.Column('package_id', sa.Integer(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('logo_url', sa.String(length=255), nullable=True),
+        sa.Column('banner_url', sa.String(length=255), nullable=True),
+        sa.Column('video_url', sa.String(length=255), nullable=True),
+        sa.Column('gallery_hall', sa.String(length=50), nullable=True),
+        sa.Column('position_x', sa.Float(), nullable=True),
+        sa.Column('position_y', sa.Float(), nullable=True),
+        sa.Column('position_z', sa.Float(), nullable=True),
+        sa.Column('ranking', sa.Integer(), nullable=True),
+        sa.Column('website', sa.String(length=255), nullable=True),
+        sa.Column('contact_email', sa.String(length=120), nullable=True),
+        sa.Column('contact_phone', sa.String(length=20), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['package_id'], ['packages.id'], ),
+        sa.ForeignKeyConstraint(['specialization_id'], ['specializations.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email')
+    )
+    _create_table('availability_schedules',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exhibitor_id', sa.Integer(), nullable=False),
+        sa.Column('day_of_week', sa.Integer(), nullable=False),
+        sa.Column('start_time', sa.Time(), nullable=False),
+        sa.Column('end_time', sa.Time(), nullable=False),
+        sa.Column('session_duration', sa.Integer(), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['exhibitor_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('available_slot',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exhibitor_id', sa.Integer(), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('end_time', sa.DateTime(), nullable=False),
+        sa.Column('duration_minutes', sa.Integer(), nullable=True),
+        sa.Column('is_available', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['exhibitor_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('chat_messages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('sender_id', sa.Integer(), nullable=False),
+        sa.Column('receiver_id', sa.Integer(), nullable=False),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.Column('is_read', sa.Boolean(), nullable=True),
+        sa.ForeignKeyConstraint(['receiver_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['sender_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('exhibitor_banners',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exhibitor_id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('image_path', sa.String(length=255), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('display_order', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['exhibitor_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('favorite_exhibitors',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('exhibitor_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['exhibitor_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'exhibitor_id', name='uq_user_exhibitor')
+    )
+    _create_table('orders',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('package_id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('payment_method', sa.String(length=50), nullable=True),
+        sa.Column('transaction_id', sa.String(length=100), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['package_id'], ['packages.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('products',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exhibitor_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=200), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('price', sa.Float(), nullable=True),
+        sa.Column('currency', sa.String(length=10), nullable=True),
+        sa.Column('image_url', sa.String(), nullable=True),
+        sa.Column('category', sa.String(length=100), nullable=True),
+        sa.Column('is_featured', sa.Boolean(), nullable=True),
+        sa.Column('is_homepage_featured', sa.Boolean(), nullable=True),
+        sa.Column('view_count', sa.Integer(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['exhibitor_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('videos',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exhibitor_id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('video_url', sa.String(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['exhibitor_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('visits',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('visitor_id', sa.String(length=50), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.Column('duration', sa.Integer(), nullable=True),
+        sa.Column('page_views', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('appointment',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('exhibitor_id', sa.Integer(), nullable=False),
+        sa.Column('slot_id', sa.Integer(), nullable=False),
+        sa.Column('appointment_date', sa.DateTime(), nullable=False),
+        sa.Column('duration_minutes', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('notes', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['exhibitor_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['slot_id'], ['available_slot.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('bookings',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('exhibitor_id', sa.Integer(), nullable=False),
+        sa.Column('schedule_id', sa.Integer(), nullable=False),
+        sa.Column('booking_date', sa.Date(), nullable=False),
+        sa.Column('start_time', sa.Time(), nullable=False),
+        sa.Column('end_time', sa.Time(), nullable=False),
+        sa.Column('notes', sa.Text(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['exhibitor_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['schedule_id'], ['availability_schedules.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('exhibitor_analytics',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exhibitor_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('action_type', sa.String(length=50), nullable=True),
+        sa.Column('page_visited', sa.String(length=100), nullable=True),
+        sa.Column('product_id', sa.Integer(), nullable=True),
+        sa.Column('session_duration', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['exhibitor_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('favorite_products',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'product_id', name='uq_user_product')
+    )
+
+
+def downgrade():
+    op.drop_table('favorite_products')
+    op.drop_table('exhibitor_analytics')
+    op.drop_table('bookings')
+    op.drop_table('appointment')
+    op.drop_table('visits')
+    op.drop_table('videos')
+    op.drop_table('products')
+    op.drop_table('orders')
+    op.drop_table('favorite_exhibitors')
+    op.drop_table('exhibitor_banners')
+    op.drop_table('chat_messages')
+    op.drop_table('available_slot')
+    op.drop_table('availability_schedules')
+    op.drop_table('users')
+    op.drop_table('specializations')
+    op.drop_table('settings')
+    op.drop_table('partners')
+    op.drop_table('packages')
+    op.drop_table('gallery_ads')
+    op.drop_table('banners')
@@ -0,0 +1,51 @@
+"""add composite indexes for hot filters
+
+Revision ID: 3f1c2a9b7d10
+Revises: 0c5e8a2f4b17
+Create Date: 2026-10-16 20:45:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9b7d10'
+down_revision = '0c5e8a2f4b17'
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, columns) - keep in sync with __table_args__ in models.py
+INDEXES = [
+    ('ix_users_role_hall_active_ranking', 'users', ['role', 'gallery_hall', 'is_active', 'ranking']),
+    ('ix_users_role_created_at', 'users', ['role', 'created_at']),
+    ('ix_appointment_user_status', 'appointment', ['user_id', 'status']),
+    ('ix_appointment_exhibitor_date', 'appointment', ['exhibitor_id', 'appointment_date']),
+    ('ix_chat_messages_sender_receiver_ts', 'chat_messages', ['sender_id', 'receiver_id', 'timestamp']),
+    ('ix_chat_messages_receiver_ts', 'chat_messages', ['receiver_id', 'timestamp']),
+    ('ix_orders_created_at', 'orders', ['created_at']),
+    ('ix_orders_package_id', 'orders', ['package_id']),
+    ('ix_visits_timestamp_visitor', 'visits', ['timestamp', 'visitor_id']),
+    ('ix_visits_visitor_id', 'visits', ['visitor_id']),
+    ('ix_availability_schedules_exhibitor_active', 'availability_schedules', ['exhibitor_id', 'is_active']),
+    ('ix_products_exhibitor_active_featured', 'products', ['exhibitor_id', 'is_active', 'is_featured']),
+    ('ix_products_homepage_active', 'products', ['is_homepage_featured', 'is_active']),
+    ('ix_exhibitor_analytics_exhibitor_action_user', 'exhibitor_analytics', ['exhibitor_id', 'action_type', 'user_id']),
+    ('ix_exhibitor_analytics_user_action', 'exhibitor_analytics', ['user_id', 'action_type', 'exhibitor_id']),
+    ('ix_bookings_exhibitor_date_status', 'bookings', ['exhibitor_id', 'booking_date', 'status']),
+    ('ix_videos_exhibitor_active', 'videos', ['exhibitor_id', 'is_active']),
+    ('ix_exhibitor_banners_exhibitor_active', 'exhibitor_banners', ['exhibitor_id', 'is_active', 'display_order']),
+]
+
+
+def upgrade():
+    # Tables may already carry these indexes when they were created by
+    # db.create_all() after the models declared them
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
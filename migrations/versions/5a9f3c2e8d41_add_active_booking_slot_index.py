@@ -0,0 +1,40 @@
+"""add partial unique index on active booking slots
+
+Revision ID: 5a9f3c2e8d41
+Revises: c4e7a1d9b352
+Create Date: 2026-10-16 23:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a9f3c2e8d41'
+down_revision = 'c4e7a1d9b352'
+branch_labels = None
+depends_on = None
+
+ACTIVE = "status IN ('pending', 'confirmed')"
+
+
+def upgrade():
+    # Double bookings made before the index existed - the earliest booking keeps the slot
+    op.execute(sa.text(f"""
+        UPDATE bookings SET status = 'cancelled'
+        WHERE {ACTIVE} AND EXISTS (
+            SELECT 1 FROM bookings AS earlier
+            WHERE earlier.exhibitor_id = bookings.exhibitor_id
+              AND earlier.booking_date = bookings.booking_date
+              AND earlier.start_time = bookings.start_time
+              AND earlier.{ACTIVE}
+              AND earlier.id < bookings.id
+        )
+    """))
+    op.create_index('uq_bookings_active_slot', 'bookings', ['exhibitor_id', 'booking_date', 'start_time'],
+                    unique=True, sqlite_where=sa.text(ACTIVE), postgresql_where=sa.text(ACTIVE),
+                    if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('uq_bookings_active_slot', table_name='bookings')
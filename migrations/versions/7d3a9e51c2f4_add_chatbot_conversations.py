@@ -0,0 +1,34 @@
+"""track chatbot conversations on chat_messages
+
+Revision ID: 7d3a9e51c2f4
+Revises: e2b86d417c0a
+Create Date: 2026-10-17 01:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3a9e51c2f4'
+down_revision = 'e2b86d417c0a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('chat_messages')}
+    # Chatbot messages have no sender (bot replies) or no receiver (questions to the bot)
+    with op.batch_alter_table('chat_messages') as batch_op:
+        if 'conversation_id' not in columns:
+            batch_op.add_column(sa.Column('conversation_id', sa.String(length=100), nullable=True))
+        batch_op.alter_column('sender_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.alter_column('receiver_id', existing_type=sa.Integer(), nullable=True)
+
+
+def downgrade():
+    op.execute(sa.text("DELETE FROM chat_messages WHERE sender_id IS NULL OR receiver_id IS NULL"))
+    with op.batch_alter_table('chat_messages') as batch_op:
+        batch_op.alter_column('receiver_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('sender_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.drop_column('conversation_id')
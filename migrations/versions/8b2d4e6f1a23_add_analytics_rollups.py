@@ -0,0 +1,79 @@
+"""add analytics rollup tables
+
+Revision ID: 8b2d4e6f1a23
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-16 22:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2d4e6f1a23'
+down_revision = '3f1c2a9b7d10'
+branch_labels = None
+depends_on = None
+
+
+def _create_table(name, *columns, **kw):
+    """op.create_table, skipped when db.create_all() at startup already made the table"""
+    if name not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(name, *columns, **kw)
+
+
+def upgrade():
+    _create_table('daily_exhibitor_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exhibitor_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('action_type', sa.String(length=50), nullable=True),
+        sa.Column('events', sa.Integer(), nullable=True),
+        sa.Column('unique_visitors', sa.Integer(), nullable=True),
+        sa.Column('duration_sum', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['exhibitor_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('exhibitor_id', 'day', 'action_type', name='uq_daily_exhibitor_stats_bucket')
+    )
+    op.create_index('ix_daily_exhibitor_stats_day', 'daily_exhibitor_stats', ['day'], if_not_exists=True)
+    _create_table('hourly_visit_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('hour', sa.DateTime(), nullable=False),
+        sa.Column('visits', sa.Integer(), nullable=True),
+        sa.Column('unique_visitors', sa.Integer(), nullable=True),
+        sa.Column('new_visitors', sa.Integer(), nullable=True),
+        sa.Column('duration_sum', sa.Integer(), nullable=True),
+        sa.Column('bounced_visits', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('hour')
+    )
+    _create_table('visitor_stats',
+        sa.Column('visitor_id', sa.String(length=50), nullable=False),
+        sa.Column('first_seen', sa.DateTime(), nullable=False),
+        sa.Column('last_seen', sa.DateTime(), nullable=False),
+        sa.Column('visits', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('visitor_id')
+    )
+    op.create_index('ix_visitor_stats_visits', 'visitor_stats', ['visits'], if_not_exists=True)
+    _create_table('rollup_checkpoints',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('compacted_until', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+    # Raw range scans for compaction and the per-exhibitor tail
+    op.create_index('ix_exhibitor_analytics_exhibitor_created', 'exhibitor_analytics',
+                    ['exhibitor_id', 'created_at'], if_not_exists=True)
+    op.create_index('ix_exhibitor_analytics_created_at', 'exhibitor_analytics',
+                    ['created_at'], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_exhibitor_analytics_created_at', table_name='exhibitor_analytics', if_exists=True)
+    op.drop_index('ix_exhibitor_analytics_exhibitor_created', table_name='exhibitor_analytics', if_exists=True)
+    op.drop_table('rollup_checkpoints')
+    op.drop_index('ix_visitor_stats_visits', table_name='visitor_stats')
+    op.drop_table('visitor_stats')
+    op.drop_table('hourly_visit_stats')
+    op.drop_index('ix_daily_exhibitor_stats_day', table_name='daily_exhibitor_stats')
+    op.drop_table('daily_exhibitor_stats')
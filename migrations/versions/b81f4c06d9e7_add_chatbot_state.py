@@ -0,0 +1,38 @@
+"""add chatbot_state table
+
+Revision ID: b81f4c06d9e7
+Revises: 7d3a9e51c2f4
+Create Date: 2026-10-17 01:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81f4c06d9e7'
+down_revision = '7d3a9e51c2f4'
+branch_labels = None
+depends_on = None
+
+
+def _create_table(name, *columns, **kw):
+    """op.create_table, skipped when db.create_all() at startup already made the table"""
+    if name not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(name, *columns, **kw)
+
+
+def upgrade():
+    _create_table('chatbot_state',
+        sa.Column('namespace', sa.String(length=50), nullable=False),
+        sa.Column('key', sa.String(length=200), nullable=False),
+        sa.Column('value', sa.Text(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('namespace', 'key')
+    )
+    op.create_index('ix_chatbot_state_expires_at', 'chatbot_state', ['expires_at'], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_chatbot_state_expires_at', table_name='chatbot_state')
+    op.drop_table('chatbot_state')
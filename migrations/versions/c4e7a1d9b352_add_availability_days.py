@@ -0,0 +1,47 @@
+"""add materialized availability calendar
+
+Revision ID: c4e7a1d9b352
+Revises: 8b2d4e6f1a23
+Create Date: 2026-10-16 23:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e7a1d9b352'
+down_revision = '8b2d4e6f1a23'
+branch_labels = None
+depends_on = None
+
+
+def _create_table(name, *columns, **kw):
+    """op.create_table, skipped when db.create_all() at startup already made the table"""
+    if name not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(name, *columns, **kw)
+
+
+def upgrade():
+    # Rows are built on first read, nothing to backfill
+    _create_table('availability_days',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exhibitor_id', sa.Integer(), nullable=False),
+        sa.Column('schedule_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('first_slot', sa.Integer(), nullable=False),
+        sa.Column('session_duration', sa.Integer(), nullable=False),
+        sa.Column('slot_count', sa.Integer(), nullable=False),
+        sa.Column('free_slots', sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(['exhibitor_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['schedule_id'], ['availability_schedules.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('schedule_id', 'day', name='uq_availability_days_schedule_day')
+    )
+    op.create_index('ix_availability_days_exhibitor_day', 'availability_days', ['exhibitor_id', 'day'],
+                    if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_availability_days_exhibitor_day', table_name='availability_days')
+    op.drop_table('availability_days')
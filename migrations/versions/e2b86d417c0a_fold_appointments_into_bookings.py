@@ -0,0 +1,145 @@
+"""fold available_slot/appointment into availability_schedules/bookings
+
+Revision ID: e2b86d417c0a
+Revises: 5a9f3c2e8d41
+Create Date: 2026-10-17 00:20:00.000000
+
+"""
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b86d417c0a'
+down_revision = '5a9f3c2e8d41'
+branch_labels = None
+depends_on = None
+
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+# Appointment.status -> Booking.status
+STATUS_MAP = {'scheduled': 'confirmed', 'completed': 'completed', 'cancelled': 'cancelled'}
+
+available_slot = sa.table('available_slot',
+    sa.column('id', sa.Integer), sa.column('exhibitor_id', sa.Integer),
+    sa.column('start_time', sa.DateTime), sa.column('end_time', sa.DateTime),
+    sa.column('duration_minutes', sa.Integer), sa.column('is_available', sa.Boolean),
+    sa.column('created_at', sa.DateTime))
+appointment = sa.table('appointment',
+    sa.column('id', sa.Integer), sa.column('user_id', sa.Integer), sa.column('exhibitor_id', sa.Integer),
+    sa.column('slot_id', sa.Integer), sa.column('appointment_date', sa.DateTime),
+    sa.column('duration_minutes', sa.Integer), sa.column('status', sa.String),
+    sa.column('notes', sa.Text), sa.column('created_at', sa.DateTime))
+# A Table rather than sa.table() - inserted_primary_key needs the primary key
+schedules = sa.Table('availability_schedules', sa.MetaData(),
+    sa.Column('id', sa.Integer, primary_key=True), sa.Column('exhibitor_id', sa.Integer),
+    sa.Column('day_of_week', sa.Integer), sa.Column('on_date', sa.Date), sa.Column('start_time', sa.Time),
+    sa.Column('end_time', sa.Time), sa.Column('session_duration', sa.Integer), sa.Column('is_active', sa.Boolean),
+    sa.Column('created_at', sa.DateTime), sa.Column('updated_at', sa.DateTime))
+bookings = sa.table('bookings',
+    sa.column('id', sa.Integer), sa.column('user_id', sa.Integer), sa.column('exhibitor_id', sa.Integer),
+    sa.column('schedule_id', sa.Integer), sa.column('booking_date', sa.Date),
+    sa.column('start_time', sa.Time), sa.column('end_time', sa.Time), sa.column('notes', sa.Text),
+    sa.column('status', sa.String), sa.column('created_at', sa.DateTime), sa.column('updated_at', sa.DateTime))
+
+
+def upgrade():
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    # db.create_all() at startup used to give databases the new schema without this revision
+    if 'on_date' not in {column['name'] for column in inspector.get_columns('availability_schedules')}:
+        op.add_column('availability_schedules', sa.Column('on_date', sa.Date(), nullable=True))
+    op.create_index('ix_bookings_user_status', 'bookings', ['user_id', 'status'], if_not_exists=True)
+    if not {'available_slot', 'appointment'} <= set(inspector.get_table_names()):
+        return
+
+    now = datetime.now()
+
+    # Every AvailableSlot becomes a one-off schedule on its date
+    slot_schedules = {}
+    for slot in connection.execute(sa.select(available_slot).order_by(available_slot.c.id)):
+        duration = slot.duration_minutes or int((slot.end_time - slot.start_time).total_seconds() // 60) or 30
+        slot_schedules[slot.id] = connection.execute(schedules.insert().values(
+            exhibitor_id=slot.exhibitor_id,
+            day_of_week=slot.start_time.weekday(),
+            on_date=slot.start_time.date(),
+            start_time=slot.start_time.time(),
+            end_time=slot.end_time.time(),
+            session_duration=duration,
+            is_active=bool(slot.is_available),
+            created_at=slot.created_at or now,
+            updated_at=now,
+        )).inserted_primary_key[0]
+
+    # Every Appointment becomes a Booking on that schedule
+    taken = {
+        (row.exhibitor_id, row.booking_date, row.start_time)
+        for row in connection.execute(
+            sa.select(bookings.c.exhibitor_id, bookings.c.booking_date, bookings.c.start_time)
+            .where(bookings.c.status.in_(ACTIVE_STATUSES)))
+    }
+    for item in connection.execute(sa.select(appointment).order_by(appointment.c.id)):
+        schedule_id = slot_schedules.get(item.slot_id)
+        if schedule_id is None:
+            continue
+        start = item.appointment_date
+        status = STATUS_MAP.get(item.status, 'confirmed')
+        key = (item.exhibitor_id, start.date(), start.time())
+        if status in ACTIVE_STATUSES:
+            # uq_bookings_active_slot - the earlier booking keeps the slot
+            if key in taken:
+                status = 'cancelled'
+            taken.add(key)
+        connection.execute(bookings.insert().values(
+            user_id=item.user_id,
+            exhibitor_id=item.exhibitor_id,
+            schedule_id=schedule_id,
+            booking_date=start.date(),
+            start_time=start.time(),
+            end_time=(start + timedelta(minutes=item.duration_minutes or 30)).time(),
+            notes=item.notes,
+            status=status,
+            created_at=item.created_at or now,
+            updated_at=now,
+        ))
+
+    op.drop_index('ix_appointment_exhibitor_date', table_name='appointment', if_exists=True)
+    op.drop_index('ix_appointment_user_status', table_name='appointment', if_exists=True)
+    op.drop_table('appointment')
+    op.drop_table('available_slot')
+
+
+def downgrade():
+    # Folded rows stay in availability_schedules/bookings - only the empty tables come back
+    op.create_table('available_slot',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exhibitor_id', sa.Integer(), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('end_time', sa.DateTime(), nullable=False),
+        sa.Column('duration_minutes', sa.Integer(), nullable=True),
+        sa.Column('is_available', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['exhibitor_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('appointment',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('exhibitor_id', sa.Integer(), nullable=False),
+        sa.Column('slot_id', sa.Integer(), nullable=False),
+        sa.Column('appointment_date', sa.DateTime(), nullable=False),
+        sa.Column('duration_minutes', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('notes', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['exhibitor_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['slot_id'], ['available_slot.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_appointment_user_status', 'appointment', ['user_id', 'status'])
+    op.create_index('ix_appointment_exhibitor_date', 'appointment', ['exhibitor_id', 'appointment_date'])
+    op.drop_index('ix_bookings_user_status', table_name='bookings')
+    op.drop_column('availability_schedules', 'on_date')
@@ -2,7 +2,7 @@ from datetime import datetime, timedelta
 from extensions import db
 from flask_dance.consumer.storage.sqla import OAuthConsumerMixin
 from flask_login import UserMixin
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import UniqueConstraint, text
 
 # Partner model for sponsors/partners display on landing page
 class Partner(db.Model):
@@ -31,6 +31,10 @@ class Video(db.Model):
     # Add relationship to exhibitor (User with role='exhibitor')
     exhibitor = db.relationship('User', backref=db.backref('videos', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_videos_exhibitor_active', 'exhibitor_id', 'is_active'),
+    )
+
 # Package model for subscription packages
 class Package(db.Model):
     __tablename__ = 'packages'
@@ -95,44 +99,20 @@ class User(UserMixin, db.Model):
     orders = db.relationship('Order', backref='user')
     visits = db.relationship('Visit', backref='user')
 
-# Available Slots for appointments
-class AvailableSlot(db.Model):
-    __tablename__ = 'available_slot'
-    id = db.Column(db.Integer, primary_key=True)
-    exhibitor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False)
-    end_time = db.Column(db.DateTime, nullable=False)
-    duration_minutes = db.Column(db.Integer, default=30)
-    is_available = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.now)
-    
-    # Relationship
-    exhibitor = db.relationship('User', backref='available_slots')
-
-# Appointment model for meetings between users and exhibitors
-class Appointment(db.Model):
-    __tablename__ = 'appointment'
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    exhibitor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    slot_id = db.Column(db.Integer, db.ForeignKey('available_slot.id'), nullable=False)
-    appointment_date = db.Column(db.DateTime, nullable=False)
-    duration_minutes = db.Column(db.Integer, default=30)
-    status = db.Column(db.String(20), default='scheduled')  # scheduled, completed, cancelled
-    notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.now)
-    
-    # Relationships
-    exhibitor = db.relationship('User', foreign_keys=[exhibitor_id], backref='exhibitor_appointments')
-    user = db.relationship('User', foreign_keys=[user_id], backref='user_appointments')
-    slot = db.relationship('AvailableSlot', backref='appointments')
+    __table_args__ = (
+        # Gallery halls, hall counters and the admin exhibitor list
+        db.Index('ix_users_role_hall_active_ranking', 'role', 'gallery_hall', 'is_active', 'ranking'),
+        db.Index('ix_users_role_created_at', 'role', 'created_at'),
+    )
 
 # Chat Message model
 class ChatMessage(db.Model):
     __tablename__ = 'chat_messages'
     id = db.Column(db.Integer, primary_key=True)
-    sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    receiver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # Chatbot messages leave the bot side NULL (see chatbot_routes.bot_messages)
+    sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    receiver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    conversation_id = db.Column(db.String(100), nullable=True)  # Chatbot conversation of the message
     message = db.Column(db.Text, nullable=False)  # Standardized field name for message content
     timestamp = db.Column(db.DateTime, default=datetime.now)
     is_read = db.Column(db.Boolean, default=False)
@@ -140,12 +120,29 @@ class ChatMessage(db.Model):
     # Relationships
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref='received_messages')
+
+    __table_args__ = (
+        db.Index('ix_chat_messages_sender_receiver_ts', 'sender_id', 'receiver_id', 'timestamp'),
+        db.Index('ix_chat_messages_receiver_ts', 'receiver_id', 'timestamp'),
+    )
     
     @property
     def chat_room(self):
         """Generate consistent chat room identifier from sender and receiver IDs"""
         return f"chat_{min(self.sender_id, self.receiver_id)}_{max(self.sender_id, self.receiver_id)}"
 
+# Chatbot session state shared by every worker (see state_store.py)
+class ChatbotState(db.Model):
+    __tablename__ = 'chatbot_state'
+    namespace = db.Column(db.String(50), primary_key=True)
+    key = db.Column(db.String(200), primary_key=True)
+    value = db.Column(db.Text, nullable=False)  # JSON document
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_chatbot_state_expires_at', 'expires_at'),
+    )
+
 # Order model for tracking sales
 class Order(db.Model):
     __tablename__ = 'orders'
@@ -162,6 +159,11 @@ class Order(db.Model):
     # Relationship
     package = db.relationship('Package', backref='orders')
 
+    __table_args__ = (
+        db.Index('ix_orders_created_at', 'created_at'),
+        db.Index('ix_orders_package_id', 'package_id'),
+    )
+
 # Visit model for tracking visitor statistics
 class Settings(db.Model):
     __tablename__ = 'settings'
@@ -179,12 +181,18 @@ class Visit(db.Model):
     page_views = db.Column(db.Integer, default=1)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # Optional link to user
 
+    __table_args__ = (
+        db.Index('ix_visits_timestamp_visitor', 'timestamp', 'visitor_id'),
+        db.Index('ix_visits_visitor_id', 'visitor_id'),
+    )
+
 # Model for Exhibitor's availability schedule
 class AvailabilitySchedule(db.Model):
     __tablename__ = 'availability_schedules'
     id = db.Column(db.Integer, primary_key=True)
     exhibitor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     day_of_week = db.Column(db.Integer, nullable=False)  # 0=Monday, 6=Sunday
+    on_date = db.Column(db.Date, nullable=True)  # one-off window on this date only, NULL repeats weekly
     start_time = db.Column(db.Time, nullable=False)
     end_time = db.Column(db.Time, nullable=False)
     session_duration = db.Column(db.Integer, nullable=False)  # Duration in minutes
@@ -192,9 +200,19 @@ class AvailabilitySchedule(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__ = (
+        db.Index('ix_availability_schedules_exhibitor_active', 'exhibitor_id', 'is_active'),
+    )
+
+    def runs_on(self, date):
+        """True if the schedule has sessions on the given date"""
+        if self.on_date is not None:
+            return date == self.on_date
+        return date.weekday() == self.day_of_week
+
     def get_available_slots(self, date):
         """Returns available time slots for the given date"""
-        if date.weekday() != self.day_of_week:
+        if not self.runs_on(date):
             return []
         
         slots = []
@@ -211,6 +229,24 @@ class AvailabilitySchedule(db.Model):
             current_time = slot_end
         return slots
 
+# Materialized free slots of one schedule on one day - maintained by availability_calendar.py
+# التقويم المحسوب مسبقاً للمواعيد المتاحة
+class AvailabilityDay(db.Model):
+    __tablename__ = 'availability_days'
+    id = db.Column(db.Integer, primary_key=True)
+    exhibitor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    schedule_id = db.Column(db.Integer, db.ForeignKey('availability_schedules.id', ondelete='CASCADE'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    first_slot = db.Column(db.Integer, nullable=False)  # start of slot 0 in minutes after midnight
+    session_duration = db.Column(db.Integer, nullable=False)  # minutes, copied from the schedule
+    slot_count = db.Column(db.Integer, nullable=False)
+    free_slots = db.Column(db.LargeBinary, nullable=False)  # bit k set = slot k is free
+
+    __table_args__ = (
+        UniqueConstraint('schedule_id', 'day', name='uq_availability_days_schedule_day'),
+        db.Index('ix_availability_days_exhibitor_day', 'exhibitor_id', 'day'),
+    )
+
 # Banner model for homepage sliders with multilingual support
 class Banner(db.Model):
     __tablename__ = 'banners'
@@ -273,6 +309,11 @@ class Product(db.Model):
     # Relationship to exhibitor (User with role='exhibitor')
     exhibitor = db.relationship('User', backref=db.backref('products', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_products_exhibitor_active_featured', 'exhibitor_id', 'is_active', 'is_featured'),
+        db.Index('ix_products_homepage_active', 'is_homepage_featured', 'is_active'),
+    )
+
 # Favorite Exhibitors
 class FavoriteExhibitor(db.Model):
     __tablename__ = 'favorite_exhibitors'
@@ -313,7 +354,16 @@ class ExhibitorAnalytics(db.Model):
     visitor = db.relationship('User', foreign_keys=[user_id], backref='analytics_actions')
     product = db.relationship('Product', backref='analytics')
 
+    __table_args__ = (
+        db.Index('ix_exhibitor_analytics_exhibitor_action_user', 'exhibitor_id', 'action_type', 'user_id'),
+        db.Index('ix_exhibitor_analytics_user_action', 'user_id', 'action_type', 'exhibitor_id'),
+        db.Index('ix_exhibitor_analytics_exhibitor_created', 'exhibitor_id', 'created_at'),
+        db.Index('ix_exhibitor_analytics_created_at', 'created_at'),
+    )
+
 # Booking model for appointments
+BOOKING_ACTIVE_STATUSES = ('pending', 'confirmed')  # bookings holding their slot
+
 class Booking(db.Model):
     __tablename__ = 'bookings'
     id = db.Column(db.Integer, primary_key=True)
@@ -333,6 +383,16 @@ class Booking(db.Model):
     exhibitor = db.relationship('User', foreign_keys=[exhibitor_id], backref='bookings_received')
     schedule = db.relationship('AvailabilitySchedule', backref='bookings')
 
+    __table_args__ = (
+        db.Index('ix_bookings_exhibitor_date_status', 'exhibitor_id', 'booking_date', 'status'),
+        # Visitor's meetings - my_box counter and the profile's "your bookings"
+        db.Index('ix_bookings_user_status', 'user_id', 'status'),
+        # One active booking per slot - a second INSERT fails instead of racing a SELECT
+        db.Index('uq_bookings_active_slot', 'exhibitor_id', 'booking_date', 'start_time', unique=True,
+                 sqlite_where=text("status IN ('pending', 'confirmed')"),
+                 postgresql_where=text("status IN ('pending', 'confirmed')")),
+    )
+
 # Exhibitor Banners
 class ExhibitorBanner(db.Model):
     __tablename__ = 'exhibitor_banners'
@@ -348,6 +408,10 @@ class ExhibitorBanner(db.Model):
     # Relationship
     exhibitor = db.relationship('User', backref=db.backref('banners', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_exhibitor_banners_exhibitor_active', 'exhibitor_id', 'is_active', 'display_order'),
+    )
+
 # Gallery Advertisements
 class GalleryAd(db.Model):
     __tablename__ = 'gallery_ads'
@@ -359,4 +423,49 @@ class GalleryAd(db.Model):
     hall = db.Column(db.String(20), default='hall1')
     is_active = db.Column(db.Boolean, default=True)
     display_order = db.Column(db.Integer, default=1)
-    created_at = db.Column(db.DateTime, default=datetime.now)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+# Pre-aggregated analytics - filled by analytics_rollup.compact_analytics()
+# الإحصائيات المجمعة مسبقاً لتسريع لوحات التحكم
+class DailyExhibitorStats(db.Model):
+    __tablename__ = 'daily_exhibitor_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    exhibitor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    action_type = db.Column(db.String(50))  # same values as ExhibitorAnalytics.action_type
+    events = db.Column(db.Integer, default=0)
+    unique_visitors = db.Column(db.Integer, default=0)  # distinct user_id that day - do not sum over days
+    duration_sum = db.Column(db.Integer, default=0)  # sum of session_duration in seconds
+
+    __table_args__ = (
+        UniqueConstraint('exhibitor_id', 'day', 'action_type', name='uq_daily_exhibitor_stats_bucket'),
+        db.Index('ix_daily_exhibitor_stats_day', 'day'),
+    )
+
+class HourlyVisitStats(db.Model):
+    __tablename__ = 'hourly_visit_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    hour = db.Column(db.DateTime, nullable=False, unique=True)  # start of the hour
+    visits = db.Column(db.Integer, default=0)
+    unique_visitors = db.Column(db.Integer, default=0)  # distinct visitor_id in that hour - do not sum over hours
+    new_visitors = db.Column(db.Integer, default=0)  # visitors whose first visit is in that hour
+    duration_sum = db.Column(db.Integer, default=0)  # in seconds
+    bounced_visits = db.Column(db.Integer, default=0)  # visits shorter than 30 seconds
+
+class VisitorStats(db.Model):
+    __tablename__ = 'visitor_stats'
+    visitor_id = db.Column(db.String(50), primary_key=True)
+    first_seen = db.Column(db.DateTime, nullable=False)
+    last_seen = db.Column(db.DateTime, nullable=False)
+    visits = db.Column(db.Integer, default=0)
+
+    __table_args__ = (
+        db.Index('ix_visitor_stats_visits', 'visits'),
+    )
+
+# How far each raw event table has been folded into the rollups
+class RollupCheckpoint(db.Model):
+    __tablename__ = 'rollup_checkpoints'
+    name = db.Column(db.String(50), primary_key=True)
+    compacted_until = db.Column(db.DateTime, nullable=False)  # raw rows before this are in the rollups
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
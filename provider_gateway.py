@@ -0,0 +1,373 @@
+"""
+AI provider gateway - بوابة مزودي الذكاء الاصطناعي
+
+ChatbotManager does not call Gemini or ChatGPT directly. ProviderGateway
+runs every call as a coroutine (AIProvider.aget_response) on one background
+asyncio loop, so the Flask worker only waits for a result:
+
+- Every call has a deadline of CHATBOT_PROVIDER_TIMEOUT seconds. A call that
+  runs past it is cancelled and the visitor gets the fallback text.
+- Each provider has a CircuitBreaker. After CHATBOT_BREAKER_FAILURES failures
+  in a row it opens and calls fail fast for CHATBOT_BREAKER_RESET seconds,
+  then one trial call decides whether it closes again.
+- With CHATBOT_HEDGE_PROVIDER set, the other provider is a secondary. It is
+  called directly while the primary's breaker is open, and fired as a hedge
+  when the primary has not answered after CHATBOT_HEDGE_DELAY seconds (by
+  default the primary's running p95 latency). The first answer wins and the
+  slower call is cancelled.
+
+stream() applies the same rules to streamed answers. Each provider's
+stream_response runs in its own thread; the first provider to send a chunk
+is streamed to the end and the other one is dropped. No first chunk within
+CHATBOT_STREAM_FIRST_CHUNK_TIMEOUT seconds, or no end within the call
+deadline, counts as a timeout. A visitor who disconnects mid-answer says
+nothing about the provider, so the half-open trial is given back.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Iterator, List, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_TIMEOUT = float(os.environ.get('CHATBOT_PROVIDER_TIMEOUT', 15))
+# Seconds a streamed answer may take to send its first chunk
+STREAM_FIRST_CHUNK_TIMEOUT = float(os.environ.get('CHATBOT_STREAM_FIRST_CHUNK_TIMEOUT', 8))
+BREAKER_FAILURES = int(os.environ.get('CHATBOT_BREAKER_FAILURES', 5))
+BREAKER_RESET = float(os.environ.get('CHATBOT_BREAKER_RESET', 30))
+# Seconds, or "p95" for the primary's recent p95 latency
+HEDGE_DELAY = os.environ.get('CHATBOT_HEDGE_DELAY', 'p95')
+
+# Hedge delay until enough primary latencies were seen for a p95
+DEFAULT_HEDGE_DELAY = 2.0
+LATENCY_SAMPLES = 200
+MIN_LATENCY_SAMPLES = 20
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def provider_loop() -> asyncio.AbstractEventLoop:
+    """The event loop running provider calls, started on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='chatbot-providers', daemon=True).start()
+        return _loop
+
+
+class CircuitBreaker:
+    """closed -> open after `failures` failures in a row -> half-open after reset_after seconds"""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, reset_after: float = BREAKER_RESET):
+        self.failures = failures
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial = False
+        self.counters = {'opened': 0, 'rejected': 0}
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at < self.reset_after:
+            return 'open'
+        return 'half-open'
+
+    def allow(self) -> bool:
+        """Whether a call may go out now - half-open lets a single trial call through"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            self.counters['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._trial or self._consecutive >= self.failures:
+                if self._opened_at is None or self._trial:
+                    self.counters['opened'] += 1
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+    def stats(self) -> Dict:
+        return {'state': self.state, 'consecutive_failures': self._consecutive, **self.counters}
+
+
+class _StreamWorker:
+    """One provider's stream_response running in a thread, handing (worker, kind, value) events to a queue"""
+
+    def __init__(self, provider, user_message, conversation_history, events: queue.Queue):
+        self.provider = provider
+        self.cancelled = threading.Event()
+        threading.Thread(target=self._run, args=(user_message, conversation_history, events),
+                         name=f"chatbot-stream-{provider.__class__.__name__}", daemon=True).start()
+
+    def _run(self, user_message, conversation_history, events):
+        chunks = self.provider.stream_response(user_message, conversation_history)
+        try:
+            for chunk in chunks:
+                # A blocking provider can only be stopped between chunks
+                if self.cancelled.is_set():
+                    return
+                events.put((self, 'chunk', chunk))
+        except Exception as e:
+            events.put((self, 'error', e))
+        else:
+            events.put((self, 'done', None))
+        finally:
+            chunks.close()
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+class ProviderGateway:
+    """Deadline, circuit breaker and hedging around a primary and an optional secondary provider"""
+
+    def __init__(self, primary, secondary=None, timeout: float = PROVIDER_TIMEOUT, hedge_delay=HEDGE_DELAY,
+                 breaker_failures: int = BREAKER_FAILURES, breaker_reset: float = BREAKER_RESET,
+                 first_chunk_timeout: float = STREAM_FIRST_CHUNK_TIMEOUT):
+        self.primary = primary
+        self.secondary = secondary
+        self.timeout = timeout
+        self.first_chunk_timeout = min(first_chunk_timeout, timeout)
+        self.hedge_delay = hedge_delay
+        self.breakers = {id(primary): CircuitBreaker(breaker_failures, breaker_reset)}
+        if secondary is not None:
+            self.breakers[id(secondary)] = CircuitBreaker(breaker_failures, breaker_reset)
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.counters = {'calls': 0, 'timeouts': 0, 'errors': 0, 'short_circuits': 0,
+                         'hedges': 0, 'hedge_wins': 0, 'secondary_calls': 0}
+
+    def call(self, user_message: str, conversation_history: List[Dict] = None) -> Optional[str]:
+        """Answer from whichever provider answers first within the deadline, or None"""
+        self.counters['calls'] += 1
+        future = asyncio.run_coroutine_threadsafe(
+            self._answer(user_message, conversation_history), provider_loop())
+        try:
+            # _answer enforces the deadline itself - the margin only covers scheduling
+            return future.result(self.timeout + 1)
+        except Exception as e:
+            future.cancel()
+            logger.error(f"Provider call failed: {e.__class__.__name__}: {str(e)}")
+            return None
+
+    def stream(self, user_message: str, conversation_history: List[Dict] = None) -> Iterator[str]:
+        """Chunks of the first provider to start answering
+
+        Ends without a chunk when no provider may be called or none sent a
+        chunk in time, and raises TimeoutError when the answer that started
+        is not complete within the deadline.
+        """
+        self.counters['calls'] += 1
+        started = time.monotonic()
+        first_chunk_deadline = started + self.first_chunk_timeout
+        deadline = started + self.timeout
+        events = queue.Queue()
+        workers = []
+        settled = set()
+        winner = None
+        hedge_at = None
+
+        def start(provider):
+            workers.append(_StreamWorker(provider, user_message, conversation_history, events))
+
+        def settle(worker, success):
+            settled.add(worker)
+            if success:
+                self.breakers[id(worker.provider)].record_success()
+            else:
+                self.breakers[id(worker.provider)].record_failure()
+
+        if self.breakers[id(self.primary)].allow():
+            start(self.primary)
+            if self.secondary is not None:
+                hedge_at = started + self.current_hedge_delay()
+        elif self.secondary is not None and self.breakers[id(self.secondary)].allow():
+            self.counters['secondary_calls'] += 1
+            start(self.secondary)
+        else:
+            self.counters['short_circuits'] += 1
+            return
+
+        try:
+            while True:
+                wait_until = deadline if winner else first_chunk_deadline
+                if hedge_at is not None:
+                    wait_until = min(wait_until, hedge_at)
+                try:
+                    worker, kind, value = events.get(timeout=max(wait_until - time.monotonic(), 0))
+                except queue.Empty:
+                    if hedge_at is not None and time.monotonic() >= hedge_at and not winner:
+                        hedge_at = None
+                        if self.breakers[id(self.secondary)].allow():
+                            self.counters['hedges'] += 1
+                            start(self.secondary)
+                        continue
+                    self.counters['timeouts'] += 1
+                    for worker in workers:
+                        if worker not in settled:
+                            worker.cancel()
+                            settle(worker, success=False)
+                    if winner:
+                        raise TimeoutError(f"answer not complete within {self.timeout:g} s")
+                    logger.warning(f"No provider started answering within {self.first_chunk_timeout:g} s")
+                    return
+
+                if worker in settled:
+                    continue
+                if kind == 'chunk':
+                    if winner is None:
+                        winner, hedge_at = worker, None
+                        if worker.provider is self.secondary and len(workers) > 1:
+                            self.counters['hedge_wins'] += 1
+                        for other in workers:
+                            if other is not worker:
+                                # Lost the race - says nothing about that provider's health
+                                other.cancel()
+                                settled.add(other)
+                                self._release(other.provider)
+                    yield value
+                    continue
+
+                if kind == 'done' and winner is worker:
+                    settle(worker, success=True)
+                    return
+                # An error, or an empty answer
+                self.counters['errors'] += 1
+                settle(worker, success=False)
+                if kind == 'error':
+                    logger.error(f"Error streaming from {worker.provider.__class__.__name__}: {str(value)}")
+                if winner is worker:
+                    raise value
+                if hedge_at is not None:
+                    # The primary failed before its first chunk - the secondary takes over
+                    hedge_at = None
+                    if self.breakers[id(self.secondary)].allow():
+                        self.counters['secondary_calls'] += 1
+                        start(self.secondary)
+                if all(worker in settled for worker in workers):
+                    return
+        finally:
+            # Also runs when the visitor disconnects (GeneratorExit) - a trial call must not stay taken
+            for worker in workers:
+                if worker not in settled:
+                    worker.cancel()
+                    self._release(worker.provider)
+
+    def current_hedge_delay(self) -> float:
+        if self.hedge_delay != 'p95':
+            return float(self.hedge_delay)
+        if len(self._latencies) < MIN_LATENCY_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        latencies = sorted(self._latencies)
+        return latencies[int(len(latencies) * 0.95) - 1]
+
+    async def _answer(self, user_message, conversation_history):
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        primary_open = self.breakers[id(self.primary)].allow()
+        secondary_open = self.secondary is not None and self.breakers[id(self.secondary)].allow()
+
+        if not primary_open:
+            if not secondary_open:
+                self.counters['short_circuits'] += 1
+                return None
+            self.counters['secondary_calls'] += 1
+            return await self._attempt(self.secondary, user_message, conversation_history, deadline)
+
+        first = asyncio.ensure_future(self._attempt(self.primary, user_message, conversation_history, deadline))
+        if not secondary_open:
+            return await first
+
+        done, _ = await asyncio.wait({first}, timeout=self.current_hedge_delay())
+        if done and first.result() is not None:
+            self._release(self.secondary)
+            return first.result()
+        if done:
+            # The primary failed before the hedge delay - the secondary takes over
+            self.counters['secondary_calls'] += 1
+            return await self._attempt(self.secondary, user_message, conversation_history, deadline)
+
+        self.counters['hedges'] += 1
+        hedge = asyncio.ensure_future(self._attempt(self.secondary, user_message, conversation_history, deadline))
+        pending = {first, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.result() is not None:
+                    for other in pending:
+                        other.cancel()
+                    if task is hedge:
+                        self.counters['hedge_wins'] += 1
+                    return task.result()
+        return None
+
+    def _release(self, provider):
+        """Give back a half-open trial slot taken by allow() but not used"""
+        breaker = self.breakers[id(provider)]
+        with breaker._lock:
+            breaker._trial = False
+
+    async def _attempt(self, provider, user_message, conversation_history, deadline) -> Optional[str]:
+        breaker = self.breakers[id(provider)]
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            answer = await asyncio.wait_for(
+                provider.aget_response(user_message, conversation_history), max(deadline - started, 0))
+        except asyncio.CancelledError:
+            # Lost the hedge race - says nothing about the provider's health
+            self._release(provider)
+            raise
+        except asyncio.TimeoutError:
+            self.counters['timeouts'] += 1
+            breaker.record_failure()
+            logger.warning(f"{provider.__class__.__name__} missed the {self.timeout:g} s deadline")
+            return None
+        except Exception as e:
+            self.counters['errors'] += 1
+            breaker.record_failure()
+            logger.error(f"Error getting response from {provider.__class__.__name__}: {str(e)}")
+            return None
+
+        if not answer:
+            self.counters['errors'] += 1
+            breaker.record_failure()
+            return None
+        breaker.record_success()
+        if provider is self.primary:
+            self._latencies.append(loop.time() - started)
+        return answer
+
+    def stats(self) -> Dict:
+        providers = {'primary': (self.primary, self.breakers[id(self.primary)])}
+        if self.secondary is not None:
+            providers['secondary'] = (self.secondary, self.breakers[id(self.secondary)])
+        return {
+            **self.counters,
+            'hedge_delay': round(self.current_hedge_delay(), 3) if self.secondary is not None else None,
+            'providers': {
+                role: {'provider': provider.__class__.__name__, **breaker.stats()}
+                for role, (provider, breaker) in providers.items()
+            },
+        }
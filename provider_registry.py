@@ -0,0 +1,94 @@
+"""
+AI provider clients - عملاء مزودي الذكاء الاصطناعي
+
+Gemini and OpenAI clients are expensive to create: the SDK import, the
+genai.configure() call and a fresh HTTP/gRPC connection with its TLS
+handshake. ProviderRegistry creates each client once per process - keyed by
+provider, API key and model - and hands the same object to every caller,
+so the chatbot providers and generate_company_email() share one connection
+pool per upstream.
+
+start_warmup() builds the chatbot and opens those connections in a
+background thread when the app starts (CHATBOT_WARMUP), so the first
+visitor does not pay for them. Its progress is reported on
+/api/chatbot/health.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = 'gemini-2.0-flash'
+
+
+class ProviderRegistry:
+    """Process-wide AI clients, created on first use"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._gemini_key = None
+        self._warmup_thread = None
+        self.warmup = {'state': 'idle', 'started_at': None, 'seconds': None, 'error': None}
+
+    def _client(self, key, factory: Callable):
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = factory()
+            return client
+
+    def gemini_model(self, api_key: str, model_name: str = GEMINI_MODEL):
+        """Shared GenerativeModel for the key"""
+        def create():
+            import google.generativeai as genai
+            # genai keeps one global configuration - set it when the key changes, not per call
+            if self._gemini_key != api_key:
+                genai.configure(api_key=api_key)
+                self._gemini_key = api_key
+            return genai.GenerativeModel(model_name)
+
+        return self._client(('gemini', api_key, model_name), create)
+
+    def openai_clients(self, api_key: str):
+        """Shared (OpenAI, AsyncOpenAI) clients for the key - each keeps its own connection pool"""
+        def create():
+            from openai import AsyncOpenAI, OpenAI
+            return OpenAI(api_key=api_key), AsyncOpenAI(api_key=api_key)
+
+        return self._client(('openai', api_key), create)
+
+    def start_warmup(self, warm_up: Callable):
+        """Run warm_up() in a background thread once per process, recording its progress"""
+        with self._lock:
+            if self._warmup_thread is not None:
+                return self._warmup_thread
+            self.warmup.update(state='running', started_at=datetime.now().isoformat())
+            self._warmup_thread = threading.Thread(target=self._warm_up, args=(warm_up,),
+                                                   name='chatbot-warmup', daemon=True)
+        self._warmup_thread.start()
+        return self._warmup_thread
+
+    def _warm_up(self, warm_up: Callable):
+        started = time.monotonic()
+        try:
+            warm_up()
+        except Exception as e:
+            logger.warning(f"Chatbot warmup failed: {str(e)}")
+            self.warmup.update(state='failed', error=str(e))
+        else:
+            self.warmup['state'] = 'done'
+            logger.info(f"Chatbot warmed up in {time.monotonic() - started:.2f} s")
+        self.warmup['seconds'] = round(time.monotonic() - started, 3)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            clients = sorted(key[0] for key in self._clients)
+        return {'clients': clients, 'warmup': dict(self.warmup)}
+
+
+provider_registry = ProviderRegistry()
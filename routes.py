@@ -2,6 +2,11 @@ from flask import render_template, request, redirect, url_for, flash, jsonify, s
 from flask_login import current_user, logout_user, login_required
 from flask_socketio import emit, join_room, leave_room
 from extensions import db, socketio
+from analytics_buffer import analytics_buffer
+from database import read_only
+from gallery_cache import HALLS, gallery_cache
+import availability_calendar
+from schedule_index import schedule_indexes
 from auth import admin_required
 from app import app
 
@@ -10,12 +15,12 @@ from models import (
     User, Package, Specialization, Banner, 
     AvailabilitySchedule, Booking, FavoriteExhibitor,
     FavoriteProduct, ChatMessage, ExhibitorAnalytics,
-    GalleryAd, Product, Appointment, Video
+    GalleryAd, Product, Video
 )
 import json
 from datetime import datetime, timedelta
 import logging
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import IntegrityError, OperationalError
 from functools import wraps
 from werkzeug.utils import secure_filename
 import os
@@ -141,6 +146,21 @@ def chat_with_exhibitor(exhibitor_id):
                          current_language=session.get('language', 'ar'))
 
 # Availability Management Routes
+def schedule_window_error(exhibitor_id, day_of_week, start_time, end_time, session_duration,
+                          on_date=None, exclude_id=None):
+    """Why a schedule window cannot be saved, or None when it is valid"""
+    if end_time <= start_time:
+        return 'End time must be after start time.'
+    if session_duration <= 0:
+        return 'Session duration must be positive.'
+    overlapping = schedule_indexes.get(exhibitor_id).overlapping(
+        day_of_week, start_time, end_time, on_date=on_date, exclude_id=exclude_id)
+    if overlapping:
+        other = overlapping[0]
+        return (f"This schedule overlaps your schedule from {other.start_time.strftime('%H:%M')} "
+                f"to {other.end_time.strftime('%H:%M')}.")
+    return None
+
 @app.route('/exhibitor/schedule', methods=['GET', 'POST'])
 @login_required
 @exhibitor_required
@@ -151,21 +171,25 @@ def manage_schedule():
         end_time = datetime.strptime(request.form['end_time'], '%H:%M').time()
         session_duration = int(request.form['session_duration'])
         
-        schedule = AvailabilitySchedule(
-            exhibitor_id=current_user.id,
-            day_of_week=day_of_week,
-            start_time=start_time,
-            end_time=end_time,
-            session_duration=session_duration
-        )
-        
-        db.session.add(schedule)
-        try:
-            db.session.commit()
-            flash('Schedule added successfully!', 'success')
-        except Exception as e:
-            db.session.rollback()
-            flash('Error adding schedule. Please try again.', 'danger')
+        error = schedule_window_error(current_user.id, day_of_week, start_time, end_time, session_duration)
+        if error:
+            flash(error, 'danger')
+        else:
+            schedule = AvailabilitySchedule(
+                exhibitor_id=current_user.id,
+                day_of_week=day_of_week,
+                start_time=start_time,
+                end_time=end_time,
+                session_duration=session_duration
+            )
+            
+            db.session.add(schedule)
+            try:
+                db.session.commit()
+                flash('Schedule added successfully!', 'success')
+            except Exception as e:
+                db.session.rollback()
+                flash('Error adding schedule. Please try again.', 'danger')
             
     schedules = AvailabilitySchedule.query.filter_by(
         exhibitor_id=current_user.id,
@@ -198,9 +222,17 @@ def update_schedule(schedule_id):
     if action == 'delete':
         schedule.is_active = False
     elif action == 'update':
-        schedule.start_time = datetime.strptime(request.form['start_time'], '%H:%M').time()
-        schedule.end_time = datetime.strptime(request.form['end_time'], '%H:%M').time()
-        schedule.session_duration = int(request.form['session_duration'])
+        start_time = datetime.strptime(request.form['start_time'], '%H:%M').time()
+        end_time = datetime.strptime(request.form['end_time'], '%H:%M').time()
+        session_duration = int(request.form['session_duration'])
+        error = schedule_window_error(current_user.id, schedule.day_of_week, start_time, end_time,
+                                      session_duration, on_date=schedule.on_date, exclude_id=schedule.id)
+        if error:
+            flash(error, 'danger')
+            return redirect(url_for('manage_schedule'))
+        schedule.start_time = start_time
+        schedule.end_time = end_time
+        schedule.session_duration = session_duration
     
     try:
         db.session.commit()
@@ -271,18 +303,6 @@ def exhibitor_booking(exhibitor_id):
         end_time = datetime.combine(booking_date, start_time)
         end_time = (end_time + timedelta(minutes=schedule.session_duration)).time()
         
-        # Check if slot is available
-        existing_booking = Booking.query.filter_by(
-            exhibitor_id=exhibitor_id,
-            booking_date=booking_date,
-            start_time=start_time,
-            status='confirmed'
-        ).first()
-        
-        if existing_booking:
-            flash('This time slot is already booked.', 'danger')
-            return redirect(url_for('exhibitor.booking', exhibitor_id=exhibitor_id))
-        
         booking = Booking(
             user_id=current_user.id,
             exhibitor_id=exhibitor_id,
@@ -290,13 +310,19 @@ def exhibitor_booking(exhibitor_id):
             booking_date=booking_date,
             start_time=start_time,
             end_time=end_time,
-            notes=request.form.get('notes')
+            notes=request.form.get('notes'),
+            status='pending'
         )
         
         db.session.add(booking)
         try:
             db.session.commit()
             flash('Appointment booked successfully! Waiting for exhibitor confirmation.', 'success')
+        except IntegrityError:
+            # uq_bookings_active_slot - someone else holds this slot
+            db.session.rollback()
+            flash('This time slot is already booked.', 'danger')
+            return redirect(url_for('exhibitor.booking', exhibitor_id=exhibitor_id))
         except Exception as e:
             db.session.rollback()
             flash('Error booking appointment. Please try again.', 'danger')
@@ -620,30 +646,30 @@ with app.app_context():
 
 # Track user analytics
 def track_user_action(action_type, page_visited=None, exhibitor_id=None, product_id=None):
+    # Queued and written in batches by a background thread - no commit on the request path
     if current_user.is_authenticated and exhibitor_id is not None:
-        analytics = ExhibitorAnalytics()
-        analytics.exhibitor_id = exhibitor_id
-        analytics.user_id = current_user.id
-        analytics.action_type = action_type
-        analytics.page_visited = page_visited
-        analytics.product_id = product_id
-        db.session.add(analytics)
-        db.session.commit()
+        analytics_buffer.record(
+            exhibitor_id=exhibitor_id,
+            user_id=current_user.id,
+            action_type=action_type,
+            page_visited=page_visited,
+            product_id=product_id
+        )
 
 @app.route('/gallery')
 @login_required
+@read_only
 def gallery():
     """3D Gallery main page"""
     track_user_action('visit', 'gallery')
     
-    # Get all active exhibitors grouped by hall
+    # Get all active exhibitors grouped by hall - served from the in-memory hall snapshots
     exhibitors_by_hall = {}
-    for hall in ['hall1', 'hall2', 'hall3']:
-        exhibitors = User.query.filter_by(gallery_hall=hall, role='exhibitor', is_active=True).order_by(User.ranking).all()
-        exhibitors_by_hall[hall] = exhibitors
+    for hall in HALLS:
+        exhibitors_by_hall[hall] = gallery_cache.hall(hall).exhibitors
     
     # Get gallery advertisements
-    ads = GalleryAd.query.filter_by(is_active=True).order_by(GalleryAd.display_order).all()
+    ads = gallery_cache.ads()
     
     return render_template('gallery.html', 
                          exhibitors_by_hall=exhibitors_by_hall,
@@ -651,21 +677,32 @@ def gallery():
 
 @app.route('/gallery/<hall>')
 @login_required
+@read_only
 def gallery_hall(hall):
     """Specific gallery hall view"""
     track_user_action('visit', f'gallery_{hall}')
     
-    # Get exhibitors for this hall
-    exhibitors = User.query.filter_by(gallery_hall=hall, role='exhibitor', is_active=True).order_by(User.ranking).all()
-    
-    # Get hall-specific advertisements
-    ads = GalleryAd.query.filter_by(hall=hall, is_active=True).order_by(GalleryAd.display_order).all()
+    # Get exhibitors and hall-specific advertisements from the hall snapshot
+    snapshot = gallery_cache.hall(hall)
+    exhibitors = snapshot.exhibitors
+    ads = snapshot.ads
     
     return render_template('gallery_hall.html', 
                          exhibitors=exhibitors,
                          hall=hall,
                          ads=ads)
 
+@app.route('/api/gallery/<hall>/scene')
+@login_required
+@read_only
+def gallery_scene(hall):
+    """Compact 3D scene of a hall - the browser revalidates it with its ETag"""
+    snapshot = gallery_cache.hall(hall)
+    response = app.response_class(snapshot.scene_json(), mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
 @app.route('/exhibitor/<int:exhibitor_id>')
 @login_required
 def exhibitor_profile(exhibitor_id):
@@ -692,43 +729,14 @@ def exhibitor_profile(exhibitor_id):
         ).first()
         is_favorited = favorite is not None
     
-    # Get available schedules - use exhibitor.user_id since that's what we store in AvailabilitySchedule
-    schedules = AvailabilitySchedule.query.filter_by(
-        exhibitor_id=exhibitor.user_id,
-        is_active=True
-    ).all()
-    
-    # Get existing bookings for next 30 days
-    start_date = datetime.now().date()
-    end_date = start_date + timedelta(days=30)
-    booked_slots = Booking.query.filter(
-        Booking.exhibitor_id == exhibitor.user_id,  # Use user_id here too
-        Booking.booking_date >= start_date,
-        Booking.booking_date <= end_date,
-        Booking.status.in_(['pending', 'confirmed'])
-    ).all()
-    
     # Get other products (products from same specialization but different exhibitor)
     if exhibitor.user.specialization_id:
         other_products = Product.query.filter_by(exhibitor_id=user_id, is_active=True).all()
     else:
         other_products = []
 
-    # Calculate available slots
-    available_slots = []
-    for schedule in schedules:
-        today = datetime.now().date()
-        for i in range(30):  # Next 30 days
-            date = today + timedelta(days=i)
-            if date.weekday() == schedule.day_of_week:
-                slots = schedule.get_available_slots(date)
-                # Filter out booked slots
-                booked_times = {(b.start_time, b.end_time) for b in booked_slots if b.booking_date == date}
-                available_slots.extend([
-                    {'date': date, 'start': slot['start'], 'end': slot['end']}
-                    for slot in slots
-                    if (slot['start'], slot['end']) not in booked_times
-                ])
+    # Free slots for the next 30 days from the materialized availability calendar
+    available_slots = availability_calendar.available_slots(user_id)
 
     return render_template('exhibitor_profile.html',
                          exhibitor=exhibitor,
@@ -742,6 +750,7 @@ def exhibitor_profile(exhibitor_id):
 
 @app.route('/my-box')
 @login_required
+@read_only
 def my_box():
     """User's saved exhibitors and products"""
     # Get user's favorite exhibitors from User table with role='exhibitor'
@@ -769,9 +778,9 @@ def my_box():
     ).distinct(ExhibitorAnalytics.exhibitor_id).count()
     
     # Get scheduled meetings count
-    meetings_count = db.session.query(Appointment).filter(
-        Appointment.user_id == current_user.id,
-        Appointment.status != 'cancelled'
+    meetings_count = db.session.query(Booking).filter(
+        Booking.user_id == current_user.id,
+        Booking.status != 'cancelled'
     ).count()
     
     return render_template('my_box.html',
@@ -855,51 +864,45 @@ def book_appointment():
         # Parse date and time
         booking_date = datetime.strptime(booking_date_str, '%Y-%m-%d').date()
         start_time = datetime.strptime(start_time_str, '%H:%M').time()
-        
-        # Get schedule with locking
-        with db.session.begin():
-            schedule = AvailabilitySchedule.query.with_for_update().get(schedule_id)
-            
-            if not schedule:
-                return jsonify({'status': 'error', 'message': 'جدول المواعيد غير موجود'})
-            
-            # Calculate end time
-            end_time_dt = datetime.combine(booking_date, start_time) + timedelta(minutes=schedule.session_duration)
-            end_time = end_time_dt.time()
-            
-            # Check if slot is already booked
-            existing_booking = Booking.query.filter_by(
-                exhibitor_id=schedule.exhibitor_id,
-                booking_date=booking_date,
-                start_time=start_time,
-                status='confirmed'
-            ).first()
-            
-            if existing_booking:
-                return jsonify({'status': 'error', 'message': 'هذا الموعد محجوز مسبقاً'})
-            
-            # Create new booking
-            booking = Booking(
-                user_id=current_user.id,
-                exhibitor_id=schedule.exhibitor_id,
-                schedule_id=schedule_id,
-                booking_date=booking_date,
-                start_time=start_time,
-                end_time=end_time,
-                notes=notes
-            )
-            
-            db.session.add(booking)
-        
-        # Track appointment booking (outside transaction)
-        track_user_action('booking', 'create', exhibitor_id=schedule.exhibitor_id)
-        
-        return jsonify({'status': 'success', 'message': 'تم حجز الموعد بنجاح'})
-        
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'جميع البيانات المطلوبة غير مكتملة'})
+    
+    schedule = AvailabilitySchedule.query.get(schedule_id)
+    if not schedule or not schedule.is_active:
+        return jsonify({'status': 'error', 'message': 'جدول المواعيد غير موجود'})
+    
+    # Calculate end time
+    end_time = (datetime.combine(booking_date, start_time) + timedelta(minutes=schedule.session_duration)).time()
+    if booking_date < datetime.now().date() or \
+            not availability_calendar.is_schedule_slot(schedule, booking_date, start_time, end_time):
+        return jsonify({'status': 'error', 'message': 'هذا الموعد غير متاح'})
+    
+    # Insert straight away - the uq_bookings_active_slot index rejects a second active booking of the slot
+    booking = Booking(
+        user_id=current_user.id,
+        exhibitor_id=schedule.exhibitor_id,
+        schedule_id=schedule.id,
+        booking_date=booking_date,
+        start_time=start_time,
+        end_time=end_time,
+        notes=notes,
+        status='pending'
+    )
+    db.session.add(booking)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': 'هذا الموعد محجوز مسبقاً'})
     except Exception as e:
         db.session.rollback()
         logging.error(f"Error booking appointment: {str(e)}")
         return jsonify({'status': 'error', 'message': 'حدث خطأ في حجز الموعد'})
+    
+    # Track appointment booking (outside transaction)
+    track_user_action('booking', 'create', exhibitor_id=schedule.exhibitor_id)
+    
+    return jsonify({'status': 'success', 'message': 'تم حجز الموعد بنجاح'})
 
 # API Routes for JavaScript functionality
 
@@ -965,33 +968,15 @@ def get_available_slots(schedule_id):
         if not schedule.is_active:
             return jsonify({'status': 'error', 'message': 'هذا الجدول غير متاح حالياً'})
         
-        # Get next 30 days of available slots
-        today = datetime.now().date()
-        available_slots = []
-        
-        # Look at next 30 days
-        for i in range(30):
-            date = today + timedelta(days=i)
-            # Only check days matching the schedule's day_of_week
-            if date.weekday() == schedule.day_of_week:
-                # Get slots for this date
-                day_slots = schedule.get_available_slots(date)
-                
-                # Filter out booked slots
-                booked_times = {(b.start_time, b.end_time) for b in Booking.query.filter_by(
-                    exhibitor_id=schedule.exhibitor_id,
-                    booking_date=date,
-                    status='confirmed'
-                ).all()}
-        
-                # Add available slots that aren't booked
-                for slot in day_slots:
-                    if (slot['start'], slot['end']) not in booked_times:
-                        available_slots.append({
-                            'date': date.strftime('%Y-%m-%d'),
-                            'start': slot['start'].strftime('%H:%M'),
-                            'end': slot['end'].strftime('%H:%M')
-                        })
+        # Next 30 days of this schedule from the materialized availability calendar
+        available_slots = [
+            {
+                'date': slot['date'].strftime('%Y-%m-%d'),
+                'start': slot['start'].strftime('%H:%M'),
+                'end': slot['end'].strftime('%H:%M')
+            }
+            for slot in availability_calendar.available_slots(schedule.exhibitor_id, schedule_id=schedule.id)
+        ]
         
         return jsonify({
             'status': 'success',
@@ -1008,6 +993,95 @@ def get_available_slots(schedule_id):
         logging.error(f"Error loading available slots: {str(e)}")
         return jsonify({'status': 'error', 'message': 'حدث خطأ في تحميل المواعيد المتاحة'})
 
+@app.route('/api/next-free-slot/<int:exhibitor_id>')
+@login_required
+def get_next_free_slot(exhibitor_id):
+    """Earliest free session of an exhibitor from now (or ?after=YYYY-MM-DDTHH:MM)"""
+    try:
+        after = request.args.get('after')
+        after = max(datetime.strptime(after, '%Y-%m-%dT%H:%M'), datetime.now()) if after else datetime.now()
+        slot = schedule_indexes.get(exhibitor_id).next_free_slot(
+            after, availability_calendar.CALENDAR_DAYS,
+            lambda start, days: availability_calendar.available_slots(exhibitor_id, start, days))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'بيانات الطلب غير صحيحة'})
+    except Exception as e:
+        logging.error(f"Error finding next free slot: {str(e)}")
+        return jsonify({'status': 'error', 'message': 'حدث خطأ في تحميل المواعيد المتاحة'})
+
+    if slot is None:
+        return jsonify({'status': 'success', 'slot': None})
+    return jsonify({
+        'status': 'success',
+        'slot': {
+            'schedule_id': slot['schedule_id'],
+            'date': slot['date'].strftime('%Y-%m-%d'),
+            'start': slot['start'].strftime('%H:%M'),
+            'end': slot['end'].strftime('%H:%M')
+        }
+    })
+
+# Limits of one /api/availability request
+AVAILABILITY_MAX_EXHIBITORS = 200
+AVAILABILITY_MAX_DAYS = 60
+
+@app.route('/api/availability')
+@login_required
+def get_availability():
+    """Free slots of many exhibitors at once: ?exhibitors=1,2,3 or ?hall=hall1, optional from/to dates"""
+    try:
+        exhibitor_ids = [int(value) for value in request.args.get('exhibitors', '').split(',') if value.strip()]
+        hall = request.args.get('hall')
+        if hall:
+            exhibitor_ids.extend(exhibitor.id for exhibitor in gallery_cache.hall(hall).exhibitors)
+        exhibitor_ids = list(dict.fromkeys(exhibitor_ids))
+
+        today = datetime.now().date()
+        date_from = request.args.get('from')
+        date_to = request.args.get('to')
+        start = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else today
+        end = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to \
+            else start + timedelta(days=availability_calendar.CALENDAR_DAYS - 1)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'بيانات الطلب غير صحيحة'})
+
+    if not exhibitor_ids:
+        return jsonify({'status': 'error', 'message': 'يرجى تحديد العارضين'})
+    if len(exhibitor_ids) > AVAILABILITY_MAX_EXHIBITORS:
+        return jsonify({'status': 'error', 'message': f'الحد الأقصى {AVAILABILITY_MAX_EXHIBITORS} عارض في الطلب الواحد'})
+    start = max(start, today)
+    days = (end - start).days + 1
+    if days > AVAILABILITY_MAX_DAYS:
+        return jsonify({'status': 'error', 'message': f'الحد الأقصى {AVAILABILITY_MAX_DAYS} يوماً في الطلب الواحد'})
+
+    try:
+        slots = availability_calendar.slots_by_exhibitor(exhibitor_ids, start, days) if days > 0 else {}
+    except Exception as e:
+        logging.error(f"Error loading availability: {str(e)}")
+        return jsonify({'status': 'error', 'message': 'حدث خطأ في تحميل المواعيد المتاحة'})
+
+    # Columnar rows keep the payload small for whole halls
+    return jsonify({
+        'status': 'success',
+        'from': start.strftime('%Y-%m-%d'),
+        'to': end.strftime('%Y-%m-%d'),
+        'exhibitors': exhibitor_ids,
+        'slots': {
+            'columns': ['exhibitor_id', 'schedule_id', 'date', 'start', 'end'],
+            'rows': [
+                [
+                    exhibitor_id,
+                    slot['schedule_id'],
+                    slot['date'].strftime('%Y-%m-%d'),
+                    slot['start'].strftime('%H:%M'),
+                    slot['end'].strftime('%H:%M')
+                ]
+                for exhibitor_id in exhibitor_ids
+                for slot in slots.get(exhibitor_id, ())
+            ]
+        }
+    })
+
 # Socket.IO events for chat system
 @socketio.on('join_chat')
 def on_join_chat(data):
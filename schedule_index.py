@@ -0,0 +1,243 @@
+"""
+Schedule interval index - فهرس فترات جداول المواعيد
+
+manage_schedule() and update_schedule() reject a schedule that overlaps
+another active schedule of the same exhibitor, and next_free_slot() finds
+the first bookable session after a given moment. Both work on a
+ScheduleIndex: the exhibitor's active schedules loaded with one indexed
+query and kept in one IntervalTree per weekday (weekly schedules) and per
+date (one-off schedules with on_date set). An overlap check or a "next
+window" lookup then costs O(log n + matches) instead of comparing every
+pair of schedules.
+
+Windows are half-open: a schedule ending at 12:00 does not overlap one
+starting at 12:00.
+
+Loading and indexing the schedules costs O(n log n), so the routes do not
+build an index per request: schedule_indexes keeps one per exhibitor in
+memory, built from frozen copies of the schedules. Each index is tagged
+with two version counters in the settings table (see version_counter.py):
+the exhibitor's own, bumped by every committed change to one of their
+schedules, and a global one bumped by bulk statements whose exhibitors are
+unknown. Editing one exhibitor's schedule therefore only rebuilds that
+exhibitor's index. The process that made the change sees it on its next
+lookup, the others within SCHEDULE_VERSION_CHECK_SECONDS (0, the default,
+re-reads both counters on every lookup with one indexed query). A lookup on
+a cached index costs O(log n + matches).
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import inspect
+
+from extensions import db
+from models import AvailabilitySchedule
+from version_counter import VersionCounter
+
+# Bumped by bulk statements on the schedules, which may touch any exhibitor
+VERSION_KEY = 'schedule_version'
+
+# Columns the index and its callers read - the cached copies outlive the session
+SCHEDULE_FIELDS = ('id', 'exhibitor_id', 'day_of_week', 'on_date', 'start_time', 'end_time', 'session_duration')
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+class IntervalTree:
+    """Static interval tree over half-open (start, end, value) intervals
+
+    Intervals are sorted by start and stored as an implicit balanced tree:
+    the middle of every index range is the root of that range and
+    max_end[i] holds the largest end below it, so a search skips every
+    subtree that ends before the query starts.
+    """
+
+    def __init__(self, intervals):
+        self._intervals = sorted(intervals, key=lambda interval: (interval[0], interval[1]))
+        self._max_end = [0] * len(self._intervals)
+        self._build(0, len(self._intervals) - 1)
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def _build(self, lo, hi):
+        if lo > hi:
+            return float('-inf')
+        mid = (lo + hi) // 2
+        self._max_end[mid] = max(self._intervals[mid][1], self._build(lo, mid - 1), self._build(mid + 1, hi))
+        return self._max_end[mid]
+
+    def overlapping(self, start, end):
+        """Values of every interval overlapping [start, end), ordered by start"""
+        found = []
+        self._overlapping(0, len(self._intervals) - 1, start, end, found)
+        return found
+
+    def _overlapping(self, lo, hi, start, end, found):
+        if lo > hi:
+            return
+        mid = (lo + hi) // 2
+        if self._max_end[mid] <= start:
+            return
+        self._overlapping(lo, mid - 1, start, end, found)
+        interval_start, interval_end, value = self._intervals[mid]
+        if interval_start >= end:
+            # Everything to the right starts even later
+            return
+        if interval_end > start:
+            found.append(value)
+        self._overlapping(mid + 1, hi, start, end, found)
+
+    def first_ending_after(self, point):
+        """Value of the earliest-starting interval that is still open after point, or None"""
+        return self._first_ending_after(0, len(self._intervals) - 1, point)
+
+    def _first_ending_after(self, lo, hi, point):
+        if lo > hi:
+            return None
+        mid = (lo + hi) // 2
+        if self._max_end[mid] <= point:
+            return None
+        found = self._first_ending_after(lo, mid - 1, point)
+        if found is not None:
+            return found
+        if self._intervals[mid][1] > point:
+            return self._intervals[mid][2]
+        return self._first_ending_after(mid + 1, hi, point)
+
+
+class ScheduleIndex:
+    """Active schedules of one exhibitor, indexed by weekday and by date"""
+
+    def __init__(self, schedules):
+        weekly = {}
+        dated = {}
+        for schedule in schedules:
+            interval = (_minutes(schedule.start_time), _minutes(schedule.end_time), schedule)
+            if schedule.on_date is not None:
+                dated.setdefault(schedule.on_date, []).append(interval)
+            else:
+                weekly.setdefault(schedule.day_of_week, []).append(interval)
+        self._weekly = {day: IntervalTree(intervals) for day, intervals in weekly.items()}
+        self._dated = {day: IntervalTree(intervals) for day, intervals in dated.items()}
+
+    @classmethod
+    def for_exhibitor(cls, exhibitor_id):
+        schedules = AvailabilitySchedule.query.filter_by(exhibitor_id=exhibitor_id, is_active=True).all()
+        return cls([SimpleNamespace(**{field: getattr(schedule, field) for field in SCHEDULE_FIELDS})
+                    for schedule in schedules])
+
+    def _trees(self, day_of_week, on_date=None):
+        """Trees whose windows can fall on the same day as a weekly or one-off schedule"""
+        trees = [self._weekly.get(day_of_week)]
+        if on_date is not None:
+            trees.append(self._dated.get(on_date))
+        else:
+            # A weekly window meets every upcoming one-off window on that weekday
+            today = datetime.now().date()
+            trees.extend(tree for day, tree in self._dated.items()
+                         if day >= today and day.weekday() == day_of_week)
+        return [tree for tree in trees if tree is not None]
+
+    def overlapping(self, day_of_week, start_time, end_time, on_date=None, exclude_id=None):
+        """Active schedules sharing any minute with the given window"""
+        start, end = _minutes(start_time), _minutes(end_time)
+        found = []
+        for tree in self._trees(day_of_week, on_date):
+            found.extend(schedule for schedule in tree.overlapping(start, end) if schedule.id != exclude_id)
+        return found
+
+    def next_window(self, day, after_minutes=0):
+        """Schedule running on day that is the first one still open after after_minutes, or None"""
+        candidates = [
+            tree.first_ending_after(after_minutes)
+            for tree in (self._weekly.get(day.weekday()), self._dated.get(day))
+            if tree is not None
+        ]
+        candidates = [schedule for schedule in candidates if schedule is not None]
+        return min(candidates, key=lambda schedule: schedule.start_time, default=None)
+
+    def next_free_slot(self, after, days, free_slots):
+        """First free session starting at or after the datetime after, within days days
+
+        free_slots(start_date, days) returns the free slots of the exhibitor
+        (see availability_calendar.available_slots); it is only called from
+        the first day that has a window left.
+        """
+        for offset in range(days):
+            day = after.date() + timedelta(days=offset)
+            after_minutes = _minutes(after.time()) if offset == 0 else 0
+            if self.next_window(day, after_minutes) is None:
+                continue
+            for slot in free_slots(day, days - offset):
+                if datetime.combine(slot['date'], slot['start']) >= after:
+                    return slot
+            return None
+        return None
+
+
+def exhibitor_version_key(exhibitor_id):
+    return f"{VERSION_KEY}:{exhibitor_id}"
+
+
+class ScheduleIndexCache:
+    """ScheduleIndex per exhibitor, least recently used dropped beyond max_entries"""
+
+    def __init__(self, versions, max_entries=1000):
+        self.versions = versions
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()
+        self.counters = {'hits': 0, 'builds': 0}
+
+    def init_app(self, app):
+        self.versions.check_seconds = app.config.get('SCHEDULE_VERSION_CHECK_SECONDS', self.versions.check_seconds)
+        self.max_entries = app.config.get('SCHEDULE_INDEX_CACHE_SIZE', self.max_entries)
+        app.extensions['schedule_indexes'] = self
+
+    def get(self, exhibitor_id):
+        """ScheduleIndex of the exhibitor's active schedules at the current versions"""
+        version = self.versions.values(VERSION_KEY, exhibitor_version_key(exhibitor_id))
+        with self._lock:
+            entry = self._indexes.get(exhibitor_id)
+            if entry is not None and entry[0] == version:
+                self._indexes.move_to_end(exhibitor_id)
+                self.counters['hits'] += 1
+                return entry[1]
+        index = ScheduleIndex.for_exhibitor(exhibitor_id)
+        with self._lock:
+            self._indexes[exhibitor_id] = (version, index)
+            self._indexes.move_to_end(exhibitor_id)
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+            self.counters['builds'] += 1
+        return index
+
+    def stats(self):
+        return dict(self.counters, **self.versions.counters, indexes=len(self._indexes))
+
+
+# Version keys changed by a flush or a bulk statement
+
+def _changed_keys(session):
+    keys = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, AvailabilitySchedule):
+            continue
+        # A schedule moved to another exhibitor changes both
+        history = inspect(obj).attrs.exhibitor_id.history
+        for exhibitor_id in (obj.exhibitor_id, *history.deleted):
+            keys.add(VERSION_KEY if exhibitor_id is None else exhibitor_version_key(exhibitor_id))
+    return keys
+
+
+def _bulk_keys(mapper):
+    return (VERSION_KEY,) if issubclass(mapper.class_, AvailabilitySchedule) else ()
+
+
+schedule_indexes = ScheduleIndexCache(VersionCounter('schedules_changed', _changed_keys, _bulk_keys))
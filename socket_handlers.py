@@ -1,7 +1,10 @@
+import inspect
 from datetime import datetime
+from flask import current_app
 from flask_socketio import join_room, leave_room, emit
 from extensions import socketio, db
 from models import ChatMessage
+from chatbot_routes import handle_chat_message
 
 @socketio.on('join')
 def on_join(data):
@@ -36,4 +39,26 @@ def handle_message(data):
         'sender_id': sender_id,
         'receiver_id': receiver_id,
         'timestamp': chat_message.timestamp.strftime('%H:%M')
-    }, room=room)
\ No newline at end of file
+    }, room=room)
+
+
+@socketio.on('chatbot_message')
+def handle_chatbot_message(data):
+    """
+    Chat with the AI chatbot over Socket.IO - same payload as /api/chatbot/chat
+
+    A normal answer is pushed as 'chatbot_chunk' events ({'chunk': ...}) while
+    it is generated, then one 'chatbot_done' event with the fields /chat
+    returns. Registration, account status and email flow steps arrive as a
+    single 'chatbot_done' event carrying the /chat JSON.
+    """
+    result = handle_chat_message(data, stream=True)
+    if not inspect.isgenerator(result):
+        response = current_app.make_response(result)
+        emit('chatbot_done', {**response.get_json(), 'status_code': response.status_code})
+        return
+
+    for event in result:
+        emit('chatbot_done' if event.get('done') else 'chatbot_chunk', event)
+        # Let the async server flush the event before the next chunk
+        socketio.sleep(0)
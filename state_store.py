@@ -0,0 +1,188 @@
+"""
+Chatbot session state store - مخزن حالة جلسات الشات بوت
+
+chatbot_routes.py keeps the multi-step registration, account status and
+email flows of every chat session, plus the generated email drafts, in
+StateStore instances. Values are JSON documents; a caller reads one with
+get(), changes it and writes it back with set(). Every entry expires
+CHATBOT_STATE_TTL seconds after it was last written, so abandoned sessions
+(and crawlers) do not pile up.
+
+Two backends, chosen with CHATBOT_STATE_BACKEND:
+
+memory    per process, bounded by CHATBOT_STATE_MAX_ENTRIES per store with
+          least recently used eviction. Only correct with a single worker
+          or sticky sessions.
+database  rows of the chatbot_state table, shared by every worker process.
+          Expired rows are deleted at most every PURGE_INTERVAL seconds.
+
+stats() reports the size of every store for /api/chatbot/health.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select
+
+from database import serialized_write
+from extensions import db
+from models import ChatbotState
+
+BACKENDS = ('memory', 'database')
+
+# Seconds between deletes of expired chatbot_state rows
+PURGE_INTERVAL = 60
+
+state_table = ChatbotState.__table__
+
+
+def _dump(value):
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class MemoryBackend:
+    """Per-process TTL/LRU dict of JSON documents"""
+
+    name = 'memory'
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (expires at, JSON text), least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.counters = {'evictions': 0, 'expired': 0}
+
+    def _drop(self, key):
+        _, text = self._entries.pop(key)
+        self._bytes -= len(text)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                self._drop(key)
+                self.counters['expired'] += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, text):
+        now = time.monotonic()
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (now + self.ttl, text)
+            self._bytes += len(text)
+            # Idle entries collect at the front
+            while self._entries:
+                oldest = next(iter(self._entries))
+                if self._entries[oldest][0] > now:
+                    break
+                self._drop(oldest)
+                self.counters['expired'] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.counters['evictions'] += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def size(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, **self.counters}
+
+
+class DatabaseBackend:
+    """JSON documents in the chatbot_state table, shared by every worker"""
+
+    name = 'database'
+
+    def __init__(self, namespace, ttl):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._purged_at = 0
+        self.counters = {'purged': 0}
+
+    def _where(self, key):
+        return (state_table.c.namespace == self.namespace) & (state_table.c.key == key)
+
+    def get(self, key):
+        with db.engine.connect() as connection:
+            return connection.execute(
+                select(state_table.c.value).where(self._where(key), state_table.c.expires_at > datetime.now())
+            ).scalar()
+
+    def set(self, key, text):
+        now = datetime.now()
+        with serialized_write(), db.engine.begin() as connection:
+            connection.execute(delete(state_table).where(self._where(key)))
+            connection.execute(insert(state_table).values(
+                namespace=self.namespace, key=key, value=text, expires_at=now + timedelta(seconds=self.ttl)))
+            if time.monotonic() - self._purged_at >= PURGE_INTERVAL:
+                self._purged_at = time.monotonic()
+                self.counters['purged'] += connection.execute(
+                    delete(state_table).where(state_table.c.expires_at <= now)).rowcount
+
+    def delete(self, key):
+        with serialized_write(), db.engine.begin() as connection:
+            connection.execute(delete(state_table).where(self._where(key)))
+
+    def size(self):
+        with db.engine.connect() as connection:
+            entries, size = connection.execute(
+                select(func.count(), func.coalesce(func.sum(func.length(state_table.c.value)), 0)).where(
+                    state_table.c.namespace == self.namespace, state_table.c.expires_at > datetime.now())
+            ).one()
+        return {'entries': entries, 'bytes': int(size), **self.counters}
+
+
+class StateStore:
+    """One namespace of chatbot session state - see the module docstring"""
+
+    def __init__(self, namespace, ttl=1800, max_entries=10000):
+        self.namespace = namespace
+        self.backend = MemoryBackend(ttl, max_entries)
+        self.counters = {'hits': 0, 'misses': 0}
+
+    def init_app(self, app):
+        app.config.setdefault('CHATBOT_STATE_BACKEND', 'memory')
+        app.config.setdefault('CHATBOT_STATE_TTL', 1800)
+        app.config.setdefault('CHATBOT_STATE_MAX_ENTRIES', 10000)
+        backend = app.config['CHATBOT_STATE_BACKEND']
+        if backend not in BACKENDS:
+            raise ValueError(f"CHATBOT_STATE_BACKEND must be one of {', '.join(BACKENDS)}")
+
+        ttl = app.config['CHATBOT_STATE_TTL']
+        if backend == 'database':
+            self.backend = DatabaseBackend(self.namespace, ttl)
+        else:
+            self.backend = MemoryBackend(ttl, app.config['CHATBOT_STATE_MAX_ENTRIES'])
+        app.extensions.setdefault('chatbot_state', {})[self.namespace] = self
+
+    def get(self, key, default=None):
+        """A fresh copy of the stored value - write changes back with set()"""
+        text = self.backend.get(str(key))
+        if text is None:
+            self.counters['misses'] += 1
+            return default
+        self.counters['hits'] += 1
+        return json.loads(text)
+
+    def set(self, key, value):
+        self.backend.set(str(key), _dump(value))
+
+    def delete(self, key):
+        self.backend.delete(str(key))
+
+    def stats(self):
+        return {'backend': self.backend.name, **self.backend.size(), **self.counters}
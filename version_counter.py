@@ -0,0 +1,111 @@
+"""
+Settings-backed version counters - عدادات الإصدارات في جدول الإعدادات
+
+gallery_cache and schedule_index keep data built from the database in
+memory and tag it with version counters stored as rows of the settings
+table. A VersionCounter watches the session: every flush or bulk
+UPDATE/DELETE that changes watched rows increments the matching counters
+in the same transaction, once per transaction and key. After the commit the
+process that made the change re-reads those counters on its next lookup;
+other processes re-read a counter at most every check_seconds.
+"""
+
+import threading
+import time
+
+from sqlalchemy import Integer, String, cast, event, update
+
+from extensions import db
+from models import Settings
+
+
+class VersionCounter:
+    """Counters in the settings table, keyed by Settings.key
+
+    changed_keys(session) returns the keys changed by the pending flush and
+    bulk_keys(mapper) the keys changed by a bulk statement on that mapper.
+    """
+
+    def __init__(self, name, changed_keys, bulk_keys, check_seconds=0):
+        self.name = name
+        self.changed_keys = changed_keys
+        self.bulk_keys = bulk_keys
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._values = {}
+        self.counters = {'version_checks': 0}
+
+        event.listen(db.session, 'before_flush', self._before_flush)
+        event.listen(db.session, 'do_orm_execute', self._do_orm_execute)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', self._after_rollback)
+
+    def values(self, *keys):
+        """Current values of keys (0 when a counter does not exist yet), re-read at most every check_seconds"""
+        now = time.monotonic()
+        with self._lock:
+            cached = {key: self._values.get(key) for key in keys}
+        values = {key: entry[0] for key, entry in cached.items()
+                  if entry is not None and now - entry[1] < self.check_seconds}
+        stale = [key for key in cached if key not in values]
+        if stale:
+            rows = dict(db.session.query(Settings.key, Settings.value).filter(Settings.key.in_(stale)).all())
+            with self._lock:
+                for key in stale:
+                    values[key] = int(rows.get(key) or 0)
+                    self._values[key] = (values[key], now)
+                self.counters['version_checks'] += 1
+        return tuple(values[key] for key in keys)
+
+    def last_read(self, key):
+        """Value of key as last read, without a query - None before the first read"""
+        with self._lock:
+            value = self._values.get(key)
+        return value[0] if value else None
+
+    def invalidate(self, keys=None):
+        """Re-read keys (default: every counter) on the next lookup"""
+        with self._lock:
+            if keys is None:
+                self._values.clear()
+            for key in keys or ():
+                self._values.pop(key, None)
+
+    def bump(self, session, keys):
+        """Increment each of keys once in the session's transaction"""
+        bumped = session.info.setdefault(self.name, set())
+        with session.no_autoflush:
+            for key in keys:
+                if key in bumped:
+                    continue
+                bumped.add(key)
+                updated = session.execute(
+                    update(Settings)
+                    .where(Settings.key == key)
+                    .values(value=cast(cast(Settings.value, Integer) + 1, String))
+                ).rowcount
+                if not updated:
+                    session.add(Settings(key=key, value='1'))
+
+    def _before_flush(self, session, flush_context, instances):
+        keys = self.changed_keys(session)
+        if keys:
+            self.bump(session, keys)
+
+    def _do_orm_execute(self, orm_execute_state):
+        # Bulk query.update() / query.delete()
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            keys = self.bulk_keys(mapper)
+            if keys:
+                self.bump(orm_execute_state.session, keys)
+
+    def _after_commit(self, session):
+        keys = session.info.pop(self.name, None)
+        if keys:
+            self.invalidate(keys)
+
+    def _after_rollback(self, session):
+        session.info.pop(self.name, None)